@@ -8,9 +8,12 @@ from app.components.sidebar import sidebar
 from app.components.dashboard import dashboard_component
 from app.components.medicine import medicines_page
 from app.components.supplier import suppliers_page
-from app.states.db_state import create_tables
+from app.states.db_state import DBState
+from app.states.migrations import run_migrations
+from app.states.report_export import export_api
+from app.states.report_queries import keep_stock_snapshots_current
 
-create_tables()
+run_migrations()
 
 
 def protected_page(content: rx.Component) -> rx.Component:
@@ -101,6 +104,7 @@ def placeholder_page(title: str) -> rx.Component:
 
 app = rx.App(
     theme=rx.theme(appearance="light"),
+    api_transformer=export_api,
     head_components=[
         rx.el.link(rel="preconnect", href="https://fonts.googleapis.com"),
         rx.el.link(rel="preconnect", href="https://fonts.gstatic.com", cross_origin=""),
@@ -110,7 +114,10 @@ app = rx.App(
         ),
     ],
 )
-app.add_page(index, on_load=AuthState.on_load)
+app.register_lifespan_task(keep_stock_snapshots_current)
+app.add_page(
+    index, on_load=[AuthState.on_load, DBState.load_metrics, DBState.watch_stock]
+)
 app.add_page(login_page, route="/login")
 app.add_page(
     protected_page(medicines_page()),
@@ -149,7 +156,9 @@ from app.states.settings_state import SettingsState
 from app.components.settings import settings_page
 
 app.add_page(
-    protected_page(settings_page()), route="/settings", on_load=AuthState.on_load
+    protected_page(settings_page()),
+    route="/settings",
+    on_load=[AuthState.on_load, SettingsState.load_write_stats],
 )
 from app.states.customer_state import CustomerState
 from app.components.customer import customers_page
@@ -8,7 +8,7 @@ def medicine_search_results() -> rx.Component:
             BillingState.search_results,
             lambda med: rx.el.div(
                 rx.el.p(
-                    f"{med['name']} ({med['batch_no']}) - Stock: {med['quantity']} {med['unit'] | ''}"
+                    f"{med['name']} - Stock: {med['quantity']} {med['unit'] | ''} ({med['batch_count']} batches)"
                 ),
                 on_click=lambda: BillingState.add_to_cart(med),
                 class_name="p-2 hover:bg-gray-100 cursor-pointer rounded-md",
@@ -20,14 +20,23 @@ def medicine_search_results() -> rx.Component:
 
 def cart_item_row(item: CartItem) -> rx.Component:
     return rx.el.tr(
-        rx.el.td(f"{item['name']} ({item['batch_no']})", class_name="p-3"),
+        rx.el.td(
+            item["name"],
+            rx.cond(
+                item["batch_no"],
+                rx.el.span(
+                    f"Batch {item['batch_no']}", class_name="ml-2 text-xs text-gray-500"
+                ),
+            ),
+            class_name="p-3",
+        ),
         rx.el.td(f"{item['sale_price']:.2f}", class_name="p-3"),
         rx.el.td(
             rx.el.div(
                 rx.el.input(
                     type="number",
                     on_change=lambda val: BillingState.update_cart_quantity(
-                        item["id"], val
+                        item["key"], val
                     ),
                     class_name="w-20 p-1 border rounded-md text-center",
                     default_value=item["quantity"].to_string(),
@@ -41,7 +50,7 @@ def cart_item_row(item: CartItem) -> rx.Component:
         rx.el.td(
             rx.el.button(
                 rx.icon("trash-2", class_name="h-4 w-4"),
-                on_click=lambda: BillingState.remove_from_cart(item["id"]),
+                on_click=lambda: BillingState.remove_from_cart(item["key"]),
                 class_name="text-red-500 hover:text-red-700",
             ),
             class_name="p-3 text-center",
@@ -50,6 +59,28 @@ def cart_item_row(item: CartItem) -> rx.Component:
     )
 
 
+def scan_input() -> rx.Component:
+    return rx.el.form(
+        rx.el.div(
+            rx.el.div(
+                rx.icon("scan-barcode", class_name="h-5 w-5 text-gray-400"),
+                class_name="absolute inset-y-0 left-0 pl-3 flex items-center pointer-events-none",
+            ),
+            rx.el.input(
+                name="code",
+                placeholder="Scan barcode or batch number and press Enter...",
+                auto_focus=True,
+                auto_complete="off",
+                class_name="w-full p-3 pl-10 border rounded-lg shadow-sm focus:outline-none focus:ring-2 focus:ring-orange-500",
+            ),
+            class_name="relative w-full",
+        ),
+        on_submit=BillingState.scan_code,
+        reset_on_submit=True,
+        class_name="w-full mb-6",
+    )
+
+
 def customer_selection() -> rx.Component:
     return rx.el.div(
         rx.el.label(
@@ -174,6 +205,7 @@ def billing_page() -> rx.Component:
                     rx.cond(BillingState.search_query != "", medicine_search_results()),
                     class_name="relative w-full mb-8",
                 ),
+                scan_input(),
                 customer_selection(),
                 billing_cart(),
                 class_name="flex flex-col items-center",
@@ -68,6 +68,20 @@ def medicine_form_modal() -> rx.Component:
                                 ),
                                 class_name="col-span-1",
                             ),
+                            rx.el.div(
+                                rx.el.label(
+                                    "Barcode", class_name="text-sm font-medium"
+                                ),
+                                rx.el.input(
+                                    default_value=MedicineState.form_data.get(
+                                        "barcode", ""
+                                    ),
+                                    name="barcode",
+                                    placeholder="Optional",
+                                    class_name="mt-1 w-full p-2 border rounded-md",
+                                ),
+                                class_name="col-span-1",
+                            ),
                             rx.el.div(
                                 rx.el.label(
                                     "Expiry Date", class_name="text-sm font-medium"
@@ -185,16 +199,69 @@ def medicine_form_modal() -> rx.Component:
     )
 
 
+def sortable_header(label: str, column: str) -> rx.Component:
+    return rx.el.th(
+        rx.el.button(
+            label,
+            rx.cond(
+                MedicineState.sort_column == column,
+                rx.cond(
+                    MedicineState.sort_ascending,
+                    rx.icon("arrow-up", class_name="h-3 w-3 ml-1"),
+                    rx.icon("arrow-down", class_name="h-3 w-3 ml-1"),
+                ),
+            ),
+            on_click=lambda: MedicineState.sort_by(column),
+            class_name="flex items-center hover:text-orange-600",
+        ),
+        class_name="p-3 text-left",
+    )
+
+
+def pagination_controls() -> rx.Component:
+    return rx.el.div(
+        rx.el.p(
+            f"Showing {MedicineState.page_start}-{MedicineState.page_end} of {MedicineState.total_count}",
+            class_name="text-sm text-gray-600",
+        ),
+        rx.el.div(
+            rx.el.select(
+                rx.el.option("25 per page", value="25"),
+                rx.el.option("50 per page", value="50"),
+                rx.el.option("100 per page", value="100"),
+                default_value=MedicineState.page_size.to_string(),
+                on_change=MedicineState.set_page_size,
+                class_name="p-1 border rounded-md text-sm",
+            ),
+            rx.el.button(
+                rx.icon("chevron-left", class_name="h-4 w-4"),
+                on_click=MedicineState.prev_page,
+                disabled=MedicineState.page == 1,
+                class_name="p-1 border rounded-md disabled:opacity-40",
+            ),
+            rx.el.span(f"Page {MedicineState.page}", class_name="text-sm"),
+            rx.el.button(
+                rx.icon("chevron-right", class_name="h-4 w-4"),
+                on_click=MedicineState.next_page,
+                disabled=~MedicineState.has_next_page,
+                class_name="p-1 border rounded-md disabled:opacity-40",
+            ),
+            class_name="flex items-center gap-2",
+        ),
+        class_name="flex justify-between items-center p-3 border-t",
+    )
+
+
 def medicine_table() -> rx.Component:
     return rx.el.div(
         rx.el.table(
             rx.el.thead(
                 rx.el.tr(
-                    rx.el.th("Name", class_name="p-3 text-left"),
+                    sortable_header("Name", "name"),
                     rx.el.th("Drug Type", class_name="p-3 text-left"),
-                    rx.el.th("Batch No", class_name="p-3 text-left"),
-                    rx.el.th("Expiry Date", class_name="p-3 text-left"),
-                    rx.el.th("Quantity", class_name="p-3 text-left"),
+                    sortable_header("Batch No", "batch_no"),
+                    sortable_header("Expiry Date", "expiry_date"),
+                    sortable_header("Quantity", "quantity"),
                     rx.el.th("Unit", class_name="p-3 text-left"),
                     rx.el.th("Sale Price", class_name="p-3 text-left"),
                     rx.el.th("Supplier", class_name="p-3 text-left"),
@@ -203,7 +270,7 @@ def medicine_table() -> rx.Component:
             ),
             rx.el.tbody(
                 rx.foreach(
-                    MedicineState.filtered_medicines,
+                    MedicineState.medicines,
                     lambda med: rx.el.tr(
                         rx.el.td(med["name"], class_name="p-3"),
                         rx.el.td(med["drug_type"], class_name="p-3"),
@@ -237,6 +304,7 @@ def medicine_table() -> rx.Component:
             ),
             class_name="w-full text-sm text-gray-700",
         ),
+        pagination_controls(),
         class_name="w-full bg-white border rounded-xl shadow-sm overflow-hidden",
     )
 
@@ -290,7 +358,7 @@ def medicines_page() -> rx.Component:
             rx.el.div(
                 rx.el.input(
                     placeholder="Search by name or batch...",
-                    on_change=MedicineState.set_search_query,
+                    on_change=MedicineState.set_search.debounce(300),
                     class_name="p-2 border rounded-md w-full md:w-1/3",
                 ),
                 rx.el.button(
@@ -131,7 +131,9 @@ def prescription_form_modal() -> rx.Component:
                             rx.el.div(
                                 rx.el.input(
                                     placeholder="Search and add medicines...",
-                                    on_key_down=PrescriptionState.set_medicine_search_query,
+                                    on_change=PrescriptionState.search_medicines_for_selection.debounce(
+                                        300
+                                    ),
                                     class_name="w-full p-2 border rounded-md",
                                     default_value=PrescriptionState.medicine_search_query,
                                 ),
@@ -139,7 +141,7 @@ def prescription_form_modal() -> rx.Component:
                                     PrescriptionState.medicine_search_query != "",
                                     rx.el.div(
                                         rx.foreach(
-                                            PrescriptionState.filtered_medicines_for_selection,
+                                            PrescriptionState.medicine_search_results,
                                             lambda med: rx.el.div(
                                                 rx.el.p(
                                                     f"{med['name']} ({med['batch_no']}) - Stock: {med['quantity']}"
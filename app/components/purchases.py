@@ -1,107 +1,223 @@
 import reflex as rx
-from app.states.purchase_state import PurchaseState
+from app.states.purchase_state import PurchaseState, ReceiptLine, BatchOption
 
 
-def purchases_page() -> rx.Component:
+def receipt_header() -> rx.Component:
     return rx.el.div(
-        rx.el.h1(
-            "Record New Purchase", class_name="text-3xl font-bold text-gray-800 mb-6"
+        rx.el.div(
+            rx.el.label("Supplier", class_name="text-sm font-medium"),
+            rx.el.select(
+                rx.el.option("Select a supplier", value="", disabled=True),
+                rx.foreach(
+                    PurchaseState.suppliers,
+                    lambda s: rx.el.option(s["name"], value=s["id"].to_string()),
+                ),
+                value=PurchaseState.supplier_id,
+                on_change=PurchaseState.set_supplier_id,
+                class_name="mt-1 w-full p-2 border rounded-md",
+            ),
         ),
         rx.el.div(
-            rx.el.form(
-                rx.el.div(
-                    rx.el.div(
-                        rx.el.label("Supplier", class_name="text-sm font-medium"),
-                        rx.el.select(
-                            rx.foreach(
-                                PurchaseState.suppliers,
-                                lambda s: rx.el.option(
-                                    s["name"], value=s["id"].to_string()
-                                ),
-                            ),
-                            name="supplier_id",
-                            placeholder="Select a supplier",
-                            default_value=PurchaseState.form_data.get(
-                                "supplier_id", ""
-                            ).to_string(),
-                            class_name="mt-1 w-full p-2 border rounded-md",
-                            required=True,
-                        ),
+            rx.el.label("Purchase Date", class_name="text-sm font-medium"),
+            rx.el.input(
+                type="date",
+                value=PurchaseState.purchase_date,
+                on_change=PurchaseState.set_purchase_date,
+                class_name="mt-1 w-full p-2 border rounded-md",
+            ),
+        ),
+        class_name="grid grid-cols-1 md:grid-cols-2 gap-6 mb-6",
+    )
+
+
+def receipt_line_form() -> rx.Component:
+    return rx.el.form(
+        rx.el.div(
+            rx.el.div(
+                rx.el.label("Medicine", class_name="text-sm font-medium"),
+                rx.el.select(
+                    rx.foreach(
+                        PurchaseState.products,
+                        lambda p: rx.el.option(p["name"], value=p["id"].to_string()),
                     ),
-                    rx.el.div(
-                        rx.el.label("Medicine", class_name="text-sm font-medium"),
-                        rx.el.select(
-                            rx.foreach(
-                                PurchaseState.medicines,
-                                lambda m: rx.el.option(
-                                    m["name"], value=m["id"].to_string()
-                                ),
-                            ),
-                            name="medicine_id",
-                            placeholder="Select a medicine",
-                            on_change=lambda val: PurchaseState.set_form_data(
-                                {"medicine_id": val}
-                            ),
-                            default_value=PurchaseState.form_data.get(
-                                "medicine_id", ""
-                            ).to_string(),
-                            class_name="mt-1 w-full p-2 border rounded-md",
-                            required=True,
-                        ),
+                    name="product_id",
+                    placeholder="Select a medicine",
+                    on_change=PurchaseState.select_product,
+                    class_name="mt-1 w-full p-2 border rounded-md",
+                    required=True,
+                ),
+                class_name="flex-1",
+            ),
+            rx.el.div(
+                rx.el.label("Batch No", class_name="text-sm font-medium"),
+                rx.el.input(
+                    name="batch_no",
+                    list="receipt-batches",
+                    placeholder="Batch number",
+                    class_name="mt-1 w-full p-2 border rounded-md",
+                    required=True,
+                ),
+                rx.el.datalist(
+                    rx.foreach(
+                        PurchaseState.product_batches,
+                        lambda b: rx.el.option(value=b["batch_no"]),
                     ),
-                    rx.el.div(
-                        rx.el.label("Quantity", class_name="text-sm font-medium"),
-                        rx.el.div(
-                            rx.el.input(
-                                name="quantity",
-                                type="number",
-                                placeholder="Enter quantity",
-                                default_value=PurchaseState.form_data.get(
-                                    "quantity", ""
-                                ).to_string(),
-                                class_name="mt-1 w-full p-2 border rounded-md",
-                                required=True,
-                            ),
-                            rx.cond(
-                                PurchaseState.selected_medicine_unit != "",
-                                rx.el.span(
-                                    PurchaseState.selected_medicine_unit,
-                                    class_name="absolute right-3 top-1/2 -translate-y-1/2 mt-0.5 text-sm text-gray-500",
-                                ),
-                            ),
-                            class_name="relative",
-                        ),
+                    id="receipt-batches",
+                ),
+                class_name="w-36",
+            ),
+            rx.el.div(
+                rx.el.label("Expiry", class_name="text-sm font-medium"),
+                rx.el.input(
+                    name="expiry_date",
+                    type="date",
+                    class_name="mt-1 w-full p-2 border rounded-md",
+                    required=True,
+                ),
+                class_name="w-40",
+            ),
+            rx.el.div(
+                rx.el.label("Quantity", class_name="text-sm font-medium"),
+                rx.el.div(
+                    rx.el.input(
+                        name="quantity",
+                        type="number",
+                        placeholder="Enter quantity",
+                        class_name="mt-1 w-full p-2 border rounded-md",
+                        required=True,
                     ),
-                    rx.el.div(
-                        rx.el.label("Purchase Date", class_name="text-sm font-medium"),
-                        rx.el.input(
-                            name="purchase_date",
-                            type="date",
-                            default_value=PurchaseState.form_data.get(
-                                "purchase_date", ""
-                            ),
-                            class_name="mt-1 w-full p-2 border rounded-md",
-                            required=True,
+                    rx.cond(
+                        PurchaseState.selected_medicine_unit != "",
+                        rx.el.span(
+                            PurchaseState.selected_medicine_unit,
+                            class_name="absolute right-3 top-1/2 -translate-y-1/2 mt-0.5 text-sm text-gray-500",
                         ),
                     ),
-                    class_name="grid grid-cols-1 md:grid-cols-2 gap-6 mb-6",
+                    class_name="relative",
                 ),
-                rx.cond(
-                    PurchaseState.error_message != "",
-                    rx.el.p(
-                        PurchaseState.error_message,
-                        class_name="text-red-500 text-sm mb-4",
-                    ),
+                class_name="w-40",
+            ),
+            rx.el.button(
+                rx.icon("plus", class_name="h-4 w-4 mr-2"),
+                "Add Line",
+                type="submit",
+                class_name="flex items-center px-4 py-2 bg-gray-500 text-white rounded-md hover:bg-gray-600",
+            ),
+            class_name="flex items-end gap-4",
+        ),
+        on_submit=PurchaseState.add_line,
+        reset_on_submit=True,
+        class_name="mb-6",
+    )
+
+
+def batch_option_row(batch: BatchOption) -> rx.Component:
+    return rx.el.li(
+        f"{batch['batch_no']} - expires {batch['expiry_date']}, {batch['quantity']} in stock",
+    )
+
+
+def product_batches_hint() -> rx.Component:
+    return rx.cond(
+        PurchaseState.product_batches.length() > 0,
+        rx.el.div(
+            rx.el.p(
+                "Batches on file (a new batch number creates a new batch):",
+                class_name="font-medium",
+            ),
+            rx.el.ul(rx.foreach(PurchaseState.product_batches, batch_option_row)),
+            class_name="-mt-4 mb-6 text-xs text-gray-500",
+        ),
+    )
+
+
+def receipt_line_row(line: ReceiptLine) -> rx.Component:
+    return rx.el.tr(
+        rx.el.td(line["name"], class_name="p-3"),
+        rx.el.td(line["batch_no"], class_name="p-3"),
+        rx.el.td(line["expiry_date"], class_name="p-3"),
+        rx.el.td(line["quantity"], class_name="p-3 text-right"),
+        rx.el.td(line["unit"], class_name="p-3 text-gray-500"),
+        rx.el.td(
+            rx.el.button(
+                rx.icon("trash-2", class_name="h-4 w-4"),
+                on_click=lambda: PurchaseState.remove_line(line["key"]),
+                class_name="text-red-500 hover:text-red-700",
+            ),
+            class_name="p-3 text-center",
+        ),
+        class_name="border-b",
+    )
+
+
+def receipt_lines_table() -> rx.Component:
+    return rx.el.div(
+        rx.el.table(
+            rx.el.thead(
+                rx.el.tr(
+                    rx.el.th("Medicine", class_name="p-3 text-left"),
+                    rx.el.th("Batch", class_name="p-3 text-left"),
+                    rx.el.th("Expiry", class_name="p-3 text-left"),
+                    rx.el.th("Qty", class_name="p-3 text-right"),
+                    rx.el.th("Unit", class_name="p-3 text-left"),
+                    rx.el.th("", class_name="p-3"),
+                )
+            ),
+            rx.el.tbody(rx.foreach(PurchaseState.receipt_lines, receipt_line_row)),
+            class_name="w-full text-sm text-gray-700",
+        ),
+        rx.cond(
+            PurchaseState.receipt_lines.length() == 0,
+            rx.el.p(
+                "No lines added yet.", class_name="p-4 text-sm text-gray-500 text-center"
+            ),
+        ),
+        class_name="w-full border rounded-lg overflow-hidden mb-6",
+    )
+
+
+def purchases_page() -> rx.Component:
+    return rx.el.div(
+        rx.el.h1(
+            "Record Goods Receipt", class_name="text-3xl font-bold text-gray-800 mb-6"
+        ),
+        rx.el.div(
+            receipt_header(),
+            receipt_line_form(),
+            product_batches_hint(),
+            receipt_lines_table(),
+            rx.cond(
+                PurchaseState.error_message != "",
+                rx.el.p(
+                    PurchaseState.error_message,
+                    class_name="text-red-500 text-sm mb-4",
+                ),
+            ),
+            rx.el.div(
+                rx.el.p(
+                    PurchaseState.receipt_lines.length().to_string()
+                    + " lines, "
+                    + PurchaseState.receipt_total_quantity.to_string()
+                    + " units",
+                    class_name="text-sm text-gray-600",
                 ),
-                rx.el.button(
-                    rx.icon("save", class_name="h-4 w-4 mr-2"),
-                    "Save Purchase",
-                    type="submit",
-                    class_name="flex items-center px-6 py-2 bg-orange-500 text-white rounded-md hover:bg-orange-600",
+                rx.el.div(
+                    rx.el.button(
+                        "Clear",
+                        on_click=PurchaseState.clear_receipt,
+                        class_name="px-6 py-2 bg-gray-200 text-gray-700 rounded-md hover:bg-gray-300",
+                    ),
+                    rx.el.button(
+                        rx.icon("save", class_name="h-4 w-4 mr-2"),
+                        "Save Receipt",
+                        on_click=PurchaseState.save_receipt,
+                        class_name="flex items-center px-6 py-2 bg-orange-500 text-white rounded-md hover:bg-orange-600",
+                    ),
+                    class_name="flex items-center gap-4",
                 ),
-                on_submit=PurchaseState.handle_submit,
+                class_name="flex items-center justify-between",
             ),
-            class_name="max-w-2xl mx-auto p-8 bg-white rounded-xl shadow-lg border",
+            class_name="max-w-3xl mx-auto p-8 bg-white rounded-xl shadow-lg border",
         ),
         class_name="p-6",
-    )
\ No newline at end of file
+    )
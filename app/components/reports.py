@@ -4,6 +4,7 @@ from app.states.reports_state import ReportsState
 REPORT_TABS = {
     "sales": {"label": "Sales Report", "icon": "indian-rupee"},
     "stock": {"label": "Stock Report", "icon": "boxes"},
+    "stock_as_of": {"label": "Stock As Of", "icon": "history"},
     "expiry": {"label": "Expiry Report", "icon": "calendar-clock"},
     "low_stock": {"label": "Low Stock Report", "icon": "package-minus"},
     "supplier_purchases": {"label": "Supplier Purchases", "icon": "truck"},
@@ -62,43 +63,114 @@ def report_filters() -> rx.Component:
     )
 
 
+def report_header_cell(column: rx.Var) -> rx.Component:
+    return rx.el.th(
+        rx.el.div(
+            column.to_string().replace("_", " ").capitalize(),
+            rx.cond(
+                ReportsState.sort_column == column,
+                rx.icon(
+                    rx.cond(ReportsState.sort_descending, "arrow-down", "arrow-up"),
+                    class_name="h-3 w-3 ml-1",
+                ),
+            ),
+            class_name="flex items-center",
+        ),
+        on_click=ReportsState.sort_by(column),
+        class_name="p-3 text-left font-semibold cursor-pointer select-none bg-gray-50 sticky top-0",
+    )
+
+
+def report_row(row: rx.Var) -> rx.Component:
+    return rx.el.tr(
+        rx.foreach(
+            row.values(),
+            lambda value: rx.el.td(value.to_string(), class_name="p-3"),
+        ),
+        style={"content-visibility": "auto", "contain-intrinsic-size": "auto 45px"},
+        class_name="border-b hover:bg-gray-50",
+    )
+
+
+def report_pagination() -> rx.Component:
+    return rx.el.div(
+        rx.el.p(ReportsState.page_label, class_name="text-sm text-gray-600"),
+        rx.el.div(
+            rx.el.button(
+                rx.icon("chevron-left", class_name="h-4 w-4"),
+                on_click=ReportsState.previous_page,
+                disabled=~ReportsState.has_previous_page,
+                class_name="p-2 border rounded-md disabled:opacity-40",
+            ),
+            rx.el.button(
+                rx.icon("chevron-right", class_name="h-4 w-4"),
+                on_click=ReportsState.next_page,
+                disabled=~ReportsState.has_next_page,
+                class_name="p-2 border rounded-md disabled:opacity-40",
+            ),
+            class_name="flex gap-2",
+        ),
+        class_name="flex justify-between items-center p-3 border-t",
+    )
+
+
+def report_progress() -> rx.Component:
+    return rx.el.div(
+        rx.spinner(class_name="text-orange-500 h-8 w-8"),
+        rx.el.p(
+            rx.cond(
+                ReportsState.job_waiting,
+                "Waiting for a free report worker...",
+                rx.cond(
+                    ReportsState.rows_found > 0,
+                    "Found "
+                    + ReportsState.rows_found.to_string()
+                    + " rows, loading page...",
+                    "Counting rows...",
+                ),
+            ),
+            class_name="text-sm text-gray-600",
+        ),
+        rx.cond(
+            ReportsState.operations_done > 0,
+            rx.el.p(
+                (ReportsState.operations_done // 1000).to_string()
+                + "k database steps run",
+                class_name="text-xs text-gray-500",
+            ),
+        ),
+        rx.el.button(
+            "Cancel",
+            on_click=ReportsState.cancel_report,
+            class_name="px-4 py-2 bg-gray-200 text-gray-700 rounded-md hover:bg-gray-300",
+        ),
+        class_name="flex flex-col justify-center items-center gap-4 p-8",
+    )
+
+
 def report_table() -> rx.Component:
     return rx.el.div(
         rx.cond(
             ReportsState.loading,
-            rx.el.div(
-                rx.spinner(class_name="text-orange-500 h-8 w-8"),
-                class_name="flex justify-center items-center p-8",
-            ),
+            report_progress(),
             rx.cond(
-                ReportsState.report_data.length() > 0,
-                rx.el.table(
-                    rx.el.thead(
-                        rx.el.tr(
-                            rx.foreach(
-                                ReportsState.report_data[0].keys(),
-                                lambda key: rx.el.th(
-                                    key.to_string().replace("_", " ").capitalize(),
-                                    class_name="p-3 text-left font-semibold",
-                                ),
-                            )
-                        )
-                    ),
-                    rx.el.tbody(
-                        rx.foreach(
-                            ReportsState.report_data,
-                            lambda row: rx.el.tr(
-                                rx.foreach(
-                                    row.values(),
-                                    lambda value: rx.el.td(
-                                        value.to_string(), class_name="p-3"
-                                    ),
-                                ),
-                                class_name="border-b hover:bg-gray-50",
+                ReportsState.total_rows > 0,
+                rx.el.div(
+                    rx.el.div(
+                        rx.el.table(
+                            rx.el.thead(
+                                rx.el.tr(
+                                    rx.foreach(
+                                        ReportsState.report_columns, report_header_cell
+                                    )
+                                )
                             ),
-                        )
+                            rx.el.tbody(rx.foreach(ReportsState.report_data, report_row)),
+                            class_name="w-full text-sm text-gray-700",
+                        ),
+                        class_name="max-h-[70vh] overflow-auto",
                     ),
-                    class_name="w-full text-sm text-gray-700",
+                    report_pagination(),
                 ),
                 rx.el.div(
                     "No data available for the selected criteria.",
@@ -125,7 +197,8 @@ def reports_page() -> rx.Component:
         report_tabs(),
         rx.cond(
             ReportsState.active_report.contains("date")
-            | (ReportsState.active_report == "customer_purchases"),
+            | (ReportsState.active_report == "customer_purchases")
+            | (ReportsState.active_report == "stock_as_of"),
             report_filters(),
         ),
         report_table(),
@@ -16,6 +16,48 @@ def settings_card(
     )
 
 
+def write_stat(label: str, value: rx.Var) -> rx.Component:
+    return rx.el.div(
+        rx.el.p(label, class_name="text-xs text-gray-500"),
+        rx.el.p(value, class_name="text-lg font-semibold text-gray-800"),
+    )
+
+
+def write_queue_card() -> rx.Component:
+    stats = SettingsState.write_stats
+    return rx.el.div(
+        rx.el.div(
+            rx.el.div(
+                rx.el.h3("Write Queue", class_name="text-lg font-semibold text-gray-800"),
+                rx.el.p(
+                    "Group commits from the database writer since the server started.",
+                    class_name="text-sm text-gray-500 mt-1",
+                ),
+                class_name="flex-1",
+            ),
+            rx.el.button(
+                rx.icon("refresh-cw", class_name="h-4 w-4 mr-2"),
+                "Refresh",
+                on_click=SettingsState.load_write_stats,
+                class_name="flex items-center px-4 py-2 bg-gray-500 text-white rounded-md hover:bg-gray-600",
+            ),
+            class_name="flex items-center justify-between",
+        ),
+        rx.el.div(
+            write_stat("Queue depth", stats["queue_depth"]),
+            write_stat("Writes", stats["jobs"]),
+            write_stat("Failed writes", stats["failed_jobs"]),
+            write_stat("Commits", stats["commits"]),
+            write_stat("Avg group size", stats["avg_group_size"]),
+            write_stat("Last commit (ms)", stats["last_commit_ms"]),
+            write_stat("Avg commit (ms)", stats["avg_commit_ms"]),
+            write_stat("Max commit (ms)", stats["max_commit_ms"]),
+            class_name="grid grid-cols-2 md:grid-cols-4 gap-4 mt-4",
+        ),
+        class_name="p-6 bg-white border rounded-xl shadow-sm",
+    )
+
+
 def settings_page() -> rx.Component:
     return rx.el.div(
         rx.el.h1("Settings", class_name="text-3xl font-bold text-gray-800 mb-6"),
@@ -46,6 +88,17 @@ def settings_page() -> rx.Component:
                     accept={".db": ["application/octet-stream"]},
                 ),
             ),
+            settings_card(
+                "Dashboard Counters",
+                "Recompute the dashboard totals from the underlying tables.",
+                rx.el.button(
+                    rx.icon("refresh-cw", class_name="h-4 w-4 mr-2"),
+                    "Rebuild Counters",
+                    on_click=SettingsState.rebuild_dashboard_metrics,
+                    class_name="flex items-center px-4 py-2 bg-gray-500 text-white rounded-md hover:bg-gray-600",
+                ),
+            ),
+            write_queue_card(),
             class_name="grid grid-cols-1 gap-6",
         ),
         class_name="p-6",
@@ -17,7 +17,6 @@ class AuthState(rx.State):
         user = conn.execute(
             "SELECT * FROM users WHERE username = ?", (token,)
         ).fetchone()
-        conn.close()
         return user is not None
 
     @rx.event
@@ -40,7 +39,6 @@ class AuthState(rx.State):
             "SELECT * FROM users WHERE username = ? AND password = ?",
             (username, password),
         ).fetchone()
-        conn.close()
         if user:
             self.is_authenticated = True
             self.username = username
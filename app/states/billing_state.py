@@ -1,23 +1,32 @@
 import reflex as rx
-from typing import TypedDict, Optional
+from typing import TypedDict, Optional, Sequence
 import datetime
 import logging
-from .db_state import get_db_connection
+from .db_state import get_db_connection, db_read, publish_stock_levels
+from .medicine_search import find_medicines, warm_name_index
+from .sales import SaleLine, InsufficientStockError, commit_sale
+from .inventory import product_summaries
+from .reservations import reserved_quantities, hold_stock, release_holds
+from .write_queue import write_queue
+from .catalog import catalog_items, catalog_version
+from .stock_bus import watch_stock_levels, StockLevels
 
 
 class MedicineSearchResult(TypedDict):
     id: int
     name: str
-    batch_no: str
     sale_price: float
     quantity: int
     unit: Optional[str]
+    batch_count: int
 
 
 class CartItem(TypedDict):
+    key: str
     id: int
+    batch_id: Optional[int]
+    batch_no: Optional[str]
     name: str
-    batch_no: str
     sale_price: float
     quantity: int
     available_quantity: int
@@ -35,15 +44,69 @@ class PrescriptionSummary(TypedDict):
     display_text: str
 
 
+def _search_result_from_row(row) -> MedicineSearchResult:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "sale_price": row["sale_price"] or 0.0,
+        "quantity": row["quantity"],
+        "unit": row["unit"],
+        "batch_count": row["batch_count"],
+    }
+
+
+def _product_ids(rows) -> list[int]:
+    return list(
+        dict.fromkeys(row["product_id"] for row in rows if row["product_id"] is not None)
+    )
+
+
+def _line_key(product_id: int, batch_id: Optional[int] = None) -> str:
+    return str(product_id) if batch_id is None else f"{product_id}:{batch_id}"
+
+
+def _batch_stock(conn, batch_ids: Sequence[int]) -> dict[int, int]:
+    if not batch_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in batch_ids)
+    rows = conn.execute(
+        f"SELECT id, quantity FROM medicines WHERE id IN ({placeholders}) "
+        "AND expiry_date >= ?",
+        (*batch_ids, datetime.date.today().isoformat()),
+    )
+    stock = {row["id"]: row["quantity"] for row in rows}
+    return {batch_id: stock.get(batch_id, 0) for batch_id in batch_ids}
+
+
+def _stock_view(
+    conn, product_ids: list[int], holder: str, batch_ids: Sequence[int] = ()
+) -> tuple[dict, dict[int, int], dict[int, int]]:
+    return (
+        product_summaries(conn, product_ids),
+        reserved_quantities(conn, product_ids, holder),
+        _batch_stock(conn, batch_ids),
+    )
+
+
+SCANNED_BATCH_SELECT = """
+    SELECT id, product_id, batch_no, expiry_date, quantity, sale_price FROM medicines
+"""
+
+
 class BillingState(rx.State):
     search_query: str = ""
     search_results: list[MedicineSearchResult] = []
-    cart: dict[int, CartItem] = {}
-    customers: list[Customer] = []
+    cart: dict[str, CartItem] = {}
+    catalog_version: int = 0
     selected_customer_id: str = ""
     doctor_name: str = ""
     customer_prescriptions: list[PrescriptionSummary] = []
     selected_prescription_id: str = ""
+    _stock_watch_id: str = ""
+
+    @rx.var(deps=["catalog_version"], auto_deps=False)
+    def customers(self) -> list[Customer]:
+        return catalog_items("customers")
 
     @rx.var
     def cart_items(self) -> list[CartItem]:
@@ -53,8 +116,49 @@ class BillingState(rx.State):
     def total_amount(self) -> float:
         return sum((item["subtotal"] for item in self.cart.values()))
 
+    def _holder(self) -> str:
+        return self.router.session.client_token
+
+    def _unreserved(self, product_ids: list[int]) -> list[MedicineSearchResult]:
+        summaries, held, _ = _stock_view(
+            get_db_connection(), product_ids, self._holder()
+        )
+        results = [
+            _search_result_from_row(summaries[product_id])
+            for product_id in product_ids
+            if product_id in summaries
+        ]
+        for result in results:
+            result["quantity"] -= held.get(result["id"], 0)
+        return [result for result in results if result["quantity"] > 0]
+
+    async def _reserve(self, product_id: int, quantity: int) -> tuple[bool, int]:
+        return await write_queue.run(hold_stock, self._holder(), product_id, quantity)
+
+    def _cart_quantity(self, product_id: int, exclude_key: str = "") -> int:
+        return sum(
+            item["quantity"]
+            for key, item in self.cart.items()
+            if item["id"] == product_id and key != exclude_key
+        )
+
+    async def _hold_line(
+        self, key: str, product_id: int, batch_id: Optional[int], quantity: int
+    ) -> tuple[bool, int]:
+        limit = None
+        if batch_id is not None:
+            limit = (await db_read(_batch_stock, [batch_id]))[batch_id]
+            if quantity > limit:
+                return False, limit
+        others = self._cart_quantity(product_id, key)
+        granted, available = await self._reserve(product_id, others + quantity)
+        available = max(available - others, 0)
+        return granted, available if limit is None else min(available, limit)
+
     @rx.event
-    def on_load(self):
+    async def on_load(self):
+        warm_name_index()
+        await write_queue.run(release_holds, self._holder())
         self.search_query = ""
         self.search_results = []
         self.cart = {}
@@ -62,7 +166,76 @@ class BillingState(rx.State):
         self.doctor_name = ""
         self.customer_prescriptions = []
         self.selected_prescription_id = ""
-        return BillingState.load_customers
+        return [BillingState.load_customers, BillingState.watch_stock]
+
+    def _visible_products(self) -> list[int]:
+        return list(
+            dict.fromkeys(
+                [
+                    *(item["id"] for item in self.cart.values()),
+                    *(r["id"] for r in self.search_results),
+                ]
+            )
+        )
+
+    def _pinned_batches(self) -> list[int]:
+        return [
+            item["batch_id"] for item in self.cart.values() if item["batch_id"] is not None
+        ]
+
+    def _apply_product_stock(
+        self,
+        product_ids: list[int],
+        summaries: dict,
+        held: dict[int, int],
+        batches: dict[int, int],
+    ):
+        stock = {
+            product_id: summaries[product_id]["quantity"] if product_id in summaries else 0
+            for product_id in product_ids
+        }
+        results = []
+        for result in self.search_results:
+            if result["id"] in stock:
+                result = {
+                    **result,
+                    "quantity": stock[result["id"]] - held.get(result["id"], 0),
+                }
+                if result["quantity"] <= 0:
+                    continue
+            results.append(result)
+        self.search_results = results
+        for key, item in self.cart.items():
+            product_id = item["id"]
+            if product_id not in stock:
+                continue
+            available = max(
+                stock[product_id]
+                - held.get(product_id, 0)
+                - self._cart_quantity(product_id, key),
+                0,
+            )
+            if item["batch_id"] is not None:
+                available = min(available, batches.get(item["batch_id"], 0))
+            item["available_quantity"] = available
+        self.cart = self.cart
+
+    @rx.event(background=True)
+    async def watch_stock(self):
+        await watch_stock_levels(self, self._on_stock_levels)
+
+    async def _on_stock_levels(self, levels: StockLevels):
+        async with self:
+            product_ids = self._visible_products()
+            batch_ids = self._pinned_batches()
+            holder = self._holder()
+        if not product_ids:
+            return
+        summaries, held, batches = await db_read(
+            _stock_view, product_ids, holder, batch_ids
+        )
+        async with self:
+            self._apply_product_stock(product_ids, summaries, held, batches)
 
     @rx.event
     def set_selected_customer_id(self, customer_id: str):
@@ -93,22 +266,12 @@ class BillingState(rx.State):
                 }
                 for r in cursor.fetchall()
             ]
-            conn.close()
         except Exception as e:
             logging.exception(f"Error loading customer prescriptions: {e}")
 
     @rx.event
     def load_customers(self):
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name FROM customers ORDER BY name")
-            self.customers = [
-                {"id": row["id"], "name": row["name"]} for row in cursor.fetchall()
-            ]
-            conn.close()
-        except Exception as e:
-            logging.exception(f"Error loading customers in billing: {e}")
+        self.catalog_version = catalog_version("customers")
 
     @rx.event
     def search_medicines(self, query: str):
@@ -117,152 +280,242 @@ class BillingState(rx.State):
             self.search_results = []
             return
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, name, batch_no, sale_price, quantity, unit FROM medicines WHERE (name LIKE ? OR batch_no LIKE ?) AND quantity > 0 LIMIT 10",
-                (f"%{query}%", f"%{query}%"),
+            rows = find_medicines(
+                get_db_connection(),
+                query,
+                limit=30,
+                in_stock_only=True,
+                fuzzy_fallback=True,
             )
-            self.search_results = [
-                {
-                    "id": row["id"],
-                    "name": row["name"],
-                    "batch_no": row["batch_no"],
-                    "sale_price": row["sale_price"],
-                    "quantity": row["quantity"],
-                    "unit": row["unit"],
-                }
-                for row in cursor.fetchall()
-            ]
-            conn.close()
+            self.search_results = self._unreserved(_product_ids(rows)[:10])
         except Exception as e:
             logging.exception(f"Error searching medicines: {e}")
             self.search_results = []
 
-    @rx.event
-    def add_to_cart(self, medicine: MedicineSearchResult):
-        med_id = medicine["id"]
-        if med_id in self.cart:
-            self.update_cart_quantity(med_id, self.cart[med_id]["quantity"] + 1)
-        else:
-            self.cart[med_id] = {
-                "id": med_id,
+    async def _add_to_cart(self, medicine: MedicineSearchResult, batch=None) -> bool:
+        product_id = medicine["id"]
+        batch_id = batch["id"] if batch is not None else None
+        key = _line_key(product_id, batch_id)
+        item = self.cart.get(key)
+        quantity = 1 if item is None else item["quantity"] + 1
+        granted, available = await self._hold_line(key, product_id, batch_id, quantity)
+        if not granted:
+            if item is not None:
+                item["available_quantity"] = available
+                self.cart = self.cart
+            return False
+        if item is None:
+            sale_price = (
+                (batch["sale_price"] or 0.0)
+                if batch is not None
+                else medicine["sale_price"]
+            )
+            self.cart[key] = {
+                "key": key,
+                "id": product_id,
+                "batch_id": batch_id,
+                "batch_no": batch["batch_no"] if batch is not None else None,
                 "name": medicine["name"],
-                "batch_no": medicine["batch_no"],
-                "sale_price": medicine["sale_price"],
+                "sale_price": sale_price,
                 "quantity": 1,
-                "available_quantity": medicine["quantity"],
-                "subtotal": medicine["sale_price"],
+                "available_quantity": available,
+                "subtotal": sale_price,
                 "unit": medicine["unit"],
             }
+        else:
+            item["quantity"] = quantity
+            item["available_quantity"] = available
+            item["subtotal"] = item["sale_price"] * quantity
+        self.cart = self.cart
+        return True
+
+    @rx.event
+    async def add_to_cart(self, medicine: MedicineSearchResult):
         self.search_query = ""
         self.search_results = []
+        try:
+            added = await self._add_to_cart(medicine)
+        except Exception as e:
+            logging.exception(f"Error reserving stock: {e}")
+            return rx.toast.error("Failed to add medicine to cart.")
+        if not added:
+            return rx.toast.warning("Quantity exceeds available stock.")
 
     @rx.event
-    def update_cart_quantity(self, med_id: int, quantity_str: str):
+    async def scan_code(self, form_data: dict):
+        code = (form_data.get("code") or "").strip()
+        if not code:
+            return
+        try:
+            conn = get_db_connection()
+            batches = conn.execute(
+                f"{SCANNED_BATCH_SELECT} WHERE barcode = ?", (code,)
+            ).fetchall()
+            if not batches:
+                batches = conn.execute(
+                    f"{SCANNED_BATCH_SELECT} WHERE batch_no = ? AND quantity > 0 LIMIT 10",
+                    (code,),
+                ).fetchall()
+            product_ids = _product_ids(batches)
+            if len(product_ids) == 1:
+                row = product_summaries(conn, product_ids)[product_ids[0]]
+                medicine = _search_result_from_row(row)
+                batch = batches[0] if len(batches) == 1 else None
+                if (
+                    batch is not None
+                    and batch["expiry_date"] < datetime.date.today().isoformat()
+                ):
+                    return rx.toast.warning(
+                        f"Batch {batch['batch_no']} of {medicine['name']} has expired."
+                    )
+                in_stock = batch["quantity"] if batch is not None else medicine["quantity"]
+                if in_stock <= 0:
+                    return rx.toast.warning(f"{medicine['name']} is out of stock.")
+                if not await self._add_to_cart(medicine, batch):
+                    return rx.toast.warning("Quantity exceeds available stock.")
+                return
+            results = self._unreserved(product_ids)
+        except Exception as e:
+            logging.exception(f"Error resolving scanned code: {e}")
+            return rx.toast.error("Failed to look up scanned code.")
+        if not product_ids:
+            return rx.toast.error(f"No medicine found for code {code}.")
+        self.search_query = code
+        self.search_results = results
+        return rx.toast.info("Several medicines share this batch number.")
+
+    @rx.event
+    async def update_cart_quantity(self, key: str, quantity_str: str):
         try:
             quantity = int(quantity_str)
-            if med_id in self.cart:
-                item = self.cart[med_id]
-                if 0 < quantity <= item["available_quantity"]:
+            if key in self.cart:
+                item = self.cart[key]
+                granted = False
+                if quantity > 0:
+                    granted, item["available_quantity"] = await self._hold_line(
+                        key, item["id"], item["batch_id"], quantity
+                    )
+                if granted:
                     item["quantity"] = quantity
                     item["subtotal"] = item["sale_price"] * quantity
-                    self.cart = self.cart
-                else:
+                self.cart = self.cart
+                if not granted:
                     yield rx.toast.warning("Quantity exceeds available stock.")
         except ValueError as e:
             logging.exception(f"Error updating cart quantity: {e}")
             pass
 
     @rx.event
-    def remove_from_cart(self, med_id: int):
-        if med_id in self.cart:
-            del self.cart[med_id]
-            self.cart = self.cart
+    async def remove_from_cart(self, key: str):
+        item = self.cart.pop(key, None)
+        if item is None:
+            return
+        self.cart = self.cart
+        remaining = self._cart_quantity(item["id"])
+        if remaining:
+            await self._reserve(item["id"], remaining)
+        else:
+            await write_queue.run(release_holds, self._holder(), item["id"])
 
     @rx.event
-    def load_prescription_into_cart(self, prescription_id: str):
+    async def load_prescription_into_cart(self, prescription_id: str):
         self.selected_prescription_id = prescription_id
         if not prescription_id:
             return
         try:
             conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            prescribed = conn.execute(
                 """
-                SELECT pm.medicine_id, m.name, m.batch_no, m.sale_price, m.quantity as available_quantity, m.unit, pm.quantity as prescription_qty
+                SELECT m.product_id, SUM(pm.quantity) as prescription_qty
                 FROM prescription_medicines pm
                 JOIN medicines m ON pm.medicine_id = m.id
-                WHERE pm.prescription_id = ?
+                WHERE pm.prescription_id = ? AND m.product_id IS NOT NULL
+                GROUP BY m.product_id
             """,
                 (int(prescription_id),),
-            )
-            medicines_to_add = cursor.fetchall()
-            conn.close()
-            for med in medicines_to_add:
-                med_id = med["medicine_id"]
-                quantity_to_add = med["prescription_qty"]
-                if med["available_quantity"] < quantity_to_add:
+            ).fetchall()
+            summaries = product_summaries(conn, _product_ids(prescribed))
+            for line in prescribed:
+                med = summaries[line["product_id"]]
+                product_id = med["id"]
+                key = _line_key(product_id)
+                in_cart = self.cart[key]["quantity"] if key in self.cart else 0
+                wanted = in_cart + line["prescription_qty"]
+                granted, available = await self._hold_line(key, product_id, None, wanted)
+                if not granted:
                     yield rx.toast.warning(
                         f"Stock for {med['name']} is low. Adding available quantity."
                     )
-                    quantity_to_add = med["available_quantity"]
-                if quantity_to_add > 0:
-                    if med_id in self.cart:
-                        self.cart[med_id]["quantity"] += quantity_to_add
-                        self.cart[med_id]["subtotal"] = (
-                            self.cart[med_id]["quantity"]
-                            * self.cart[med_id]["sale_price"]
+                    wanted = available
+                    if wanted > in_cart:
+                        granted, available = await self._hold_line(
+                            key, product_id, None, wanted
                         )
-                    else:
-                        self.cart[med_id] = {
-                            "id": med_id,
-                            "name": med["name"],
-                            "batch_no": med["batch_no"],
-                            "sale_price": med["sale_price"],
-                            "quantity": quantity_to_add,
-                            "available_quantity": med["available_quantity"],
-                            "subtotal": med["sale_price"] * quantity_to_add,
-                            "unit": med["unit"],
-                        }
+                        if not granted:
+                            wanted = in_cart
+                if wanted <= in_cart:
+                    continue
+                if key in self.cart:
+                    self.cart[key]["quantity"] = wanted
+                    self.cart[key]["available_quantity"] = available
+                    self.cart[key]["subtotal"] = wanted * self.cart[key]["sale_price"]
+                else:
+                    self.cart[key] = {
+                        "key": key,
+                        "id": product_id,
+                        "batch_id": None,
+                        "batch_no": None,
+                        "name": med["name"],
+                        "sale_price": med["sale_price"],
+                        "quantity": wanted,
+                        "available_quantity": available,
+                        "subtotal": med["sale_price"] * wanted,
+                        "unit": med["unit"],
+                    }
             self.cart = self.cart
         except Exception as e:
             logging.exception(f"Error loading prescription into cart: {e}")
             yield rx.toast.error("Failed to load prescription medicines.")
 
     @rx.event
-    def generate_bill(self):
+    async def generate_bill(self):
         if not self.cart:
-            return rx.toast.error("Cart is empty.")
+            yield rx.toast.error("Cart is empty.")
+            return
         try:
             customer_id = (
                 int(self.selected_customer_id) if self.selected_customer_id else None
             )
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO sales (total_amount, customer_id, doctor_name) VALUES (?, ?, ?)",
-                (self.total_amount, customer_id, self.doctor_name),
+            lines: list[SaleLine] = [
+                {
+                    "product_id": item["id"],
+                    "medicine_id": item["batch_id"],
+                    "quantity": item["quantity"],
+                    "price_per_unit": item["sale_price"],
+                }
+                for item in self.cart.values()
+            ]
+            sale_id, batches = await write_queue.run(
+                commit_sale, lines, customer_id, self.doctor_name
             )
-            sale_id = cursor.lastrowid
-            for item in self.cart.values():
-                cursor.execute(
-                    "INSERT INTO sale_items (sale_id, medicine_id, quantity, price_per_unit) VALUES (?, ?, ?, ?)",
-                    (sale_id, item["id"], item["quantity"], item["sale_price"]),
-                )
-                cursor.execute(
-                    "UPDATE medicines SET quantity = quantity - ? WHERE id = ?",
-                    (item["quantity"], item["id"]),
-                )
-            conn.commit()
-            conn.close()
+            await publish_stock_levels([batch["medicine_id"] for batch in batches])
             yield rx.toast.success(f"Bill #{sale_id} generated successfully!")
-            self._clear_bill()
+            await self._clear_bill()
+        except InsufficientStockError as e:
+            for shortage in e.shortages:
+                item = self.cart.get(
+                    _line_key(shortage["product_id"], shortage["medicine_id"])
+                )
+                if item is not None:
+                    item["available_quantity"] = shortage["available"]
+            self.cart = self.cart
+            yield rx.toast.error(f"Not enough stock, bill not saved: {e}")
         except Exception as e:
             logging.exception(f"Error generating bill: {e}")
             yield rx.toast.error(f"Failed to generate bill: {e}")
 
-    def _clear_bill(self):
+    async def _clear_bill(self):
+        await write_queue.run(release_holds, self._holder())
         self.cart = {}
         self.selected_customer_id = ""
         self.search_query = ""
@@ -272,5 +525,5 @@ class BillingState(rx.State):
         self.selected_prescription_id = ""
 
     @rx.event
-    def clear_bill_event(self):
-        self._clear_bill()
\ No newline at end of file
+    async def clear_bill_event(self):
+        await self._clear_bill()
\ No newline at end of file
@@ -0,0 +1,120 @@
+import threading
+from typing import Any, Optional
+from .db_state import get_db_connection, data_version
+
+CATALOG_QUERIES = {
+    "products": (
+        "medicine_catalog",
+        "SELECT id, name, NULLIF(unit, '') AS unit FROM products ORDER BY name",
+    ),
+    "suppliers": ("suppliers", "SELECT id, name FROM suppliers ORDER BY name"),
+    "customers": ("customers", "SELECT id, name FROM customers ORDER BY name"),
+}
+
+
+class CatalogSnapshot:
+    def __init__(self, stamp: tuple, items: list[dict[str, Any]]):
+        self.stamp = stamp
+        self.items = items
+        self.by_id = {item["id"]: item for item in items}
+
+
+_lock = threading.Lock()
+_snapshots: dict[str, CatalogSnapshot] = {}
+
+
+def catalog_snapshot(kind: str) -> CatalogSnapshot:
+    version_key, query = CATALOG_QUERIES[kind]
+    stamp = data_version(version_key)
+    snapshot = _snapshots.get(kind)
+    if snapshot is not None and snapshot.stamp == stamp:
+        return snapshot
+    with _lock:
+        snapshot = _snapshots.get(kind)
+        if snapshot is not None and snapshot.stamp == stamp:
+            return snapshot
+        rows = get_db_connection().execute(query).fetchall()
+        snapshot = CatalogSnapshot(stamp, [dict(row) for row in rows])
+        _snapshots[kind] = snapshot
+        return snapshot
+
+
+def catalog_items(kind: str) -> list[dict[str, Any]]:
+    return catalog_snapshot(kind).items
+
+
+def catalog_item(kind: str, item_id: int) -> Optional[dict[str, Any]]:
+    return catalog_snapshot(kind).by_id.get(item_id)
+
+
+def catalog_version(*kinds: str) -> int:
+    return sum(data_version(*(CATALOG_QUERIES[kind][0] for kind in kinds)))
+
+
+if __name__ == "__main__":
+    import random
+    import string
+    import tempfile
+    import tracemalloc
+    from .db_state import pool
+    from .inventory import ensure_product
+    from .migrations import run_migrations
+
+    SESSIONS = 50
+    sizes = {"products": 20000, "suppliers": 500, "customers": 20000}
+
+    def word() -> str:
+        return "".join(random.choices(string.ascii_lowercase, k=random.randint(5, 11)))
+
+    random.seed(7)
+    with tempfile.TemporaryDirectory() as directory:
+        pool.database = f"{directory}/catalog_bench.db"
+        run_migrations()
+        conn = get_db_connection()
+        for _ in range(sizes["products"]):
+            name = f"{word().title()} 500"
+            conn.execute(
+                "INSERT INTO medicines (name, batch_no, expiry_date, quantity, "
+                "purchase_price, sale_price, unit, product_id) "
+                "VALUES (?, ?, '2030-01-01', 10, 1.0, 2.0, 'strip', ?)",
+                (name, word(), ensure_product(conn, name, "strip", None)),
+            )
+        conn.executemany(
+            "INSERT INTO suppliers (name) VALUES (?)",
+            [(word().title(),) for _ in range(sizes["suppliers"])],
+        )
+        conn.executemany(
+            "INSERT INTO customers (name) VALUES (?)",
+            [(f"{word().title()} {word().title()}",) for _ in range(sizes["customers"])],
+        )
+        conn.commit()
+
+        from reflex.state import State
+        from .billing_state import BillingState
+        from .purchase_state import PurchaseState
+
+        def open_session() -> list:
+            root = State(_reflex_internal_init=True)
+            billing = root.substates[BillingState.get_name()]
+            purchase = root.substates[PurchaseState.get_name()]
+            billing.load_customers()
+            purchase.load_dependencies()
+            billing.customers, purchase.suppliers, purchase.products
+            return [root, billing, purchase]
+
+        open_session()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = [open_session() for _ in range(SESSIONS)]
+        resident_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        serialized_bytes = sum(
+            len(state._serialize()) for session in sessions for state in session[1:]
+        )
+        pool.close_all()
+    print(
+        f"{SESSIONS} sessions over "
+        + ", ".join(f"{count} {kind}" for kind, count in sizes.items())
+    )
+    print(f"in-memory state manager: {resident_bytes / 2**20:.1f} MiB resident")
+    print(f"redis/disk state manager: {serialized_bytes / 2**20:.1f} MiB serialized")
@@ -1,6 +1,14 @@
 import reflex as rx
 from typing import TypedDict, Optional
-from .db_state import get_db_connection
+from .db_state import (
+    get_db_connection,
+    data_version,
+    is_next_version,
+    versioned_write,
+    VersionStep,
+)
+from .write_queue import write_queue
+from .row_patch import remove_row, upsert_sorted
 import datetime
 import logging
 
@@ -15,8 +23,32 @@ class Customer(TypedDict):
     prescription_count: int
 
 
+CUSTOMER_SELECT = """
+    SELECT c.*, COUNT(p.id) as prescription_count
+    FROM customers c
+    LEFT JOIN prescriptions p ON c.id = p.customer_id
+"""
+
+
+def _customer_from_row(row) -> Customer:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "phone": row["phone"],
+        "email": row["email"],
+        "address": row["address"],
+        "date_registered": row["date_registered"],
+        "prescription_count": row["prescription_count"],
+    }
+
+
+def _customer_name(customer: Customer) -> str:
+    return customer["name"]
+
+
 class CustomerState(rx.State):
     customers: list[Customer] = []
+    _loaded_version: tuple = ()
     search_query: str = ""
     show_form: bool = False
     is_editing: bool = False
@@ -37,32 +69,27 @@ class CustomerState(rx.State):
     @rx.event
     def load_customers(self):
         try:
+            self._loaded_version = data_version("customers")
             conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute("""
-                SELECT c.*, COUNT(p.id) as prescription_count
-                FROM customers c
-                LEFT JOIN prescriptions p ON c.id = p.customer_id
-                GROUP BY c.id
-                ORDER BY c.name
-            """)
-            self.customers = [
-                {
-                    "id": row["id"],
-                    "name": row["name"],
-                    "phone": row["phone"],
-                    "email": row["email"],
-                    "address": row["address"],
-                    "date_registered": row["date_registered"],
-                    "prescription_count": row["prescription_count"],
-                }
-                for row in cursor.fetchall()
-            ]
-            conn.close()
+            cursor.execute(f"{CUSTOMER_SELECT} GROUP BY c.id ORDER BY c.name")
+            self.customers = [_customer_from_row(row) for row in cursor.fetchall()]
         except Exception as e:
             logging.exception(f"Error loading customers: {e}")
             yield rx.toast.error("Failed to load customers.")
 
+    def _patch_customers(
+        self, step: VersionStep, customer=None, removed_id=None
+    ) -> bool:
+        if not is_next_version(self._loaded_version, step):
+            return False
+        if customer is not None:
+            self.customers = upsert_sorted(self.customers, customer, _customer_name)
+        if removed_id is not None:
+            self.customers, _ = remove_row(self.customers, removed_id)
+        self._loaded_version = step[1]
+        return True
+
     @rx.event
     def toggle_form(self):
         self.show_form = not self.show_form
@@ -93,28 +120,29 @@ class CustomerState(rx.State):
         self.show_form = True
 
     @rx.event
-    def save_customer(self, form_data: dict):
+    async def save_customer(self, form_data: dict):
         self.form_data = form_data
         name = form_data.get("name")
         if not name:
-            return rx.toast.error("Customer name is required.")
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            if self.is_editing:
-                cursor.execute(
+            yield rx.toast.error("Customer name is required.")
+            return
+        is_editing, edit_id = self.is_editing, self.edit_id
+
+        def write(conn) -> Customer:
+            customer_id = edit_id
+            if is_editing:
+                conn.execute(
                     "UPDATE customers SET name=?, phone=?, email=?, address=? WHERE id=?",
                     (
                         name,
                         form_data.get("phone"),
                         form_data.get("email"),
                         form_data.get("address"),
-                        self.edit_id,
+                        edit_id,
                     ),
                 )
-                yield rx.toast.success("Customer updated successfully!")
             else:
-                cursor.execute(
+                customer_id = conn.execute(
                     "INSERT INTO customers (name, phone, email, address) VALUES (?, ?, ?, ?)",
                     (
                         name,
@@ -122,34 +150,46 @@ class CustomerState(rx.State):
                         form_data.get("email"),
                         form_data.get("address"),
                     ),
-                )
+                ).lastrowid
+            return _customer_from_row(
+                conn.execute(
+                    f"{CUSTOMER_SELECT} WHERE c.id = ? GROUP BY c.id", (customer_id,)
+                ).fetchone()
+            )
+
+        try:
+            customer, step = await write_queue.run(versioned_write(write, "customers"))
+            if self.is_editing:
+                yield rx.toast.success("Customer updated successfully!")
+            else:
                 yield rx.toast.success("Customer added successfully!")
-            conn.commit()
-            conn.close()
             self.toggle_form()
-            return CustomerState.load_customers
+            if not self._patch_customers(step, customer=customer):
+                yield CustomerState.load_customers
         except Exception as e:
             logging.exception(f"Error saving customer: {e}")
             yield rx.toast.error(f"Failed to save customer: {e}")
 
     @rx.event
-    def delete_customer(self, customer_id: int):
-        try:
-            conn = get_db_connection()
+    async def delete_customer(self, customer_id: int):
+        def write(conn) -> int:
             count = conn.execute(
                 "SELECT COUNT(*) FROM sales WHERE customer_id = ?", (customer_id,)
             ).fetchone()[0]
+            if count == 0:
+                conn.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
+            return count
+
+        try:
+            count, step = await write_queue.run(versioned_write(write, "customers"))
             if count > 0:
                 yield rx.toast.error(
                     "Cannot delete customer with existing sales records."
                 )
-                conn.close()
                 return
-            conn.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
-            conn.commit()
-            conn.close()
             yield rx.toast.info("Customer deleted.")
-            return CustomerState.load_customers
+            if not self._patch_customers(step, removed_id=customer_id):
+                yield CustomerState.load_customers
         except Exception as e:
             logging.exception(f"Error deleting customer: {e}")
             yield rx.toast.error(f"Failed to delete customer: {e}")
\ No newline at end of file
@@ -1,193 +1,261 @@
 import reflex as rx
+import asyncio
 import sqlite3
 import datetime
-from typing import Any, Optional
+import threading
+import contextlib
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional, TypedDict
+from .stock_bus import stock_bus, watch_stock_levels, StockLevels
 
 DATABASE_URL = "medical_store.db"
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384
+MMAP_SIZE_BYTES = 256 * 1024 * 1024
+LOW_STOCK_THRESHOLD = 10
+EXPIRY_ALERT_DAYS = 30
+DASHBOARD_CACHE_TTL_SECONDS = 5.0
+READ_POOL_WORKERS = 4
 
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_URL)
-    conn.row_factory = sqlite3.Row
-    return conn
+class ConnectionPool:
+    def __init__(self, database: str):
+        self.database = database
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: set[sqlite3.Connection] = set()
+        self._generation = 0
 
-
-def create_tables():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS medicines (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            batch_no TEXT NOT NULL,
-            expiry_date DATE NOT NULL,
-            quantity INTEGER NOT NULL,
-            purchase_price REAL NOT NULL,
-            sale_price REAL NOT NULL,
-            supplier_id INTEGER,
-            unit TEXT,
-            drug_type TEXT,
-            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
         )
-    """)
-    cursor.execute("PRAGMA table_info(medicines)")
-    columns = [column[1] for column in cursor.fetchall()]
-    if "unit" not in columns:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_BYTES}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generation == self._generation:
+            return conn
+        conn = self._connect()
+        with self._lock:
+            self._connections.add(conn)
+            self._local.conn = conn
+            self._local.generation = self._generation
+        return conn
+
+    @contextlib.contextmanager
+    def dedicated(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connect()
         try:
-            cursor.execute("ALTER TABLE medicines ADD COLUMN unit TEXT")
-        except sqlite3.OperationalError as e:
-            import logging
+            yield conn
+        finally:
+            conn.close()
 
-            logging.exception(f"Error adding unit column: {e}")
-    if "drug_type" not in columns:
+    @contextlib.contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        conn = self.connection()
+        if immediate and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
         try:
-            cursor.execute("ALTER TABLE medicines ADD COLUMN drug_type TEXT")
-        except sqlite3.OperationalError as e:
-            import logging
-
-            logging.exception(f"Error adding drug_type column: {e}")
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS suppliers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            contact_no TEXT,
-            address TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS purchases (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            supplier_id INTEGER NOT NULL,
-            medicine_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            purchase_date DATE NOT NULL,
-            FOREIGN KEY (supplier_id) REFERENCES suppliers(id),
-            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sales (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            total_amount REAL NOT NULL,
-            sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            doctor_name TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS sale_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sale_id INTEGER NOT NULL,
-            medicine_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            price_per_unit REAL NOT NULL,
-            FOREIGN KEY (sale_id) REFERENCES sales(id),
-            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS customers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            phone TEXT,
-            email TEXT,
-            address TEXT,
-            date_registered TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS prescriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            customer_id INTEGER NOT NULL,
-            prescription_number TEXT,
-            doctor_name TEXT,
-            prescription_date DATE,
-            notes TEXT,
-            image_path TEXT,
-            FOREIGN KEY (customer_id) REFERENCES customers(id)
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS prescription_medicines (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            prescription_id INTEGER NOT NULL,
-            medicine_id INTEGER NOT NULL,
-            quantity INTEGER NOT NULL,
-            dosage_instructions TEXT,
-            FOREIGN KEY (prescription_id) REFERENCES prescriptions(id) ON DELETE CASCADE,
-            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
-        )
-    """)
-    try:
-        cursor.execute("PRAGMA table_info(sales)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if "customer_id" not in columns:
-            cursor.execute(
-                "ALTER TABLE sales ADD COLUMN customer_id INTEGER REFERENCES customers(id)"
-            )
-        if "doctor_name" not in columns:
-            cursor.execute("ALTER TABLE sales ADD COLUMN doctor_name TEXT")
-    except sqlite3.OperationalError as e:
-        import logging
-
-        logging.exception(f"Error adding customer_id column to sales: {e}")
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not cursor.fetchone():
-        cursor.execute(
-            "INSERT INTO users (username, password) VALUES (?, ?)", ("admin", "admin")
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def close_all(self):
+        with self._lock:
+            self._generation += 1
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+pool = ConnectionPool(DATABASE_URL)
+
+
+def get_db_connection() -> sqlite3.Connection:
+    return pool.connection()
+
+
+def db_transaction(immediate: bool = False):
+    return pool.transaction(immediate=immediate)
+
+
+_read_executor = ThreadPoolExecutor(
+    max_workers=READ_POOL_WORKERS, thread_name_prefix="db-read"
+)
+
+
+def _run_with_connection(fn: Callable[..., Any], args: tuple) -> Any:
+    return fn(pool.connection(), *args)
+
+
+async def db_read(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, _run_with_connection, fn, args)
+
+
+def submit_read(fn: Callable[..., Any], *args: Any) -> Future:
+    return _read_executor.submit(_run_with_connection, fn, args)
+
+
+def _fetch_all(conn: sqlite3.Connection, sql: str, params) -> list[sqlite3.Row]:
+    return conn.execute(sql, params).fetchall()
+
+
+async def fetch_all(sql: str, params=()) -> list[sqlite3.Row]:
+    return await db_read(_fetch_all, sql, params)
+
+
+async def publish_stock_levels(medicine_ids: list[int]):
+    medicine_ids = list(dict.fromkeys(medicine_ids))
+    if not medicine_ids:
+        return
+    placeholders = ", ".join("?" for _ in medicine_ids)
+    rows = await fetch_all(
+        f"SELECT id, quantity FROM medicines WHERE id IN ({placeholders})",
+        medicine_ids,
+    )
+    levels = dict.fromkeys(medicine_ids)
+    levels.update((row["id"], row["quantity"]) for row in rows)
+    stock_bus.publish(levels)
+
+
+def read_data_version(conn: sqlite3.Connection, *tables: str) -> tuple[int, ...]:
+    if not tables:
+        return ()
+    placeholders = ", ".join("?" for _ in tables)
+    versions = {
+        row[0]: row[1]
+        for row in conn.execute(
+            f"SELECT table_name, version FROM data_versions WHERE table_name IN ({placeholders})",
+            tables,
         )
-    conn.commit()
-    conn.close()
+    }
+    return tuple(versions.get(table, 0) for table in tables)
+
+
+def data_version(*tables: str) -> tuple[int, ...]:
+    return read_data_version(get_db_connection(), *tables)
+
+
+VersionStep = tuple[tuple[int, ...], tuple[int, ...]]
+
+
+def versioned_write(fn: Callable[..., Any], *tables: str) -> Callable[..., Any]:
+    def write(conn: sqlite3.Connection, *args: Any) -> tuple[Any, VersionStep]:
+        before = read_data_version(conn, *tables)
+        result = fn(conn, *args)
+        return result, (before, read_data_version(conn, *tables))
+
+    return write
+
+
+def is_next_version(loaded: tuple[int, ...], step: VersionStep) -> bool:
+    return bool(loaded) and step[0] == loaded
+
+
+class DashboardMetrics(TypedDict):
+    total_customers: int
+    total_medicines: int
+    low_stock_items: int
+    todays_sales: float
+    expiry_alerts: int
+
+
+_metrics_lock = threading.Lock()
+_metrics_cache: Optional[tuple[tuple, float, DashboardMetrics]] = None
+
+
+def _metrics_key() -> tuple:
+    return (datetime.date.today(), data_version("customers", "medicines", "sales"))
+
+
+def _is_fresh(cached: Optional[tuple], key: tuple) -> bool:
+    return (
+        cached is not None
+        and cached[0] == key
+        and time.monotonic() - cached[1] < DASHBOARD_CACHE_TTL_SECONDS
+    )
+
+
+def _load_dashboard_metrics() -> DashboardMetrics:
+    today = datetime.date.today()
+    expiry_cutoff = today + datetime.timedelta(days=EXPIRY_ALERT_DAYS)
+    row = get_db_connection().execute(
+        """
+        SELECT
+            m.customer_count,
+            m.medicine_count,
+            m.low_stock_count,
+            (SELECT total_amount FROM daily_sales WHERE sale_day = ?),
+            (SELECT SUM(medicine_count) FROM medicine_expiry_counts
+             WHERE expiry_date <= ?)
+        FROM metrics m WHERE m.id = 1
+        """,
+        (today.isoformat(), expiry_cutoff.isoformat()),
+    ).fetchone()
+    return {
+        "total_customers": row[0],
+        "total_medicines": row[1],
+        "low_stock_items": row[2],
+        "todays_sales": row[3] or 0.0,
+        "expiry_alerts": row[4] or 0,
+    }
+
+
+def get_dashboard_metrics() -> DashboardMetrics:
+    global _metrics_cache
+    key = _metrics_key()
+    cached = _metrics_cache
+    if _is_fresh(cached, key):
+        return cached[2]
+    with _metrics_lock:
+        cached = _metrics_cache
+        if _is_fresh(cached, key):
+            return cached[2]
+        metrics = _load_dashboard_metrics()
+        _metrics_cache = (key, time.monotonic(), metrics)
+        return metrics
 
 
 class DBState(rx.State):
-    @rx.var
-    def total_customers(self) -> int:
-        conn = get_db_connection()
-        count = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
-        conn.close()
-        return count
-
-    @rx.var
-    def total_medicines(self) -> int:
-        conn = get_db_connection()
-        count = conn.execute("SELECT COUNT(*) FROM medicines").fetchone()[0]
-        conn.close()
-        return count
-
-    @rx.var
-    def low_stock_items(self) -> int:
-        conn = get_db_connection()
-        count = conn.execute(
-            "SELECT COUNT(*) FROM medicines WHERE quantity < 10"
-        ).fetchone()[0]
-        conn.close()
-        return count
-
-    @rx.var
-    def todays_sales(self) -> float:
-        conn = get_db_connection()
-        today = datetime.date.today()
-        total = conn.execute(
-            "SELECT SUM(total_amount) FROM sales WHERE DATE(sale_date) = ?", (today,)
-        ).fetchone()[0]
-        conn.close()
-        return total or 0.0
-
-    @rx.var
-    def expiry_alerts(self) -> int:
-        conn = get_db_connection()
-        thirty_days_later = datetime.date.today() + datetime.timedelta(days=30)
-        count = conn.execute(
-            "SELECT COUNT(*) FROM medicines WHERE expiry_date <= ?",
-            (thirty_days_later,),
-        ).fetchone()[0]
-        conn.close()
-        return count
\ No newline at end of file
+    total_customers: int = 0
+    total_medicines: int = 0
+    low_stock_items: int = 0
+    todays_sales: float = 0.0
+    expiry_alerts: int = 0
+    _stock_watch_id: str = ""
+
+    @rx.event
+    def load_metrics(self):
+        metrics = get_dashboard_metrics()
+        self.total_customers = metrics["total_customers"]
+        self.total_medicines = metrics["total_medicines"]
+        self.low_stock_items = metrics["low_stock_items"]
+        self.todays_sales = metrics["todays_sales"]
+        self.expiry_alerts = metrics["expiry_alerts"]
+
+    @rx.event(background=True)
+    async def watch_stock(self):
+        await watch_stock_levels(self, self._on_stock_levels)
+
+    async def _on_stock_levels(self, levels: StockLevels):
+        async with self:
+            self.load_metrics()
@@ -0,0 +1,110 @@
+import re
+import heapq
+import threading
+from collections import defaultdict
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def _trigrams(text: str) -> set[str]:
+    normalized = _NON_ALNUM.sub(" ", text.lower()).strip()
+    if not normalized:
+        return set()
+    padded = f"  {normalized} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trigrams: dict[int, frozenset[str]] = {}
+        self._postings: dict[str, set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._trigrams)
+
+    def add(self, item_id: int, text: str):
+        trigrams = frozenset(_trigrams(text))
+        with self._lock:
+            self._discard(item_id)
+            self._trigrams[item_id] = trigrams
+            for trigram in trigrams:
+                self._postings[trigram].add(item_id)
+
+    def remove(self, item_id: int):
+        with self._lock:
+            self._discard(item_id)
+
+    def clear(self):
+        with self._lock:
+            self._trigrams.clear()
+            self._postings.clear()
+
+    def _discard(self, item_id: int):
+        for trigram in self._trigrams.pop(item_id, ()):
+            postings = self._postings.get(trigram)
+            if postings is not None:
+                postings.discard(item_id)
+                if not postings:
+                    del self._postings[trigram]
+
+    def search(
+        self, text: str, limit: int = 10, min_similarity: float = 0.3
+    ) -> list[tuple[int, float]]:
+        query = _trigrams(text)
+        if not query:
+            return []
+        shared: dict[int, int] = defaultdict(int)
+        with self._lock:
+            for trigram in query:
+                for item_id in self._postings.get(trigram, ()):
+                    shared[item_id] += 1
+            query_size = len(query)
+            min_shared = min_similarity * query_size / 2
+            scored = [
+                (2 * count / (query_size + len(self._trigrams[item_id])), item_id)
+                for item_id, count in shared.items()
+                if count >= min_shared
+            ]
+        best = heapq.nlargest(limit, scored)
+        return [(item_id, score) for score, item_id in best if score >= min_similarity]
+
+
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    random.seed(7)
+    stems = [
+        "".join(random.choices(string.ascii_lowercase, k=random.randint(5, 11)))
+        for _ in range(25000)
+    ]
+    names = [
+        f"{random.choice(stems).title()} {random.choice(['100', '250', '500', '650'])}"
+        for _ in range(100000)
+    ]
+    index = TrigramIndex()
+    started = time.perf_counter()
+    for item_id, name in enumerate(names):
+        index.add(item_id, name)
+    print(f"indexed {len(index)} names in {time.perf_counter() - started:.2f}s")
+
+    def typo(name: str) -> str:
+        chars = list(name)
+        position = random.randrange(len(chars))
+        chars[position] = random.choice(string.ascii_lowercase)
+        return "".join(chars)
+
+    queries = [typo(random.choice(names).split()[0]) for _ in range(500)]
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, limit=10)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(
+        f"lookups: p50 {timings[len(timings) // 2]:.2f} ms, "
+        f"p95 {timings[int(len(timings) * 0.95)]:.2f} ms, "
+        f"max {timings[-1]:.2f} ms"
+    )
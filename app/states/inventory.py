@@ -0,0 +1,94 @@
+import sqlite3
+import datetime
+from typing import Iterable, Optional, TypedDict
+
+
+class BatchAllocation(TypedDict):
+    product_id: int
+    medicine_id: int
+    quantity: int
+
+
+def _today() -> str:
+    return datetime.date.today().isoformat()
+
+
+def ensure_product(
+    conn: sqlite3.Connection, name: str, unit: Optional[str], drug_type: Optional[str]
+) -> int:
+    return conn.execute(
+        """
+        INSERT INTO products (name, unit, drug_type) VALUES (?, ?, ?)
+        ON CONFLICT(name, unit) DO UPDATE
+            SET drug_type = COALESCE(excluded.drug_type, products.drug_type)
+        RETURNING id
+        """,
+        (name.strip(), unit or "", drug_type),
+    ).fetchone()[0]
+
+
+def prune_products(conn: sqlite3.Connection, product_ids: Iterable[int]):
+    conn.executemany(
+        "DELETE FROM products WHERE id = ? "
+        "AND NOT EXISTS (SELECT 1 FROM medicines WHERE product_id = products.id)",
+        [(product_id,) for product_id in set(product_ids) if product_id is not None],
+    )
+
+
+def product_summaries(
+    conn: sqlite3.Connection, product_ids: list[int], on_day: Optional[str] = None
+) -> dict[int, sqlite3.Row]:
+    if not product_ids:
+        return {}
+    day = on_day or _today()
+    placeholders = ", ".join("?" for _ in product_ids)
+    rows = conn.execute(
+        f"""
+        SELECT p.id, p.name, NULLIF(p.unit, '') AS unit,
+            COUNT(m.id) AS batch_count,
+            COALESCE(SUM(m.quantity), 0) AS quantity,
+            (
+                SELECT f.sale_price FROM medicines f
+                WHERE f.product_id = p.id AND f.quantity > 0 AND f.expiry_date >= ?
+                ORDER BY f.expiry_date, f.id LIMIT 1
+            ) AS sale_price
+        FROM products p
+        LEFT JOIN medicines m
+            ON m.product_id = p.id AND m.quantity > 0 AND m.expiry_date >= ?
+        WHERE p.id IN ({placeholders})
+        GROUP BY p.id
+        """,
+        (day, day, *product_ids),
+    )
+    return {row["id"]: row for row in rows}
+
+
+def allocate_fefo(
+    conn: sqlite3.Connection, demands: dict[int, int], on_day: Optional[str] = None
+) -> list[BatchAllocation]:
+    demands = {product_id: qty for product_id, qty in demands.items() if qty > 0}
+    if not demands:
+        return []
+    values = ", ".join("(?, ?)" for _ in demands)
+    rows = conn.execute(
+        f"""
+        WITH demand(product_id, wanted) AS (VALUES {values}),
+        batches AS (
+            SELECT m.product_id, m.id, m.quantity, d.wanted,
+                SUM(m.quantity) OVER (
+                    PARTITION BY m.product_id ORDER BY m.expiry_date, m.id
+                ) - m.quantity AS before
+            FROM demand d
+            JOIN medicines m INDEXED BY idx_medicines_fefo
+                ON m.product_id = d.product_id
+            WHERE m.quantity > 0 AND m.expiry_date >= ?
+        )
+        SELECT product_id, id, MIN(quantity, wanted - before) AS take
+        FROM batches WHERE before < wanted
+        """,
+        (*(value for item in demands.items() for value in item), on_day or _today()),
+    )
+    return [
+        {"product_id": row["product_id"], "medicine_id": row["id"], "quantity": row["take"]}
+        for row in rows
+    ]
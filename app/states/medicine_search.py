@@ -0,0 +1,143 @@
+import re
+import logging
+import sqlite3
+import threading
+from typing import Optional
+from .db_state import submit_read
+from .fuzzy_index import TrigramIndex
+
+FUZZY_FALLBACK_MIN_HITS = 3
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+_name_index: Optional[TrigramIndex] = None
+_name_index_lock = threading.Lock()
+_name_index_generation = 0
+_pending_edits: Optional[dict[int, Optional[str]]] = None
+
+
+def fts_query(text: str) -> str:
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _load_name_index(conn: sqlite3.Connection, generation: int):
+    global _name_index, _pending_edits
+    try:
+        index = TrigramIndex()
+        for row in conn.execute("SELECT id, name FROM medicines"):
+            index.add(row["id"], row["name"])
+    except Exception as e:
+        logging.exception(f"Error loading medicine name index: {e}")
+        index = None
+    with _name_index_lock:
+        if generation != _name_index_generation:
+            return
+        if index is not None:
+            for medicine_id, name in _pending_edits.items():
+                if name is None:
+                    index.remove(medicine_id)
+                else:
+                    index.add(medicine_id, name)
+        _name_index, _pending_edits = index, None
+
+
+def warm_name_index():
+    global _pending_edits
+    with _name_index_lock:
+        if _name_index is not None or _pending_edits is not None:
+            return
+        _pending_edits = {}
+        generation = _name_index_generation
+    submit_read(_load_name_index, generation)
+
+
+def _record_edit(medicine_id: int, name: Optional[str]):
+    with _name_index_lock:
+        if _pending_edits is not None:
+            _pending_edits[medicine_id] = name
+        index = _name_index
+    if index is None:
+        return
+    if name is None:
+        index.remove(medicine_id)
+    else:
+        index.add(medicine_id, name)
+
+
+def index_medicine_name(medicine_id: int, name: str):
+    _record_edit(medicine_id, name)
+
+
+def unindex_medicine(medicine_id: int):
+    _record_edit(medicine_id, None)
+
+
+def reset_name_index():
+    global _name_index, _name_index_generation, _pending_edits
+    with _name_index_lock:
+        _name_index_generation += 1
+        _name_index, _pending_edits = None, None
+
+
+def _find_fuzzy(
+    conn: sqlite3.Connection,
+    text: str,
+    limit: int,
+    in_stock_only: bool,
+    exclude_ids: set[int],
+) -> list[sqlite3.Row]:
+    index = _name_index
+    if index is None:
+        warm_name_index()
+        return []
+    matches = [
+        medicine_id
+        for medicine_id, _ in index.search(text, limit=limit * 3)
+        if medicine_id not in exclude_ids
+    ]
+    if not matches:
+        return []
+    placeholders = ", ".join("?" for _ in matches)
+    stock_filter = " AND quantity > 0" if in_stock_only else ""
+    rows = {
+        row["id"]: row
+        for row in conn.execute(
+            f"SELECT * FROM medicines WHERE id IN ({placeholders}){stock_filter}",
+            matches,
+        )
+    }
+    return [rows[medicine_id] for medicine_id in matches if medicine_id in rows][
+        :limit
+    ]
+
+
+def find_medicines(
+    conn: sqlite3.Connection,
+    text: str,
+    limit: int,
+    in_stock_only: bool = False,
+    fuzzy_fallback: bool = False,
+) -> list[sqlite3.Row]:
+    query = fts_query(text)
+    if not query:
+        return []
+    stock_filter = " AND m.quantity > 0" if in_stock_only else ""
+    rows = conn.execute(
+        f"""
+        SELECT m.* FROM medicines_fts
+        JOIN medicines m ON m.id = medicines_fts.rowid
+        WHERE medicines_fts MATCH ?{stock_filter}
+        ORDER BY medicines_fts.rank
+        LIMIT ?
+        """,
+        (query, limit),
+    ).fetchall()
+    if fuzzy_fallback and len(rows) < min(FUZZY_FALLBACK_MIN_HITS, limit):
+        rows += _find_fuzzy(
+            conn,
+            text,
+            limit - len(rows),
+            in_stock_only,
+            {row["id"] for row in rows},
+        )
+    return rows
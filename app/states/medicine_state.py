@@ -1,6 +1,22 @@
 import reflex as rx
+import asyncio
 from typing import TypedDict, Optional
-from .db_state import get_db_connection
+from .db_state import (
+    db_read,
+    data_version,
+    is_next_version,
+    versioned_write,
+    VersionStep,
+    LOW_STOCK_THRESHOLD,
+    EXPIRY_ALERT_DAYS,
+)
+from .medicine_search import fts_query, index_medicine_name, unindex_medicine
+from .write_queue import write_queue
+from .catalog import catalog_items, catalog_version
+from .row_patch import remove_row, insert_sorted
+from .stock_bus import stock_bus, watch_stock_levels, StockLevels
+from .stock_ledger import record_movements
+from .inventory import ensure_product, prune_products
 import datetime
 import logging
 
@@ -17,6 +33,7 @@ class Medicine(TypedDict):
     supplier_name: Optional[str]
     unit: Optional[str]
     drug_type: Optional[str]
+    barcode: Optional[str]
 
 
 class Supplier(TypedDict):
@@ -24,10 +41,139 @@ class Supplier(TypedDict):
     name: str
 
 
+MEDICINE_SELECT = """
+    SELECT m.*, s.name as supplier_name
+    FROM medicines m
+    LEFT JOIN suppliers s ON m.supplier_id = s.id
+"""
+SORTABLE_COLUMNS = {
+    "name": "m.name",
+    "batch_no": "m.batch_no",
+    "expiry_date": "m.expiry_date",
+    "quantity": "m.quantity",
+}
+ALERT_LIMIT = 50
+MEDICINE_TABLES = ("medicine_rows",)
+
+
+def _medicine_from_row(row) -> Medicine:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "batch_no": row["batch_no"],
+        "expiry_date": row["expiry_date"],
+        "quantity": row["quantity"],
+        "purchase_price": row["purchase_price"],
+        "sale_price": row["sale_price"],
+        "supplier_id": row["supplier_id"],
+        "supplier_name": row["supplier_name"],
+        "unit": row["unit"],
+        "drug_type": row["drug_type"],
+        "barcode": row["barcode"],
+    }
+
+
+def _quantity_key(medicine: Medicine) -> int:
+    return medicine["quantity"]
+
+
+def _expiry_key(medicine: Medicine) -> str:
+    return medicine["expiry_date"]
+
+
+def _expiry_cutoff() -> str:
+    return (
+        datetime.date.today() + datetime.timedelta(days=EXPIRY_ALERT_DAYS)
+    ).isoformat()
+
+
+def _patch_alert_list(
+    rows: list[Medicine], medicine: Optional[Medicine], row_id: int, qualifies: bool, key
+) -> tuple[list[Medicine], bool]:
+    patched, removed = remove_row(rows, row_id)
+    truncated = len(rows) >= ALERT_LIMIT
+    if medicine is not None and qualifies:
+        inserted = insert_sorted(patched, medicine, key)
+        if truncated and inserted[-1]["id"] == row_id:
+            return patched, True
+        return inserted[:ALERT_LIMIT], False
+    return patched, removed and truncated
+
+
+def _search_filter(search_query: str) -> tuple[list[str], list]:
+    query = fts_query(search_query)
+    if not query:
+        return [], []
+    return [
+        "m.id IN (SELECT rowid FROM medicines_fts WHERE medicines_fts MATCH ?)"
+    ], [query]
+
+
+def _query_page(
+    conn,
+    sort_column: str,
+    ascending: bool,
+    search_query: str,
+    cursor: Optional[dict],
+    page_size: int,
+) -> tuple[int, list]:
+    column = SORTABLE_COLUMNS[sort_column]
+    direction = "ASC" if ascending else "DESC"
+    conditions, params = _search_filter(search_query)
+    if conditions:
+        total_count = conn.execute(
+            f"SELECT COUNT(*) FROM medicines m WHERE {' AND '.join(conditions)}",
+            params,
+        ).fetchone()[0]
+    else:
+        total_count = conn.execute(
+            "SELECT medicine_count FROM metrics WHERE id = 1"
+        ).fetchone()[0]
+    if cursor is not None:
+        comparison = ">" if ascending else "<"
+        conditions = [*conditions, f"({column}, m.id) {comparison} (?, ?)"]
+        params = [*params, cursor["value"], cursor["id"]]
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = conn.execute(
+        f"{MEDICINE_SELECT}{where} ORDER BY {column} {direction}, m.id {direction} LIMIT ?",
+        [*params, page_size + 1],
+    ).fetchall()
+    return total_count, rows
+
+
+def _query_alerts(conn) -> tuple[list[Medicine], list[Medicine]]:
+    low_stock = [
+        _medicine_from_row(row)
+        for row in conn.execute(
+            f"{MEDICINE_SELECT} WHERE m.quantity < ? ORDER BY m.quantity LIMIT ?",
+            (LOW_STOCK_THRESHOLD, ALERT_LIMIT),
+        )
+    ]
+    expiring = [
+        _medicine_from_row(row)
+        for row in conn.execute(
+            f"{MEDICINE_SELECT} WHERE m.expiry_date <= ? ORDER BY m.expiry_date LIMIT ?",
+            (_expiry_cutoff(), ALERT_LIMIT),
+        )
+    ]
+    return low_stock, expiring
+
+
 class MedicineState(rx.State):
     medicines: list[Medicine] = []
-    suppliers: list[Supplier] = []
+    low_stock_medicines: list[Medicine] = []
+    expiring_medicines: list[Medicine] = []
+    catalog_version: int = 0
     search_query: str = ""
+    sort_column: str = "name"
+    sort_ascending: bool = True
+    page: int = 1
+    page_size: int = 50
+    total_count: int = 0
+    has_next_page: bool = False
+    _page_cursors: list[dict] = []
+    _loaded_version: tuple = ()
+    _stock_watch_id: str = ""
     show_form: bool = False
     is_editing: bool = False
     edit_id: Optional[int] = None
@@ -53,62 +199,221 @@ class MedicineState(rx.State):
         "Syrups",
     ]
 
-    @rx.var
-    def filtered_medicines(self) -> list[Medicine]:
-        if not self.search_query:
-            return self.medicines
-        query = self.search_query.lower()
-        return [
-            m
-            for m in self.medicines
-            if query in m["name"].lower() or query in m["batch_no"].lower()
-        ]
+    @rx.var(deps=["catalog_version"], auto_deps=False)
+    def suppliers(self) -> list[Supplier]:
+        return catalog_items("suppliers")
 
     @rx.var
-    def low_stock_medicines(self) -> list[Medicine]:
-        return [m for m in self.medicines if m["quantity"] < 10]
+    def page_start(self) -> int:
+        if not self.medicines:
+            return 0
+        return (self.page - 1) * self.page_size + 1
 
     @rx.var
-    def expiring_medicines(self) -> list[Medicine]:
-        today = datetime.date.today()
-        thirty_days = today + datetime.timedelta(days=30)
-        return [
-            m
-            for m in self.medicines
-            if datetime.datetime.strptime(m["expiry_date"], "%Y-%m-%d").date()
-            <= thirty_days
-        ]
+    def page_end(self) -> int:
+        return (self.page - 1) * self.page_size + len(self.medicines)
+
+    def _page_query(self) -> tuple:
+        return (
+            self.sort_column,
+            self.sort_ascending,
+            self.search_query,
+            self._page_cursors[-1] if self._page_cursors else None,
+            self.page_size,
+        )
+
+    async def _load_page(self):
+        self._show_page(*await db_read(_query_page, *self._page_query()))
+
+    def _show_page(self, total_count: int, rows: list):
+        self.total_count = total_count
+        self.has_next_page = len(rows) > self.page_size
+        self.medicines = [_medicine_from_row(row) for row in rows[: self.page_size]]
+
+    async def _load_alerts(self):
+        self.low_stock_medicines, self.expiring_medicines = await db_read(
+            _query_alerts
+        )
+
+    def _reset_pagination(self):
+        self.page = 1
+        self._page_cursors = []
+
+    def _sort_key(self, medicine: Medicine) -> tuple:
+        return (medicine[self.sort_column], medicine["id"])
+
+    def _belongs_on_page(self, medicine: Medicine, rows: list[Medicine]) -> bool:
+        key = self._sort_key(medicine)
+        cursor = self._page_cursors[-1] if self._page_cursors else None
+        lower = (cursor["value"], cursor["id"]) if cursor is not None else None
+        upper = self._sort_key(rows[-1]) if self.has_next_page and rows else None
+        if not self.sort_ascending:
+            lower, upper = upper, lower
+            return (lower is None or key >= lower) and (upper is None or key < upper)
+        return (lower is None or key > lower) and (upper is None or key <= upper)
+
+    def _patch_page(self, medicine: Optional[Medicine], row_id: int) -> bool:
+        if self.search_query:
+            return True
+        rows, removed = remove_row(self.medicines, row_id)
+        if removed and self.has_next_page and not rows:
+            return True
+        if medicine is not None and self._belongs_on_page(medicine, rows):
+            rows = insert_sorted(
+                rows, medicine, self._sort_key, descending=not self.sort_ascending
+            )
+            if len(rows) > self.page_size:
+                rows = rows[: self.page_size]
+                self.has_next_page = True
+        elif removed and self.has_next_page:
+            return True
+        self.medicines = rows
+        return False
+
+    async def _patch_medicines(
+        self, step: VersionStep, medicine=None, removed_id=None, created=False
+    ) -> bool:
+        if not is_next_version(self._loaded_version, step):
+            return False
+        self._loaded_version = step[1]
+        row_id = medicine["id"] if medicine is not None else removed_id
+        if created:
+            self.total_count += 1
+        elif medicine is None:
+            self.total_count -= 1
+        self.low_stock_medicines, reload_low_stock = _patch_alert_list(
+            self.low_stock_medicines,
+            medicine,
+            row_id,
+            medicine is not None and medicine["quantity"] < LOW_STOCK_THRESHOLD,
+            _quantity_key,
+        )
+        self.expiring_medicines, reload_expiring = _patch_alert_list(
+            self.expiring_medicines,
+            medicine,
+            row_id,
+            medicine is not None and medicine["expiry_date"] <= _expiry_cutoff(),
+            _expiry_key,
+        )
+        pending = []
+        if self._patch_page(medicine, row_id):
+            pending.append(self._load_page())
+        if reload_low_stock or reload_expiring:
+            pending.append(self._load_alerts())
+        if pending:
+            await asyncio.gather(*pending)
+        return True
+
+    def _apply_stock_levels(self, levels: StockLevels) -> tuple[bool, bool]:
+        reload_page = False
+        rows = []
+        for medicine in self.medicines:
+            if medicine["id"] in levels:
+                stock = levels[medicine["id"]]
+                if stock is None:
+                    reload_page = reload_page or self.has_next_page
+                    continue
+                if stock != medicine["quantity"]:
+                    reload_page = reload_page or self.sort_column == "quantity"
+                    medicine = {**medicine, "quantity": stock}
+            rows.append(medicine)
+        self.medicines = rows
+        low_stock_ids = {m["id"] for m in self.low_stock_medicines}
+        expiring_ids = {m["id"] for m in self.expiring_medicines}
+        reload_alerts = any(
+            (stock is None or stock >= LOW_STOCK_THRESHOLD)
+            if med_id in low_stock_ids
+            else (stock is not None and stock < LOW_STOCK_THRESHOLD)
+            for med_id, stock in levels.items()
+        ) or any(
+            stock is None and med_id in expiring_ids
+            for med_id, stock in levels.items()
+        )
+        if not reload_alerts:
+            self.low_stock_medicines = sorted(
+                (
+                    {**m, "quantity": levels[m["id"]]} if m["id"] in levels else m
+                    for m in self.low_stock_medicines
+                ),
+                key=_quantity_key,
+            )
+            self.expiring_medicines = [
+                {**m, "quantity": levels[m["id"]]} if m["id"] in levels else m
+                for m in self.expiring_medicines
+            ]
+        return reload_page, reload_alerts
+
+    @rx.event(background=True)
+    async def watch_stock(self):
+        await watch_stock_levels(self, self._on_stock_levels)
+
+    async def _on_stock_levels(self, levels: StockLevels):
+        async with self:
+            reload_page, reload_alerts = self._apply_stock_levels(levels)
+            page_query = self._page_query()
+        page = await db_read(_query_page, *page_query) if reload_page else None
+        alerts = await db_read(_query_alerts) if reload_alerts else None
+        async with self:
+            if page is not None and self._page_query() == page_query:
+                self._show_page(*page)
+            if alerts is not None:
+                self.low_stock_medicines, self.expiring_medicines = alerts
 
     @rx.event
-    def load_medicines(self):
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT m.*, s.name as supplier_name 
-            FROM medicines m 
-            LEFT JOIN suppliers s ON m.supplier_id = s.id
-        """)
-        self.medicines = [
-            {
-                "id": row["id"],
-                "name": row["name"],
-                "batch_no": row["batch_no"],
-                "expiry_date": row["expiry_date"],
-                "quantity": row["quantity"],
-                "purchase_price": row["purchase_price"],
-                "sale_price": row["sale_price"],
-                "supplier_id": row["supplier_id"],
-                "supplier_name": row["supplier_name"],
-                "unit": row["unit"],
-                "drug_type": row["drug_type"],
-            }
-            for row in cursor.fetchall()
-        ]
-        cursor.execute("SELECT id, name FROM suppliers")
-        self.suppliers = [
-            {"id": row["id"], "name": row["name"]} for row in cursor.fetchall()
+    async def load_medicines(self):
+        self._reset_pagination()
+        self.catalog_version = catalog_version("suppliers")
+        await self.refresh_medicines()
+        return MedicineState.watch_stock
+
+    @rx.event
+    async def refresh_medicines(self):
+        self._loaded_version = data_version(*MEDICINE_TABLES)
+        await asyncio.gather(self._load_page(), self._load_alerts())
+
+    @rx.event
+    async def set_search(self, query: str):
+        self.search_query = query
+        self._reset_pagination()
+        await self._load_page()
+
+    @rx.event
+    async def sort_by(self, column: str):
+        if column not in SORTABLE_COLUMNS:
+            return
+        if self.sort_column == column:
+            self.sort_ascending = not self.sort_ascending
+        else:
+            self.sort_column = column
+            self.sort_ascending = True
+        self._reset_pagination()
+        await self._load_page()
+
+    @rx.event
+    async def set_page_size(self, size: str):
+        self.page_size = int(size)
+        self._reset_pagination()
+        await self._load_page()
+
+    @rx.event
+    async def next_page(self):
+        if not self.has_next_page or not self.medicines:
+            return
+        last = self.medicines[-1]
+        self._page_cursors = [
+            *self._page_cursors,
+            {"value": last[self.sort_column], "id": last["id"]},
         ]
-        conn.close()
+        self.page += 1
+        await self._load_page()
+
+    @rx.event
+    async def prev_page(self):
+        if not self._page_cursors:
+            return
+        self._page_cursors = self._page_cursors[:-1]
+        self.page -= 1
+        await self._load_page()
 
     @rx.event
     def toggle_form(self):
@@ -143,6 +448,7 @@ class MedicineState(rx.State):
             "sale_price": medicine["sale_price"],
             "unit": medicine["unit"],
             "drug_type": medicine["drug_type"],
+            "barcode": medicine["barcode"] or "",
             "supplier_id": str(medicine["supplier_id"])
             if medicine["supplier_id"]
             else "",
@@ -154,7 +460,7 @@ class MedicineState(rx.State):
         self.form_data[field] = value
 
     @rx.event
-    def save_medicine(self, form_data: dict):
+    async def save_medicine(self, form_data: dict):
         self.form_data = form_data
         data = self.form_data
         required_fields = [
@@ -167,73 +473,110 @@ class MedicineState(rx.State):
         ]
         for field in required_fields:
             if not data.get(field):
-                return rx.toast.error(
+                yield rx.toast.error(
                     f"{field.replace('_', ' ').capitalize()} is required."
                 )
+                return
         try:
             quantity = int(data["quantity"])
             purchase_price = float(data["purchase_price"])
             sale_price = float(data["sale_price"])
             supplier_id_str = data.get("supplier_id", "")
             supplier_id = int(supplier_id_str) if supplier_id_str else None
+            barcode = (data.get("barcode") or "").strip() or None
         except (ValueError, TypeError) as e:
             logging.exception(e)
-            return rx.toast.error("Quantity and prices must be valid numbers.")
+            yield rx.toast.error("Quantity and prices must be valid numbers.")
+            return
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            if self.is_editing:
-                cursor.execute(
+            expiry_date = datetime.date.fromisoformat(data["expiry_date"]).isoformat()
+        except ValueError as e:
+            logging.exception(e)
+            yield rx.toast.error("Expiry date must be a valid date.")
+            return
+        values = (
+            data["name"],
+            data["batch_no"],
+            expiry_date,
+            quantity,
+            purchase_price,
+            sale_price,
+            supplier_id,
+            data.get("unit"),
+            data.get("drug_type"),
+            barcode,
+        )
+        is_editing, edit_id = self.is_editing, self.edit_id
+
+        def write(conn) -> Medicine:
+            medicine_id = edit_id
+            product_id = ensure_product(
+                conn, data["name"], data.get("unit"), data.get("drug_type")
+            )
+            if is_editing:
+                previous = conn.execute(
+                    "SELECT quantity, product_id FROM medicines WHERE id = ?",
+                    (edit_id,),
+                ).fetchone()
+                conn.execute(
                     """UPDATE medicines SET name=?, batch_no=?, expiry_date=?, quantity=?, 
-                       purchase_price=?, sale_price=?, supplier_id=?, unit=?, drug_type=? WHERE id=?""",
-                    (
-                        data["name"],
-                        data["batch_no"],
-                        data["expiry_date"],
-                        quantity,
-                        purchase_price,
-                        sale_price,
-                        supplier_id,
-                        data.get("unit"),
-                        data.get("drug_type"),
-                        self.edit_id,
-                    ),
+                       purchase_price=?, sale_price=?, supplier_id=?, unit=?, drug_type=?, barcode=?, product_id=? WHERE id=?""",
+                    (*values, product_id, edit_id),
                 )
+                if previous is not None:
+                    record_movements(
+                        conn, "adjustment", [(edit_id, quantity - previous[0])]
+                    )
+                    prune_products(conn, [previous[1]])
+            else:
+                medicine_id = conn.execute(
+                    """INSERT INTO medicines (name, batch_no, expiry_date, quantity, purchase_price, sale_price, supplier_id, unit, drug_type, barcode, product_id)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (*values, product_id),
+                ).lastrowid
+                record_movements(conn, "opening", [(medicine_id, quantity)])
+            return _medicine_from_row(
+                conn.execute(
+                    f"{MEDICINE_SELECT} WHERE m.id = ?", (medicine_id,)
+                ).fetchone()
+            )
+
+        try:
+            medicine, step = await write_queue.run(
+                versioned_write(write, *MEDICINE_TABLES)
+            )
+            index_medicine_name(medicine["id"], medicine["name"])
+            stock_bus.publish({medicine["id"]: medicine["quantity"]})
+            if self.is_editing:
                 yield rx.toast.success("Medicine updated successfully!")
             else:
-                cursor.execute(
-                    """INSERT INTO medicines (name, batch_no, expiry_date, quantity, purchase_price, sale_price, supplier_id, unit, drug_type)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        data["name"],
-                        data["batch_no"],
-                        data["expiry_date"],
-                        quantity,
-                        purchase_price,
-                        sale_price,
-                        supplier_id,
-                        data.get("unit"),
-                        data.get("drug_type"),
-                    ),
-                )
                 yield rx.toast.success("Medicine added successfully!")
-            conn.commit()
-            conn.close()
             self.toggle_form()
-            return MedicineState.load_medicines
+            if not await self._patch_medicines(
+                step, medicine=medicine, created=not is_editing
+            ):
+                yield MedicineState.refresh_medicines
         except Exception as e:
             logging.exception(e)
             yield rx.toast.error(f"Failed to save medicine: {e}")
 
     @rx.event
-    def delete_medicine(self, medicine_id: int):
+    async def delete_medicine(self, medicine_id: int):
+        def write(conn):
+            row = conn.execute(
+                "DELETE FROM medicines WHERE id = ? RETURNING product_id",
+                (medicine_id,),
+            ).fetchone()
+            if row is not None:
+                prune_products(conn, [row[0]])
+
         try:
-            conn = get_db_connection()
-            conn.execute("DELETE FROM medicines WHERE id = ?", (medicine_id,))
-            conn.commit()
-            conn.close()
+            _, step = await write_queue.run(versioned_write(write, *MEDICINE_TABLES))
+            unindex_medicine(medicine_id)
+            stock_bus.publish({medicine_id: None})
             yield rx.toast.info("Medicine deleted.")
-            return MedicineState.load_medicines
+            if not await self._patch_medicines(step, removed_id=medicine_id):
+                yield MedicineState.refresh_medicines
         except Exception as e:
             logging.exception(e)
             yield rx.toast.error(f"Failed to delete medicine: {e}")
\ No newline at end of file
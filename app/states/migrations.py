@@ -0,0 +1,721 @@
+import sqlite3
+import logging
+from typing import Callable
+from .db_state import get_db_connection, db_transaction, LOW_STOCK_THRESHOLD
+from .stock_ledger import take_stock_snapshot, ensure_stock_snapshot
+
+
+def _column_names(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _initial_schema(conn: sqlite3.Connection):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS medicines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            batch_no TEXT NOT NULL,
+            expiry_date DATE NOT NULL,
+            quantity INTEGER NOT NULL,
+            purchase_price REAL NOT NULL,
+            sale_price REAL NOT NULL,
+            supplier_id INTEGER,
+            unit TEXT,
+            drug_type TEXT,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+        )
+    """)
+    columns = _column_names(conn, "medicines")
+    if "unit" not in columns:
+        cursor.execute("ALTER TABLE medicines ADD COLUMN unit TEXT")
+    if "drug_type" not in columns:
+        cursor.execute("ALTER TABLE medicines ADD COLUMN drug_type TEXT")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS suppliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            contact_no TEXT,
+            address TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            supplier_id INTEGER NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            purchase_date DATE NOT NULL,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers(id),
+            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            total_amount REAL NOT NULL,
+            sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            doctor_name TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sale_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_id INTEGER NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            price_per_unit REAL NOT NULL,
+            FOREIGN KEY (sale_id) REFERENCES sales(id),
+            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            phone TEXT,
+            email TEXT,
+            address TEXT,
+            date_registered TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS prescriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            prescription_number TEXT,
+            doctor_name TEXT,
+            prescription_date DATE,
+            notes TEXT,
+            image_path TEXT,
+            FOREIGN KEY (customer_id) REFERENCES customers(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS prescription_medicines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            prescription_id INTEGER NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            dosage_instructions TEXT,
+            FOREIGN KEY (prescription_id) REFERENCES prescriptions(id) ON DELETE CASCADE,
+            FOREIGN KEY (medicine_id) REFERENCES medicines(id)
+        )
+    """)
+    columns = _column_names(conn, "sales")
+    if "customer_id" not in columns:
+        cursor.execute(
+            "ALTER TABLE sales ADD COLUMN customer_id INTEGER REFERENCES customers(id)"
+        )
+    if "doctor_name" not in columns:
+        cursor.execute("ALTER TABLE sales ADD COLUMN doctor_name TEXT")
+    cursor.execute(
+        "INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+        ("admin", "admin"),
+    )
+
+
+def _secondary_indexes(conn: sqlite3.Connection):
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_medicines_name ON medicines(name)",
+        "CREATE INDEX IF NOT EXISTS idx_medicines_batch_no ON medicines(batch_no)",
+        "CREATE INDEX IF NOT EXISTS idx_medicines_expiry_date ON medicines(expiry_date)",
+        "CREATE INDEX IF NOT EXISTS idx_medicines_quantity ON medicines(quantity)",
+        "CREATE INDEX IF NOT EXISTS idx_medicines_supplier_id ON medicines(supplier_id)",
+        "CREATE INDEX IF NOT EXISTS idx_suppliers_name ON suppliers(name)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_name ON customers(name)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_sale_date ON sales(sale_date)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_customer_id ON sales(customer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items(sale_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sale_items_medicine_id ON sale_items(medicine_id)",
+        "CREATE INDEX IF NOT EXISTS idx_purchases_purchase_date ON purchases(purchase_date)",
+        "CREATE INDEX IF NOT EXISTS idx_purchases_medicine_id ON purchases(medicine_id)",
+        "CREATE INDEX IF NOT EXISTS idx_prescriptions_customer_id ON prescriptions(customer_id, prescription_date)",
+        "CREATE INDEX IF NOT EXISTS idx_prescriptions_prescription_date ON prescriptions(prescription_date)",
+        "CREATE INDEX IF NOT EXISTS idx_prescription_medicines_prescription_id ON prescription_medicines(prescription_id)",
+    ):
+        conn.execute(statement)
+
+
+def _sargable_dates(conn: sqlite3.Connection):
+    for table, column in (
+        ("medicines", "expiry_date"),
+        ("purchases", "purchase_date"),
+        ("prescriptions", "prescription_date"),
+    ):
+        conn.execute(
+            f"UPDATE {table} SET {column} = date({column}) "
+            f"WHERE date({column}) IS NOT NULL AND {column} <> date({column})"
+        )
+    conn.execute("ALTER TABLE sales ADD COLUMN sale_day TEXT")
+    conn.execute("UPDATE sales SET sale_day = date(sale_date, 'localtime')")
+    conn.execute("DROP INDEX IF EXISTS idx_sales_sale_date")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_sale_day ON sales(sale_day)")
+
+
+def _metrics_tables(conn: sqlite3.Connection):
+    low = LOW_STOCK_THRESHOLD
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            customer_count INTEGER NOT NULL DEFAULT 0,
+            medicine_count INTEGER NOT NULL DEFAULT 0,
+            low_stock_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS medicine_expiry_counts (
+            expiry_date TEXT PRIMARY KEY,
+            medicine_count INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            sale_day TEXT PRIMARY KEY,
+            bill_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS metrics_medicines_insert AFTER INSERT ON medicines
+        BEGIN
+            UPDATE metrics SET medicine_count = medicine_count + 1,
+                low_stock_count = low_stock_count + (NEW.quantity < {low})
+            WHERE id = 1;
+            INSERT INTO medicine_expiry_counts (expiry_date, medicine_count)
+            VALUES (NEW.expiry_date, 1)
+            ON CONFLICT(expiry_date) DO UPDATE SET medicine_count = medicine_count + 1;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS metrics_medicines_delete AFTER DELETE ON medicines
+        BEGIN
+            UPDATE metrics SET medicine_count = medicine_count - 1,
+                low_stock_count = low_stock_count - (OLD.quantity < {low})
+            WHERE id = 1;
+            UPDATE medicine_expiry_counts SET medicine_count = medicine_count - 1
+            WHERE expiry_date = OLD.expiry_date;
+            DELETE FROM medicine_expiry_counts
+            WHERE expiry_date = OLD.expiry_date AND medicine_count <= 0;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS metrics_medicines_quantity
+        AFTER UPDATE OF quantity ON medicines
+        WHEN (OLD.quantity < {low}) <> (NEW.quantity < {low})
+        BEGIN
+            UPDATE metrics SET low_stock_count = low_stock_count
+                + (NEW.quantity < {low}) - (OLD.quantity < {low})
+            WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS metrics_medicines_expiry
+        AFTER UPDATE OF expiry_date ON medicines
+        WHEN OLD.expiry_date IS NOT NEW.expiry_date
+        BEGIN
+            UPDATE medicine_expiry_counts SET medicine_count = medicine_count - 1
+            WHERE expiry_date = OLD.expiry_date;
+            DELETE FROM medicine_expiry_counts
+            WHERE expiry_date = OLD.expiry_date AND medicine_count <= 0;
+            INSERT INTO medicine_expiry_counts (expiry_date, medicine_count)
+            VALUES (NEW.expiry_date, 1)
+            ON CONFLICT(expiry_date) DO UPDATE SET medicine_count = medicine_count + 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS metrics_customers_insert AFTER INSERT ON customers
+        BEGIN
+            UPDATE metrics SET customer_count = customer_count + 1 WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS metrics_customers_delete AFTER DELETE ON customers
+        BEGIN
+            UPDATE metrics SET customer_count = customer_count - 1 WHERE id = 1;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS metrics_sales_insert AFTER INSERT ON sales
+        WHEN NEW.sale_day IS NOT NULL
+        BEGIN
+            INSERT INTO daily_sales (sale_day, bill_count, total_amount)
+            VALUES (NEW.sale_day, 1, NEW.total_amount)
+            ON CONFLICT(sale_day) DO UPDATE SET bill_count = bill_count + 1,
+                total_amount = total_amount + excluded.total_amount;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS metrics_sales_delete AFTER DELETE ON sales
+        WHEN OLD.sale_day IS NOT NULL
+        BEGIN
+            UPDATE daily_sales SET bill_count = bill_count - 1,
+                total_amount = total_amount - OLD.total_amount
+            WHERE sale_day = OLD.sale_day;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS metrics_sales_update
+        AFTER UPDATE OF total_amount, sale_day ON sales
+        BEGIN
+            UPDATE daily_sales SET bill_count = bill_count - 1,
+                total_amount = total_amount - OLD.total_amount
+            WHERE sale_day = OLD.sale_day;
+            INSERT INTO daily_sales (sale_day, bill_count, total_amount)
+            SELECT NEW.sale_day, 1, NEW.total_amount WHERE NEW.sale_day IS NOT NULL
+            ON CONFLICT(sale_day) DO UPDATE SET bill_count = bill_count + 1,
+                total_amount = total_amount + excluded.total_amount;
+        END
+    """)
+    rebuild_metrics(conn)
+
+
+def rebuild_metrics(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM metrics")
+    conn.execute(
+        """
+        INSERT INTO metrics (id, customer_count, medicine_count, low_stock_count)
+        SELECT 1,
+            (SELECT COUNT(*) FROM customers),
+            (SELECT COUNT(*) FROM medicines),
+            (SELECT COUNT(*) FROM medicines WHERE quantity < ?)
+        """,
+        (LOW_STOCK_THRESHOLD,),
+    )
+    conn.execute("DELETE FROM medicine_expiry_counts")
+    conn.execute("""
+        INSERT INTO medicine_expiry_counts (expiry_date, medicine_count)
+        SELECT expiry_date, COUNT(*) FROM medicines GROUP BY expiry_date
+    """)
+    conn.execute("DELETE FROM daily_sales")
+    conn.execute("""
+        INSERT INTO daily_sales (sale_day, bill_count, total_amount)
+        SELECT sale_day, COUNT(*), SUM(total_amount) FROM sales
+        WHERE sale_day IS NOT NULL GROUP BY sale_day
+    """)
+    if "item_count" in _column_names(conn, "daily_sales"):
+        rebuild_daily_rollups(conn)
+
+
+def rebuild_daily_rollups(conn: sqlite3.Connection):
+    conn.execute("""
+        UPDATE daily_sales SET item_count = COALESCE((
+            SELECT SUM(si.quantity) FROM sale_items si
+            JOIN sales s ON s.id = si.sale_id
+            WHERE s.sale_day = daily_sales.sale_day
+        ), 0)
+    """)
+    conn.execute("DELETE FROM daily_customer_sales")
+    conn.execute("""
+        INSERT INTO daily_customer_sales (sale_day, customer_id, bill_count, total_amount)
+        SELECT sale_day, customer_id, COUNT(*), SUM(total_amount) FROM sales
+        WHERE sale_day IS NOT NULL AND customer_id IS NOT NULL
+        GROUP BY sale_day, customer_id
+    """)
+
+
+def _medicine_search_index(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS medicines_fts USING fts5(
+            name, batch_no, drug_type, unit,
+            content='medicines', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_insert AFTER INSERT ON medicines
+        BEGIN
+            INSERT INTO medicines_fts (rowid, name, batch_no, drug_type, unit)
+            VALUES (NEW.id, NEW.name, NEW.batch_no, NEW.drug_type, NEW.unit);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_delete AFTER DELETE ON medicines
+        BEGIN
+            INSERT INTO medicines_fts (medicines_fts, rowid, name, batch_no, drug_type, unit)
+            VALUES ('delete', OLD.id, OLD.name, OLD.batch_no, OLD.drug_type, OLD.unit);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS medicines_fts_update
+        AFTER UPDATE OF name, batch_no, drug_type, unit ON medicines
+        BEGIN
+            INSERT INTO medicines_fts (medicines_fts, rowid, name, batch_no, drug_type, unit)
+            VALUES ('delete', OLD.id, OLD.name, OLD.batch_no, OLD.drug_type, OLD.unit);
+            INSERT INTO medicines_fts (rowid, name, batch_no, drug_type, unit)
+            VALUES (NEW.id, NEW.name, NEW.batch_no, NEW.drug_type, NEW.unit);
+        END
+    """)
+    conn.execute("INSERT INTO medicines_fts (medicines_fts) VALUES ('rebuild')")
+    conn.execute(
+        "INSERT INTO medicines_fts (medicines_fts, rank) "
+        "VALUES ('rank', 'bm25(10.0, 5.0, 1.0, 1.0)')"
+    )
+
+
+def _medicine_barcodes(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE medicines ADD COLUMN barcode TEXT")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_medicines_barcode "
+        "ON medicines(barcode) WHERE barcode IS NOT NULL"
+    )
+
+
+def _stock_ledger(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medicine_id INTEGER NOT NULL,
+            movement_day TEXT NOT NULL,
+            moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            kind TEXT NOT NULL
+                CHECK (kind IN ('opening', 'sale', 'purchase', 'adjustment', 'return')),
+            quantity INTEGER NOT NULL,
+            reference_id INTEGER
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_day "
+        "ON stock_movements(movement_day, medicine_id)"
+    )
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            snapshot_day TEXT NOT NULL,
+            medicine_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_day, medicine_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_snapshot_runs (
+            snapshot_day TEXT PRIMARY KEY,
+            last_movement_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        INSERT INTO stock_movements (medicine_id, movement_day, kind, quantity, reference_id)
+        SELECT medicine_id, purchase_date, 'purchase', quantity, id FROM purchases
+        WHERE medicine_id IN (SELECT id FROM medicines)
+    """)
+    conn.execute("""
+        INSERT INTO stock_movements (medicine_id, movement_day, kind, quantity, reference_id)
+        SELECT si.medicine_id, s.sale_day, 'sale', -si.quantity, s.id
+        FROM sale_items si JOIN sales s ON s.id = si.sale_id
+        WHERE s.sale_day IS NOT NULL AND si.medicine_id IN (SELECT id FROM medicines)
+    """)
+    conn.execute("""
+        INSERT INTO stock_movements (medicine_id, movement_day, kind, quantity)
+        SELECT m.id,
+            (SELECT COALESCE(MIN(movement_day), date('now', 'localtime')) FROM stock_movements),
+            'opening',
+            m.quantity - COALESCE(SUM(sm.quantity), 0)
+        FROM medicines m LEFT JOIN stock_movements sm ON sm.medicine_id = m.id
+        GROUP BY m.id
+        HAVING m.quantity - COALESCE(SUM(sm.quantity), 0) != 0
+    """)
+    ensure_stock_snapshot(conn)
+
+
+def _products(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL COLLATE NOCASE,
+            unit TEXT NOT NULL DEFAULT '',
+            drug_type TEXT,
+            UNIQUE (name, unit)
+        )
+    """)
+    conn.execute(
+        "ALTER TABLE medicines ADD COLUMN product_id INTEGER REFERENCES products(id)"
+    )
+    conn.execute("""
+        INSERT OR IGNORE INTO products (name, unit, drug_type)
+        SELECT TRIM(name), COALESCE(unit, ''), MAX(drug_type) FROM medicines
+        GROUP BY TRIM(name) COLLATE NOCASE, COALESCE(unit, '')
+    """)
+    conn.execute("""
+        UPDATE medicines SET product_id = (
+            SELECT p.id FROM products p
+            WHERE p.name = TRIM(medicines.name) AND p.unit = COALESCE(medicines.unit, '')
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_medicines_fefo "
+        "ON medicines(product_id, expiry_date, id) WHERE quantity > 0"
+    )
+
+
+def _purchase_receipts(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS purchase_receipts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            supplier_id INTEGER NOT NULL,
+            purchase_date DATE NOT NULL,
+            line_count INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (supplier_id) REFERENCES suppliers(id)
+        )
+    """)
+    conn.execute(
+        "ALTER TABLE purchases ADD COLUMN receipt_id INTEGER REFERENCES purchase_receipts(id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_purchases_receipt_id ON purchases(receipt_id)"
+    )
+
+
+def _daily_rollups(conn: sqlite3.Connection):
+    conn.execute(
+        "ALTER TABLE daily_sales ADD COLUMN item_count INTEGER NOT NULL DEFAULT 0"
+    )
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_customer_sales (
+            sale_day TEXT NOT NULL,
+            customer_id INTEGER NOT NULL,
+            bill_count INTEGER NOT NULL DEFAULT 0,
+            total_amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (sale_day, customer_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS rollup_sale_items_insert AFTER INSERT ON sale_items
+        BEGIN
+            UPDATE daily_sales SET item_count = item_count + NEW.quantity
+            WHERE sale_day = (SELECT sale_day FROM sales WHERE id = NEW.sale_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS rollup_sale_items_delete AFTER DELETE ON sale_items
+        BEGIN
+            UPDATE daily_sales SET item_count = item_count - OLD.quantity
+            WHERE sale_day = (SELECT sale_day FROM sales WHERE id = OLD.sale_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS rollup_customer_sales_insert AFTER INSERT ON sales
+        WHEN NEW.sale_day IS NOT NULL AND NEW.customer_id IS NOT NULL
+        BEGIN
+            INSERT INTO daily_customer_sales (sale_day, customer_id, bill_count, total_amount)
+            VALUES (NEW.sale_day, NEW.customer_id, 1, NEW.total_amount)
+            ON CONFLICT(sale_day, customer_id) DO UPDATE SET bill_count = bill_count + 1,
+                total_amount = total_amount + excluded.total_amount;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS rollup_customer_sales_delete AFTER DELETE ON sales
+        WHEN OLD.sale_day IS NOT NULL AND OLD.customer_id IS NOT NULL
+        BEGIN
+            UPDATE daily_customer_sales SET bill_count = bill_count - 1,
+                total_amount = total_amount - OLD.total_amount
+            WHERE sale_day = OLD.sale_day AND customer_id = OLD.customer_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS rollup_customer_sales_update
+        AFTER UPDATE OF total_amount, sale_day, customer_id ON sales
+        BEGIN
+            UPDATE daily_customer_sales SET bill_count = bill_count - 1,
+                total_amount = total_amount - OLD.total_amount
+            WHERE sale_day = OLD.sale_day AND customer_id = OLD.customer_id;
+            INSERT INTO daily_customer_sales (sale_day, customer_id, bill_count, total_amount)
+            SELECT NEW.sale_day, NEW.customer_id, 1, NEW.total_amount
+            WHERE NEW.sale_day IS NOT NULL AND NEW.customer_id IS NOT NULL
+            ON CONFLICT(sale_day, customer_id) DO UPDATE SET bill_count = bill_count + 1,
+                total_amount = total_amount + excluded.total_amount;
+        END
+    """)
+    rebuild_daily_rollups(conn)
+
+
+def _product_batches_index(conn: sqlite3.Connection):
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_medicines_product_id ON medicines(product_id)"
+    )
+
+
+def _stock_reservations(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stock_reservations (
+            product_id INTEGER NOT NULL,
+            holder TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (product_id, holder)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stock_reservations_holder "
+        "ON stock_reservations(holder)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires_at "
+        "ON stock_reservations(expires_at)"
+    )
+
+
+VERSIONED_TABLES = (
+    "customers",
+    "suppliers",
+    "medicines",
+    "sales",
+    "sale_items",
+    "purchases",
+    "prescriptions",
+    "prescription_medicines",
+)
+REPORT_VERSIONED_TABLES = ("daily_sales", "daily_customer_sales", "stock_movements")
+
+
+def _version_triggers(conn: sqlite3.Connection, tables: tuple[str, ...]):
+    conn.executemany(
+        "INSERT OR IGNORE INTO data_versions (table_name) VALUES (?)",
+        [(table,) for table in tables],
+    )
+    for table in tables:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS data_version_{table}_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_versions SET version = version + 1
+                    WHERE table_name = '{table}';
+                END
+            """)
+
+
+def _data_versions(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "INSERT OR IGNORE INTO data_versions (table_name) VALUES ('medicine_catalog')"
+    )
+    _version_triggers(conn, VERSIONED_TABLES)
+    for event in ("INSERT", "UPDATE OF name, unit", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS data_version_medicine_catalog_{event.split()[0].lower()}
+            AFTER {event} ON medicines
+            BEGIN
+                UPDATE data_versions SET version = version + 1
+                WHERE table_name = 'medicine_catalog';
+            END
+        """)
+
+
+def _periodic_stock_snapshots(conn: sqlite3.Connection):
+    conn.execute("""
+        UPDATE stock_movements
+        SET movement_day = (
+            SELECT p.purchase_date FROM purchases p WHERE p.id = stock_movements.reference_id
+        )
+        WHERE kind = 'purchase' AND movement_day != (
+            SELECT p.purchase_date FROM purchases p WHERE p.id = stock_movements.reference_id
+        )
+    """)
+    conn.execute("DELETE FROM stock_snapshots")
+    conn.execute("DELETE FROM stock_snapshot_runs")
+    ensure_stock_snapshot(conn)
+
+
+def _report_versions(conn: sqlite3.Connection):
+    _version_triggers(conn, REPORT_VERSIONED_TABLES)
+
+
+MEDICINE_ROW_COLUMNS = (
+    "name, batch_no, expiry_date, purchase_price, sale_price, supplier_id, unit, "
+    "drug_type, barcode, product_id"
+)
+
+
+def _medicine_row_versions(conn: sqlite3.Connection):
+    conn.execute(
+        "INSERT OR IGNORE INTO data_versions (table_name) VALUES ('medicine_rows')"
+    )
+    for event in ("INSERT", f"UPDATE OF {MEDICINE_ROW_COLUMNS}", "DELETE"):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS data_version_medicine_rows_{event.split()[0].lower()}
+            AFTER {event} ON medicines
+            BEGIN
+                UPDATE data_versions SET version = version + 1
+                WHERE table_name = 'medicine_rows';
+            END
+        """)
+
+
+MIGRATIONS: list[tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _initial_schema),
+    (2, _secondary_indexes),
+    (3, _sargable_dates),
+    (4, _metrics_tables),
+    (5, _medicine_search_index),
+    (6, _medicine_barcodes),
+    (7, _stock_ledger),
+    (8, _products),
+    (9, _purchase_receipts),
+    (10, _daily_rollups),
+    (11, _product_batches_index),
+    (12, _stock_reservations),
+    (13, _data_versions),
+    (14, _periodic_stock_snapshots),
+    (15, _report_versions),
+    (16, _medicine_row_versions),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection):
+    current = schema_version(conn)
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Applying schema migration {version}")
+        migrate(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+
+
+def run_migrations():
+    if schema_version(get_db_connection()) >= SCHEMA_VERSION:
+        return
+    with db_transaction(immediate=True) as conn:
+        apply_migrations(conn)
+
+
+if __name__ == "__main__":
+    import argparse
+    import datetime
+
+    parser = argparse.ArgumentParser(description="MediFlow database maintenance")
+    parser.add_argument(
+        "command",
+        choices=["migrate", "rebuild-metrics", "rebuild-rollups", "snapshot-stock"],
+    )
+    parser.add_argument("--day", help="snapshot day (YYYY-MM-DD), defaults to yesterday")
+    args = parser.parse_args()
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    run_migrations()
+    if args.command == "rebuild-metrics":
+        with db_transaction(immediate=True) as conn:
+            rebuild_metrics(conn)
+    elif args.command == "rebuild-rollups":
+        with db_transaction(immediate=True) as conn:
+            rebuild_daily_rollups(conn)
+    elif args.command == "snapshot-stock":
+        with db_transaction(immediate=True) as conn:
+            take_stock_snapshot(conn, args.day or yesterday)
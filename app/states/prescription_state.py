@@ -1,6 +1,17 @@
 import reflex as rx
 from typing import TypedDict, Optional
-from .db_state import get_db_connection
+from .db_state import (
+    get_db_connection,
+    db_read,
+    data_version,
+    is_next_version,
+    versioned_write,
+    VersionStep,
+)
+from .medicine_search import find_medicines
+from .write_queue import write_queue
+from .catalog import catalog_items, catalog_version
+from .row_patch import remove_row, upsert_sorted
 import datetime
 import logging
 import os
@@ -37,10 +48,47 @@ class PrescriptionMedicine(TypedDict):
     dosage_instructions: str
 
 
+PRESCRIPTION_TABLES = ("prescriptions", "prescription_medicines")
+PRESCRIPTION_SELECT = """
+    SELECT p.*, c.name as customer_name 
+    FROM prescriptions p
+    JOIN customers c ON p.customer_id = c.id
+"""
+
+
+def _prescription_from_row(r) -> Prescription:
+    return {
+        "id": r["id"],
+        "customer_id": r["customer_id"],
+        "customer_name": r["customer_name"],
+        "prescription_number": r["prescription_number"],
+        "doctor_name": r["doctor_name"],
+        "prescription_date": r["prescription_date"],
+        "notes": r["notes"],
+        "image_path": r["image_path"],
+    }
+
+
+def _prescription_date_key(prescription: Prescription) -> tuple:
+    date = prescription["prescription_date"]
+    return (date is not None, date or "")
+
+
+def _query_prescriptions(conn, customer_id: Optional[str]) -> list[Prescription]:
+    base_query = PRESCRIPTION_SELECT
+    params = ()
+    if customer_id:
+        base_query += " WHERE p.customer_id = ?"
+        params = (customer_id,)
+    base_query += " ORDER BY p.prescription_date DESC"
+    return [_prescription_from_row(r) for r in conn.execute(base_query, params)]
+
+
 class PrescriptionState(rx.State):
     prescriptions: list[Prescription] = []
-    customers: list[Customer] = []
-    medicines_for_selection: list[MedicineBasic] = []
+    _loaded_version: tuple = ()
+    catalog_version: int = 0
+    medicine_search_results: list[MedicineBasic] = []
     search_query: str = ""
     medicine_search_query: str = ""
     show_form: bool = False
@@ -49,6 +97,10 @@ class PrescriptionState(rx.State):
     form_data: dict = {}
     selected_medicines: dict[int, PrescriptionMedicine] = {}
 
+    @rx.var(deps=["catalog_version"], auto_deps=False)
+    def customers(self) -> list[Customer]:
+        return catalog_items("customers")
+
     def _get_prescriptions_dir(self) -> str:
         return os.path.join(rx.get_upload_dir(), "prescriptions")
 
@@ -64,17 +116,6 @@ class PrescriptionState(rx.State):
             or (p["prescription_number"] and query in p["prescription_number"].lower())
         ]
 
-    @rx.var
-    def filtered_medicines_for_selection(self) -> list[MedicineBasic]:
-        if not self.medicine_search_query:
-            return []
-        query = self.medicine_search_query.lower()
-        return [
-            m
-            for m in self.medicines_for_selection
-            if query in m["name"].lower() or query in m["batch_no"].lower()
-        ][:10]
-
     @rx.var
     def selected_medicines_list(self) -> list[PrescriptionMedicine]:
         return list(self.selected_medicines.values())
@@ -87,56 +128,38 @@ class PrescriptionState(rx.State):
         return ""
 
     @rx.event
-    def load_prescriptions(self):
+    async def load_prescriptions(self):
         customer_id_param = self.router.page.params.get("customer_id")
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            base_query = """
-                SELECT p.*, c.name as customer_name 
-                FROM prescriptions p
-                JOIN customers c ON p.customer_id = c.id
-            """
-            params = ()
-            if customer_id_param:
-                base_query += " WHERE p.customer_id = ?"
-                params = (customer_id_param,)
-            base_query += " ORDER BY p.prescription_date DESC"
-            cursor.execute(base_query, params)
-            self.prescriptions = [
-                {
-                    "id": r["id"],
-                    "customer_id": r["customer_id"],
-                    "customer_name": r["customer_name"],
-                    "prescription_number": r["prescription_number"],
-                    "doctor_name": r["doctor_name"],
-                    "prescription_date": r["prescription_date"],
-                    "notes": r["notes"],
-                    "image_path": r["image_path"],
-                }
-                for r in cursor.fetchall()
-            ]
-            cursor.execute("SELECT id, name FROM customers ORDER BY name")
-            self.customers = [
-                {"id": r["id"], "name": r["name"]} for r in cursor.fetchall()
-            ]
-            cursor.execute(
-                "SELECT id, name, batch_no, quantity, unit FROM medicines WHERE quantity > 0 ORDER BY name"
-            )
-            self.medicines_for_selection = [
-                {
-                    "id": r["id"],
-                    "name": r["name"],
-                    "batch_no": r["batch_no"],
-                    "quantity": r["quantity"],
-                    "unit": r["unit"],
-                }
-                for r in cursor.fetchall()
-            ]
-            conn.close()
+            self.catalog_version = catalog_version("customers")
+            self._loaded_version = data_version(*PRESCRIPTION_TABLES)
+            self.prescriptions = await db_read(_query_prescriptions, customer_id_param)
         except Exception as e:
             logging.exception(f"Error loading prescriptions: {e}")
 
+    def _patch_prescriptions(
+        self, step: VersionStep, prescription=None, removed_id=None
+    ) -> bool:
+        if not is_next_version(self._loaded_version, step):
+            return False
+        if prescription is not None:
+            customer_filter = self.router.page.params.get("customer_id")
+            if customer_filter and str(prescription["customer_id"]) != str(
+                customer_filter
+            ):
+                removed_id = prescription["id"]
+            else:
+                self.prescriptions = upsert_sorted(
+                    self.prescriptions,
+                    prescription,
+                    _prescription_date_key,
+                    descending=True,
+                )
+        if removed_id is not None:
+            self.prescriptions, _ = remove_row(self.prescriptions, removed_id)
+        self._loaded_version = step[1]
+        return True
+
     @rx.event
     def toggle_form(self):
         self.show_form = not self.show_form
@@ -151,6 +174,7 @@ class PrescriptionState(rx.State):
         self.form_image_preview = ""
         self.selected_medicines = {}
         self.medicine_search_query = ""
+        self.medicine_search_results = []
 
     @rx.event
     def open_add_form(self):
@@ -201,7 +225,6 @@ class PrescriptionState(rx.State):
                 }
                 for r in cursor.fetchall()
             }
-            conn.close()
         except Exception as e:
             logging.exception(f"Error loading prescription medicines: {e}")
 
@@ -230,6 +253,31 @@ class PrescriptionState(rx.State):
                 "dosage_instructions": "",
             }
         self.medicine_search_query = ""
+        self.medicine_search_results = []
+
+    @rx.event
+    def search_medicines_for_selection(self, query: str):
+        self.medicine_search_query = query
+        if not query:
+            self.medicine_search_results = []
+            return
+        try:
+            rows = find_medicines(
+                get_db_connection(), query, limit=10, in_stock_only=True
+            )
+            self.medicine_search_results = [
+                {
+                    "id": r["id"],
+                    "name": r["name"],
+                    "batch_no": r["batch_no"],
+                    "quantity": r["quantity"],
+                    "unit": r["unit"],
+                }
+                for r in rows
+            ]
+        except Exception as e:
+            logging.exception(f"Error searching medicines for prescription: {e}")
+            self.medicine_search_results = []
 
     @rx.event
     def update_prescription_medicine(self, med_id: int, field: str, value: str):
@@ -250,98 +298,98 @@ class PrescriptionState(rx.State):
             del self.selected_medicines[med_id]
 
     @rx.event
-    def save_prescription(self, form_data: dict):
+    async def save_prescription(self, form_data: dict):
         if not form_data.get("customer_id"):
-            return rx.toast.error("Customer is required.")
+            yield rx.toast.error("Customer is required.")
+            return
         merged_data = {**self.form_data, **form_data}
-        try:
-            conn = get_db_connection()
+        is_editing, edit_id = self.is_editing, self.edit_id
+        medicine_rows = [
+            (med["medicine_id"], med["quantity"], med["dosage_instructions"])
+            for med in self.selected_medicines.values()
+        ]
+
+        def write(conn) -> Prescription:
             cursor = conn.cursor()
             image_path_to_save = merged_data.get("image_path")
-            if self.is_editing:
-                prescription_id = self.edit_id
+            values = (
+                int(merged_data["customer_id"]),
+                merged_data.get("prescription_number"),
+                merged_data.get("doctor_name"),
+                merged_data.get("prescription_date"),
+                merged_data.get("notes"),
+            )
+            if is_editing:
+                prescription_id = edit_id
                 if not image_path_to_save:
                     cursor.execute(
-                        "SELECT image_path FROM prescriptions WHERE id = ?",
-                        (self.edit_id,),
+                        "SELECT image_path FROM prescriptions WHERE id = ?", (edit_id,)
                     )
                     image_path_to_save = cursor.fetchone()["image_path"]
                 cursor.execute(
                     """UPDATE prescriptions SET customer_id=?, prescription_number=?, doctor_name=?, 
                        prescription_date=?, notes=?, image_path=? WHERE id=?""",
-                    (
-                        int(merged_data["customer_id"]),
-                        merged_data.get("prescription_number"),
-                        merged_data.get("doctor_name"),
-                        merged_data.get("prescription_date"),
-                        merged_data.get("notes"),
-                        image_path_to_save,
-                        self.edit_id,
-                    ),
+                    (*values, image_path_to_save, edit_id),
                 )
             else:
                 cursor.execute(
                     """INSERT INTO prescriptions (customer_id, prescription_number, doctor_name, prescription_date, notes, image_path) 
                        VALUES (?, ?, ?, ?, ?, ?)""",
-                    (
-                        int(merged_data["customer_id"]),
-                        merged_data.get("prescription_number"),
-                        merged_data.get("doctor_name"),
-                        merged_data.get("prescription_date"),
-                        merged_data.get("notes"),
-                        image_path_to_save,
-                    ),
+                    (*values, image_path_to_save),
                 )
                 prescription_id = cursor.lastrowid
             cursor.execute(
                 "DELETE FROM prescription_medicines WHERE prescription_id = ?",
                 (prescription_id,),
             )
-            for med in self.selected_medicines.values():
-                cursor.execute(
-                    """
-                    INSERT INTO prescription_medicines (prescription_id, medicine_id, quantity, dosage_instructions)
-                    VALUES (?, ?, ?, ?)
-                """,
-                    (
-                        prescription_id,
-                        med["medicine_id"],
-                        med["quantity"],
-                        med["dosage_instructions"],
-                    ),
-                )
-            conn.commit()
+            cursor.executemany(
+                """
+                INSERT INTO prescription_medicines (prescription_id, medicine_id, quantity, dosage_instructions)
+                VALUES (?, ?, ?, ?)
+            """,
+                [(prescription_id, *row) for row in medicine_rows],
+            )
+            return _prescription_from_row(
+                conn.execute(
+                    f"{PRESCRIPTION_SELECT} WHERE p.id = ?", (prescription_id,)
+                ).fetchone()
+            )
+
+        try:
+            prescription, step = await write_queue.run(
+                versioned_write(write, *PRESCRIPTION_TABLES)
+            )
             if self.is_editing:
                 yield rx.toast.success("Prescription updated successfully!")
             else:
                 yield rx.toast.success("Prescription added successfully!")
-            conn.close()
             self.toggle_form()
-            return PrescriptionState.load_prescriptions
+            if not self._patch_prescriptions(step, prescription=prescription):
+                yield PrescriptionState.load_prescriptions
         except Exception as e:
             logging.exception(f"Error saving prescription: {e}")
             yield rx.toast.error(f"Failed to save prescription: {e}")
 
     @rx.event
-    def delete_prescription(self, prescription_id: int):
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+    async def delete_prescription(self, prescription_id: int):
+        def write(conn) -> Optional[str]:
+            row = conn.execute(
                 "SELECT image_path FROM prescriptions WHERE id = ?", (prescription_id,)
+            ).fetchone()
+            conn.execute("DELETE FROM prescriptions WHERE id = ?", (prescription_id,))
+            return row["image_path"] if row else None
+
+        try:
+            image_name, step = await write_queue.run(
+                versioned_write(write, *PRESCRIPTION_TABLES)
             )
-            result = cursor.fetchone()
-            if result and result["image_path"]:
-                image_path = os.path.join(
-                    self._get_prescriptions_dir(), result["image_path"]
-                )
+            if image_name:
+                image_path = os.path.join(self._get_prescriptions_dir(), image_name)
                 if os.path.exists(image_path):
                     os.remove(image_path)
-            cursor.execute("DELETE FROM prescriptions WHERE id = ?", (prescription_id,))
-            conn.commit()
-            conn.close()
             yield rx.toast.info("Prescription deleted.")
-            return PrescriptionState.load_prescriptions
+            if not self._patch_prescriptions(step, removed_id=prescription_id):
+                yield PrescriptionState.load_prescriptions
         except Exception as e:
             logging.exception(f"Error deleting prescription: {e}")
-            yield rx.toast.error(f"Failed to delete prescription: {e}")
\ No newline at end of file
+            yield rx.toast.error(f"Failed to delete prescription: {e}")
@@ -2,7 +2,11 @@ import reflex as rx
 from typing import TypedDict, Optional
 import datetime
 import logging
-from .db_state import get_db_connection
+from .db_state import db_read, publish_stock_levels
+from .medicine_search import index_medicine_name
+from .write_queue import write_queue
+from .stock_ledger import record_receipt_movements
+from .catalog import catalog_items, catalog_item, catalog_version
 
 
 class Supplier(TypedDict):
@@ -10,27 +14,133 @@ class Supplier(TypedDict):
     name: str
 
 
-class MedicineBasic(TypedDict):
+class ProductBasic(TypedDict):
     id: int
     name: str
     unit: Optional[str]
 
 
+class BatchOption(TypedDict):
+    batch_no: str
+    expiry_date: str
+    quantity: int
+
+
+class ReceiptLine(TypedDict):
+    key: str
+    product_id: int
+    name: str
+    unit: Optional[str]
+    batch_no: str
+    expiry_date: str
+    quantity: int
+
+
+def _product_batches(conn, product_id: int) -> list[BatchOption]:
+    rows = conn.execute(
+        "SELECT batch_no, expiry_date, quantity FROM medicines "
+        "WHERE product_id = ? ORDER BY expiry_date DESC",
+        (product_id,),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _receiving_batch(
+    conn, supplier_id: int, product_id: int, batch_no: str, expiry_date: str
+) -> tuple[int, bool]:
+    rows = conn.execute(
+        "SELECT id, batch_no, expiry_date FROM medicines WHERE product_id = ? "
+        "ORDER BY id DESC",
+        (product_id,),
+    ).fetchall()
+    if not rows:
+        raise ValueError("Some medicines on the receipt no longer exist.")
+    for row in rows:
+        if row["batch_no"] == batch_no:
+            if row["expiry_date"] != expiry_date:
+                raise ValueError(
+                    f"Batch {batch_no} is on file with expiry {row['expiry_date']}."
+                )
+            return row["id"], False
+    medicine_id = conn.execute(
+        """
+        INSERT INTO medicines (name, batch_no, expiry_date, quantity, purchase_price,
+            sale_price, supplier_id, unit, drug_type, product_id)
+        SELECT name, ?, ?, 0, purchase_price, sale_price, ?, unit, drug_type, product_id
+        FROM medicines WHERE id = ?
+        """,
+        (batch_no, expiry_date, supplier_id, rows[0]["id"]),
+    ).lastrowid
+    return medicine_id, True
+
+
+def _record_receipt(
+    conn,
+    supplier_id: int,
+    purchase_date: str,
+    lines: list[tuple[int, str, str, int]],
+) -> tuple[int, list[int], dict[int, str]]:
+    medicine_ids, created = [], {}
+    for product_id, batch_no, expiry_date, _ in lines:
+        medicine_id, is_new = _receiving_batch(
+            conn, supplier_id, product_id, batch_no, expiry_date
+        )
+        medicine_ids.append(medicine_id)
+        if is_new:
+            created[medicine_id] = conn.execute(
+                "SELECT name FROM medicines WHERE id = ?", (medicine_id,)
+            ).fetchone()[0]
+    received = [
+        (medicine_id, line[3]) for medicine_id, line in zip(medicine_ids, lines)
+    ]
+    receipt_id = conn.execute(
+        "INSERT INTO purchase_receipts (supplier_id, purchase_date, line_count) VALUES (?, ?, ?)",
+        (supplier_id, purchase_date, len(lines)),
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO purchases (supplier_id, medicine_id, quantity, purchase_date, receipt_id) VALUES (?, ?, ?, ?, ?)",
+        [
+            (supplier_id, medicine_id, quantity, purchase_date, receipt_id)
+            for medicine_id, quantity in received
+        ],
+    )
+    conn.executemany(
+        "UPDATE medicines SET quantity = quantity + ? WHERE id = ?",
+        [(quantity, medicine_id) for medicine_id, quantity in received],
+    )
+    record_receipt_movements(conn, receipt_id)
+    return receipt_id, medicine_ids, created
+
+
 class PurchaseState(rx.State):
-    suppliers: list[Supplier] = []
-    medicines: list[MedicineBasic] = []
-    form_data: dict = {"purchase_date": datetime.date.today().strftime("%Y-%m-%d")}
+    catalog_version: int = 0
+    form_data: dict = {}
+    supplier_id: str = ""
+    purchase_date: str = datetime.date.today().strftime("%Y-%m-%d")
+    receipt_lines: list[ReceiptLine] = []
+    product_batches: list[BatchOption] = []
     error_message: str = ""
 
+    @rx.var(deps=["catalog_version"], auto_deps=False)
+    def suppliers(self) -> list[Supplier]:
+        return catalog_items("suppliers")
+
+    @rx.var(deps=["catalog_version"], auto_deps=False)
+    def products(self) -> list[ProductBasic]:
+        return catalog_items("products")
+
+    @rx.var
+    def receipt_total_quantity(self) -> int:
+        return sum(line["quantity"] for line in self.receipt_lines)
+
     @rx.var
     def selected_medicine_unit(self) -> str:
-        med_id = self.form_data.get("medicine_id")
+        med_id = self.form_data.get("product_id")
         if med_id:
             try:
-                selected_med_id = int(med_id)
-                for med in self.medicines:
-                    if med["id"] == selected_med_id:
-                        return med.get("unit", "") or ""
+                med = catalog_item("products", int(med_id))
+                if med is not None:
+                    return med.get("unit", "") or ""
             except (ValueError, TypeError) as e:
                 logging.exception(f"Error processing selected medicine unit: {e}")
                 return ""
@@ -38,67 +148,145 @@ class PurchaseState(rx.State):
 
     @rx.event
     def load_dependencies(self):
+        self.catalog_version = catalog_version("suppliers", "products")
+
+    @rx.event
+    def set_supplier_id(self, supplier_id: str):
+        self.supplier_id = supplier_id
+
+    @rx.event
+    def set_purchase_date(self, purchase_date: str):
+        self.purchase_date = purchase_date
+
+    @rx.event
+    async def select_product(self, product_id: str):
+        self.form_data = {"product_id": product_id}
+        self.product_batches = []
+        if not product_id:
+            return
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, name FROM suppliers ORDER BY name")
-            self.suppliers = [
-                {"id": r["id"], "name": r["name"]} for r in cursor.fetchall()
-            ]
-            cursor.execute("SELECT id, name, unit FROM medicines ORDER BY name")
-            self.medicines = [
-                {"id": r["id"], "name": r["name"], "unit": r["unit"]}
-                for r in cursor.fetchall()
-            ]
-            conn.close()
+            self.product_batches = await db_read(_product_batches, int(product_id))
         except Exception as e:
-            logging.exception(f"Failed to load dependencies for purchases: {e}")
+            logging.exception(f"Error loading batches: {e}")
 
     @rx.event
-    def handle_submit(self, form_data: dict):
-        self.form_data = form_data
+    def add_line(self, form_data: dict):
         self.error_message = ""
-        supplier_id = self.form_data.get("supplier_id")
-        medicine_id = self.form_data.get("medicine_id")
-        quantity_str = self.form_data.get("quantity")
-        purchase_date = self.form_data.get("purchase_date")
-        required_fields = {
-            "supplier_id": "Supplier",
-            "medicine_id": "Medicine",
-            "quantity": "Quantity",
-            "purchase_date": "Purchase Date",
-        }
-        for field_key, field_name in required_fields.items():
-            if not self.form_data.get(field_key):
-                self.error_message = f"{field_name} is required."
-                return
+        product_id = form_data.get("product_id")
+        batch_no = (form_data.get("batch_no") or "").strip()
+        quantity_str = form_data.get("quantity")
+        if not product_id:
+            self.error_message = "Medicine is required."
+            return
+        if not batch_no:
+            self.error_message = "Batch number is required."
+            return
+        try:
+            expiry_date = datetime.date.fromisoformat(
+                form_data.get("expiry_date") or ""
+            ).isoformat()
+        except ValueError as e:
+            logging.exception(e)
+            self.error_message = "Expiry date must be a valid date."
+            return
+        if not quantity_str:
+            self.error_message = "Quantity is required."
+            return
         try:
             quantity = int(quantity_str)
             if quantity <= 0:
                 self.error_message = "Quantity must be a positive number."
                 return
+            product = catalog_item("products", int(product_id))
         except (ValueError, TypeError) as e:
             logging.exception(e)
             self.error_message = "Quantity must be a valid number."
             return
+        if product is None:
+            self.error_message = "Selected medicine no longer exists."
+            return
+        key = f"{product['id']}:{batch_no}"
+        for line in self.receipt_lines:
+            if line["key"] == key:
+                if line["expiry_date"] != expiry_date:
+                    self.error_message = (
+                        f"Batch {batch_no} is already on this receipt with expiry "
+                        f"{line['expiry_date']}."
+                    )
+                    return
+                line["quantity"] += quantity
+                break
+        else:
+            self.receipt_lines.append(
+                {
+                    "key": key,
+                    "product_id": product["id"],
+                    "name": product["name"],
+                    "unit": product["unit"],
+                    "batch_no": batch_no,
+                    "expiry_date": expiry_date,
+                    "quantity": quantity,
+                }
+            )
+        self.receipt_lines = self.receipt_lines
+        self.form_data = {}
+        self.product_batches = []
+
+    @rx.event
+    def remove_line(self, key: str):
+        self.receipt_lines = [line for line in self.receipt_lines if line["key"] != key]
+
+    @rx.event
+    def clear_receipt(self):
+        self.receipt_lines = []
+        self.form_data = {}
+        self.product_batches = []
+        self.error_message = ""
+
+    @rx.event
+    async def save_receipt(self):
+        self.error_message = ""
+        if not self.supplier_id:
+            self.error_message = "Supplier is required."
+            return
+        if not self.receipt_lines:
+            self.error_message = "Add at least one medicine to the receipt."
+            return
+        try:
+            purchase_date = datetime.date.fromisoformat(self.purchase_date).isoformat()
+        except ValueError as e:
+            logging.exception(e)
+            self.error_message = "Purchase date must be a valid date."
+            return
+        supplier = catalog_item("suppliers", int(self.supplier_id))
+        if supplier is None:
+            self.error_message = "Selected supplier no longer exists."
+            return
+        missing = [
+            line["name"]
+            for line in self.receipt_lines
+            if catalog_item("products", line["product_id"]) is None
+        ]
+        if missing:
+            self.error_message = f"No longer in the catalog: {', '.join(missing)}."
+            return
+        lines = [
+            (line["product_id"], line["batch_no"], line["expiry_date"], line["quantity"])
+            for line in self.receipt_lines
+        ]
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO purchases (supplier_id, medicine_id, quantity, purchase_date) VALUES (?, ?, ?, ?)",
-                (int(supplier_id), int(medicine_id), quantity, purchase_date),
+            receipt_id, medicine_ids, created = await write_queue.run(
+                _record_receipt, supplier["id"], purchase_date, lines
             )
-            cursor.execute(
-                "UPDATE medicines SET quantity = quantity + ? WHERE id = ?",
-                (quantity, int(medicine_id)),
+            for medicine_id, name in created.items():
+                index_medicine_name(medicine_id, name)
+            await publish_stock_levels(medicine_ids)
+            yield rx.toast.success(
+                f"Receipt #{receipt_id} recorded: {len(lines)} lines added to stock."
             )
-            conn.commit()
-            conn.close()
-            yield rx.toast.success("Purchase recorded and stock updated!")
-            self.form_data = {
-                "purchase_date": datetime.date.today().strftime("%Y-%m-%d")
-            }
+            self.receipt_lines = []
+            self.form_data = {}
         except Exception as e:
-            logging.exception(f"Error recording purchase: {e}")
+            logging.exception(f"Error recording purchase receipt: {e}")
             self.error_message = f"Database error: {e}"
-            yield rx.toast.error("Failed to record purchase.")
\ No newline at end of file
+            yield rx.toast.error("Failed to record purchase receipt.")
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+from .db_state import data_version
+from .report_queries import ReportType, ReportPage, REPORT_QUERIES
+
+REPORT_CACHE_MAX_ENTRIES = 256
+REPORT_CACHE_MAX_ROWS = 200_000
+
+REPORT_TABLES: dict[ReportType, tuple[str, ...]] = {
+    "sales": ("daily_sales",),
+    "stock": ("medicines",),
+    "stock_as_of": ("medicines", "stock_movements"),
+    "expiry": ("medicines",),
+    "low_stock": ("medicines",),
+    "supplier_purchases": ("purchases", "suppliers", "medicines"),
+    "customer_purchases": ("daily_customer_sales", "customers"),
+}
+
+ReportKey = tuple
+
+
+def report_key(
+    report_type: ReportType, start_date: str, end_date: str, *view
+) -> ReportKey:
+    query = REPORT_QUERIES[report_type]
+    uses_end = ":end" in query or ":as_of" in query
+    return (
+        report_type,
+        start_date if ":start" in query else "",
+        end_date if uses_end else "",
+        *view,
+    )
+
+
+def report_stamp(report_type: ReportType) -> tuple[int, ...]:
+    return data_version(*REPORT_TABLES[report_type])
+
+
+class ReportCache:
+    def __init__(
+        self,
+        max_entries: int = REPORT_CACHE_MAX_ENTRIES,
+        max_rows: int = REPORT_CACHE_MAX_ROWS,
+    ):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[ReportKey, tuple[tuple[int, ...], ReportPage]] = (
+            OrderedDict()
+        )
+        self._rows = 0
+
+    def get(self, key: ReportKey, stamp: tuple[int, ...]) -> Optional[ReportPage]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != stamp:
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: ReportKey, stamp: tuple[int, ...], page: ReportPage):
+        if len(page["rows"]) > self.max_rows:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (stamp, page)
+            self._rows += len(page["rows"])
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._discard(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def _discard(self, key: ReportKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._rows -= len(entry[1]["rows"])
+
+
+report_cache = ReportCache()
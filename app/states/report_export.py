@@ -0,0 +1,71 @@
+import csv
+import datetime
+import io
+import secrets
+import threading
+import time
+from typing import Iterator, Optional
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from .db_state import pool
+from .report_queries import ReportType, REPORT_QUERIES
+
+EXPORT_ROUTE = "/api/reports/export"
+EXPORT_TICKET_TTL_SECONDS = 60
+EXPORT_FETCH_ROWS = 500
+
+_tickets_lock = threading.Lock()
+_tickets: dict[str, tuple[ReportType, dict[str, str], float]] = {}
+
+
+def issue_export_ticket(report_type: ReportType, params: dict[str, str]) -> str:
+    ticket = secrets.token_urlsafe(24)
+    now = time.monotonic()
+    with _tickets_lock:
+        for expired in [t for t, (_, _, expires) in _tickets.items() if expires <= now]:
+            del _tickets[expired]
+        _tickets[ticket] = (report_type, params, now + EXPORT_TICKET_TTL_SECONDS)
+    return ticket
+
+
+def _redeem_ticket(ticket: str) -> Optional[tuple[ReportType, dict[str, str]]]:
+    with _tickets_lock:
+        entry = _tickets.pop(ticket, None)
+    if entry is None or entry[2] <= time.monotonic():
+        return None
+    return entry[0], entry[1]
+
+
+def _csv_chunks(report_type: ReportType, params: dict[str, str]) -> Iterator[str]:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    with pool.dedicated() as conn:
+        cursor = conn.execute(REPORT_QUERIES[report_type], params)
+        writer.writerow(column[0] for column in cursor.description)
+        rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+        while rows:
+            writer.writerows(rows)
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+            rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+    if output.tell():
+        yield output.getvalue()
+
+
+async def export_report(request: Request) -> Response:
+    entry = _redeem_ticket(request.path_params["ticket"])
+    if entry is None:
+        return PlainTextResponse("Export link expired.", status_code=404)
+    report_type, params = entry
+    filename = f"{report_type}_report_{datetime.date.today()}.csv"
+    return StreamingResponse(
+        _csv_chunks(report_type, params),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+export_api = Starlette(routes=[Route(f"{EXPORT_ROUTE}/{{ticket}}", export_report)])
@@ -0,0 +1,89 @@
+import asyncio
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from .db_state import pool
+
+REPORT_JOB_WORKERS = 2
+REPORT_PROGRESS_INTERVAL_SECONDS = 0.25
+REPORT_PROGRESS_OPCODES = 10_000
+
+
+class ReportCancelled(Exception):
+    pass
+
+
+class ReportJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.rows_found = 0
+        self.operations = 0
+        self.started = False
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+    def _progress(self, rows: int):
+        self.rows_found = rows
+        if self.cancelled:
+            raise ReportCancelled()
+
+    def _tick(self) -> int:
+        self.operations += REPORT_PROGRESS_OPCODES
+        return 1 if self.cancelled else 0
+
+    def _run(self, fn: Callable[..., Any], args: tuple) -> Any:
+        with pool.dedicated() as conn:
+            with self._lock:
+                if self.cancelled:
+                    raise ReportCancelled()
+                self._conn = conn
+                self.started = True
+            conn.set_progress_handler(self._tick, REPORT_PROGRESS_OPCODES)
+            try:
+                return fn(conn, *args, progress=self._progress)
+            except sqlite3.OperationalError:
+                if self.cancelled:
+                    raise ReportCancelled() from None
+                raise
+            finally:
+                with self._lock:
+                    self._conn = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, self._run, fn, args)
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=REPORT_JOB_WORKERS, thread_name_prefix="report-job"
+)
+_jobs_lock = threading.Lock()
+_jobs: dict[str, ReportJob] = {}
+
+
+def start_report_job() -> ReportJob:
+    job = ReportJob()
+    with _jobs_lock:
+        _jobs[job.id] = job
+    return job
+
+
+def finish_report_job(job_id: str):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+
+def cancel_report_job(job_id: str):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        job.cancel()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Callable, Literal, Optional, TypedDict
+from .write_queue import write_queue
+from .stock_ledger import STOCK_AS_OF_QUERY, ensure_stock_snapshot
+
+ReportType = Literal[
+    "sales",
+    "stock",
+    "stock_as_of",
+    "expiry",
+    "low_stock",
+    "supplier_purchases",
+    "customer_purchases",
+]
+
+REPORT_QUERIES: dict[ReportType, str] = {
+    "sales": """
+        SELECT sale_day as date, bill_count as bills, item_count as items, total_amount as total
+        FROM daily_sales
+        WHERE sale_day BETWEEN :start AND :end AND bill_count > 0
+        ORDER BY sale_day DESC
+    """,
+    "stock": "SELECT name, batch_no, quantity, purchase_price, sale_price FROM medicines ORDER BY name",
+    "stock_as_of": STOCK_AS_OF_QUERY,
+    "expiry": "SELECT name, batch_no, expiry_date, quantity FROM medicines WHERE expiry_date BETWEEN :start AND :end ORDER BY expiry_date ASC",
+    "low_stock": "SELECT name, batch_no, quantity FROM medicines WHERE quantity < 10 ORDER BY quantity ASC",
+    "supplier_purchases": """
+        SELECT s.name as supplier_name, m.name as medicine_name, p.quantity, p.purchase_date 
+        FROM purchases p
+        JOIN suppliers s ON p.supplier_id = s.id
+        JOIN medicines m ON p.medicine_id = m.id
+        WHERE p.purchase_date BETWEEN :start AND :end
+        ORDER BY s.name, p.purchase_date DESC
+    """,
+    "customer_purchases": """
+        SELECT c.name as customer_name, d.sale_day as date, d.bill_count as bills, d.total_amount
+        FROM daily_customer_sales d
+        JOIN customers c ON d.customer_id = c.id
+        WHERE d.sale_day BETWEEN :start AND :end AND d.bill_count > 0
+        ORDER BY c.name, date DESC
+    """,
+}
+
+
+def report_params(start_date: str, end_date: str) -> dict[str, str]:
+    return {"start": start_date, "end": end_date, "as_of": end_date}
+
+
+STOCK_SNAPSHOT_CHECK_SECONDS = 60 * 60
+
+
+async def keep_stock_snapshots_current():
+    while True:
+        try:
+            await write_queue.run(ensure_stock_snapshot)
+        except Exception as e:
+            logging.exception(f"Stock snapshot catch-up failed: {e}")
+        await asyncio.sleep(STOCK_SNAPSHOT_CHECK_SECONDS)
+
+
+REPORT_PAGE_SIZE = 100
+
+
+class ReportPage(TypedDict):
+    columns: list[str]
+    rows: list[dict[str, Any]]
+    total: int
+
+
+def report_columns(
+    conn: sqlite3.Connection, report_type: ReportType, params: dict[str, str]
+) -> list[str]:
+    cursor = conn.execute(
+        f"SELECT * FROM ({REPORT_QUERIES[report_type]}) LIMIT 0", params
+    )
+    return [column[0] for column in cursor.description]
+
+
+def query_report_page(
+    conn: sqlite3.Connection,
+    report_type: ReportType,
+    params: dict[str, str],
+    sort_column: str,
+    descending: bool,
+    offset: int,
+    limit: int = REPORT_PAGE_SIZE,
+    progress: Optional[Callable[[int], None]] = None,
+) -> ReportPage:
+    query = REPORT_QUERIES[report_type]
+    columns = report_columns(conn, report_type, params)
+    order = ""
+    if sort_column in columns:
+        direction = "DESC" if descending else "ASC"
+        order = f' ORDER BY "{sort_column}" {direction}'
+    total = conn.execute(f"SELECT COUNT(*) FROM ({query})", params).fetchone()[0]
+    if progress is not None:
+        progress(total)
+    rows = conn.execute(
+        f"SELECT * FROM ({query}){order} LIMIT :limit OFFSET :offset",
+        {**params, "limit": limit, "offset": offset},
+    ).fetchall()
+    return {"columns": columns, "rows": [dict(row) for row in rows], "total": total}
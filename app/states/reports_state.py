@@ -1,14 +1,26 @@
 import reflex as rx
-from typing import TypedDict, Literal
+import asyncio
+from typing import TypedDict
 import datetime
 import logging
-from .db_state import get_db_connection
-import csv
-import io
-
-ReportType = Literal[
-    "sales", "stock", "expiry", "low_stock", "supplier_purchases", "customer_purchases"
-]
+from .auth_state import AuthState
+from .report_queries import (
+    ReportType,
+    ReportPage,
+    REPORT_PAGE_SIZE,
+    query_report_page,
+    report_params,
+)
+from .report_jobs import (
+    ReportCancelled,
+    REPORT_PROGRESS_INTERVAL_SECONDS,
+    start_report_job,
+    finish_report_job,
+    cancel_report_job,
+)
+from .report_cache import report_cache, report_key, report_stamp
+from .report_export import EXPORT_ROUTE, issue_export_ticket
+from reflex.config import get_config
 
 
 class ReportRow(TypedDict):
@@ -18,84 +30,151 @@ class ReportRow(TypedDict):
 class ReportsState(rx.State):
     active_report: ReportType = "sales"
     report_data: list[ReportRow] = []
+    report_columns: list[str] = []
+    total_rows: int = 0
+    page_offset: int = 0
+    sort_column: str = ""
+    sort_descending: bool = False
     start_date: str = (datetime.date.today() - datetime.timedelta(days=30)).strftime(
         "%Y-%m-%d"
     )
     end_date: str = datetime.date.today().strftime("%Y-%m-%d")
     loading: bool = False
+    job_waiting: bool = False
+    rows_found: int = 0
+    operations_done: int = 0
+    _report_job_id: str = ""
+
+    @rx.var
+    def has_previous_page(self) -> bool:
+        return self.page_offset > 0
+
+    @rx.var
+    def has_next_page(self) -> bool:
+        return self.page_offset + REPORT_PAGE_SIZE < self.total_rows
+
+    @rx.var
+    def page_label(self) -> str:
+        if not self.total_rows:
+            return "0 rows"
+        last = min(self.page_offset + REPORT_PAGE_SIZE, self.total_rows)
+        return f"{self.page_offset + 1}-{last} of {self.total_rows}"
 
     @rx.event
     def set_active_report(self, report_type: ReportType):
         self.active_report = report_type
+        self.sort_column = ""
+        self.sort_descending = False
         return ReportsState.fetch_report_data
 
+    @rx.event
+    def sort_by(self, column: str):
+        if self.sort_column == column:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = column
+            self.sort_descending = False
+        return ReportsState.fetch_report_page(0)
+
+    @rx.event
+    def next_page(self):
+        if self.has_next_page:
+            return ReportsState.fetch_report_page(self.page_offset + REPORT_PAGE_SIZE)
+
+    @rx.event
+    def previous_page(self):
+        if self.has_previous_page:
+            return ReportsState.fetch_report_page(
+                max(self.page_offset - REPORT_PAGE_SIZE, 0)
+            )
+
+    def _show_page(self, page: ReportPage, offset: int):
+        self.report_columns = page["columns"]
+        self.report_data = page["rows"]
+        self.total_rows = page["total"]
+        self.page_offset = offset
+
     @rx.event
     def fetch_report_data(self):
-        self.loading = True
-        self.report_data = []
+        return ReportsState.fetch_report_page(0)
+
+    def _finish_job(self, job_id: str) -> bool:
+        if self._report_job_id != job_id:
+            return False
+        self._report_job_id = ""
+        self.loading = False
+        return True
+
+    @rx.event(background=True)
+    async def fetch_report_page(self, offset: int):
+        async with self:
+            report_type = self.active_report
+            view = (self.sort_column, self.sort_descending, offset)
+            params = report_params(self.start_date, self.end_date)
+            key = report_key(report_type, self.start_date, self.end_date, *view)
+            stamp = report_stamp(report_type)
+            cancel_report_job(self._report_job_id)
+            page = report_cache.get(key, stamp)
+            if page is not None:
+                self._finish_job(self._report_job_id)
+                self._show_page(page, offset)
+                return
+            job = start_report_job()
+            self._report_job_id = job.id
+            self.loading = True
+            self.job_waiting = True
+            self.rows_found = 0
+            self.operations_done = 0
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            if self.active_report == "sales":
-                cursor.execute(
-                    "SELECT strftime('%Y-%m-%d', sale_date) as date, SUM(total_amount) as total FROM sales WHERE date(sale_date) BETWEEN ? AND ? GROUP BY date ORDER BY date DESC",
-                    (self.start_date, self.end_date),
-                )
-            elif self.active_report == "stock":
-                cursor.execute(
-                    "SELECT name, batch_no, quantity, purchase_price, sale_price FROM medicines ORDER BY name"
-                )
-            elif self.active_report == "expiry":
-                cursor.execute(
-                    "SELECT name, batch_no, expiry_date, quantity FROM medicines WHERE date(expiry_date) BETWEEN ? AND ? ORDER BY expiry_date ASC",
-                    (self.start_date, self.end_date),
-                )
-            elif self.active_report == "low_stock":
-                cursor.execute(
-                    "SELECT name, batch_no, quantity FROM medicines WHERE quantity < 10 ORDER BY quantity ASC"
-                )
-            elif self.active_report == "supplier_purchases":
-                cursor.execute(
-                    """
-                    SELECT s.name as supplier_name, m.name as medicine_name, p.quantity, p.purchase_date 
-                    FROM purchases p
-                    JOIN suppliers s ON p.supplier_id = s.id
-                    JOIN medicines m ON p.medicine_id = m.id
-                    WHERE date(p.purchase_date) BETWEEN ? AND ?
-                    ORDER BY s.name, p.purchase_date DESC
-                """,
-                    (self.start_date, self.end_date),
-                )
-            elif self.active_report == "customer_purchases":
-                cursor.execute(
-                    """
-                    SELECT c.name as customer_name, strftime('%Y-%m-%d', s.sale_date) as date, s.total_amount
-                    FROM sales s
-                    JOIN customers c ON s.customer_id = c.id
-                    WHERE date(s.sale_date) BETWEEN ? AND ?
-                    ORDER BY c.name, date DESC
-                """,
-                    (self.start_date, self.end_date),
-                )
-            self.report_data = [dict(row) for row in cursor.fetchall()]
-            conn.close()
+            task = asyncio.ensure_future(
+                job.run(query_report_page, report_type, params, *view)
+            )
+            while not task.done():
+                await asyncio.wait({task}, timeout=REPORT_PROGRESS_INTERVAL_SECONDS)
+                async with self:
+                    if self._report_job_id != job.id:
+                        job.cancel()
+                    if job.cancelled:
+                        if not job.started:
+                            task.cancel()
+                        continue
+                    self.job_waiting = not job.started
+                    self.rows_found = job.rows_found
+                    self.operations_done = job.operations
+            if task.cancelled():
+                raise ReportCancelled()
+            page = task.result()
+        except ReportCancelled:
+            async with self:
+                if self._finish_job(job.id):
+                    return rx.toast.info("Report cancelled.")
+            return
         except Exception as e:
             logging.exception(f"Error fetching report: {e}")
-            yield rx.toast.error(f"Failed to fetch report data: {e}")
+            async with self:
+                if self._finish_job(job.id):
+                    self.report_data = []
+                    self.total_rows = 0
+                    return rx.toast.error(f"Failed to fetch report data: {e}")
+            return
         finally:
-            self.loading = False
+            finish_report_job(job.id)
+        report_cache.put(key, stamp, page)
+        async with self:
+            if self._finish_job(job.id):
+                self._show_page(page, offset)
+
+    @rx.event
+    def cancel_report(self):
+        cancel_report_job(self._report_job_id)
 
     @rx.event
-    def download_csv(self):
-        if not self.report_data:
-            return rx.toast.warning("No data to download.")
-        output = io.StringIO()
-        writer = csv.writer(output)
-        headers = self.report_data[0].keys()
-        writer.writerow(headers)
-        for row in self.report_data:
-            writer.writerow(row.values())
-        csv_data = output.getvalue()
-        output.close()
-        filename = f"{self.active_report}_report_{datetime.date.today()}.csv"
-        return rx.download(data=csv_data, filename=filename)
\ No newline at end of file
+    async def download_csv(self):
+        auth = await self.get_state(AuthState)
+        if not auth.is_authenticated:
+            return rx.toast.error("Please log in to export reports.")
+        ticket = issue_export_ticket(
+            self.active_report, report_params(self.start_date, self.end_date)
+        )
+        url = f"{get_config().api_url}{EXPORT_ROUTE}/{ticket}"
+        return rx.call_script(f"window.location.assign({url!r})")
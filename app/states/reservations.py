@@ -0,0 +1,71 @@
+import sqlite3
+import time
+from typing import Iterable, Optional
+from .inventory import product_summaries
+
+RESERVATION_TTL_SECONDS = 15 * 60
+
+
+def reserved_quantities(
+    conn: sqlite3.Connection,
+    product_ids: Iterable[int],
+    exclude_holder: Optional[str] = None,
+) -> dict[int, int]:
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    placeholders = ", ".join("?" for _ in product_ids)
+    rows = conn.execute(
+        f"""
+        SELECT product_id, SUM(quantity) FROM stock_reservations
+        WHERE product_id IN ({placeholders}) AND expires_at > ? AND holder IS NOT ?
+        GROUP BY product_id
+        """,
+        (*product_ids, time.time(), exclude_holder),
+    )
+    return {row[0]: row[1] for row in rows}
+
+
+def hold_stock(
+    conn: sqlite3.Connection, holder: str, product_id: int, quantity: int
+) -> tuple[bool, int]:
+    now = time.time()
+    conn.execute(
+        "DELETE FROM stock_reservations WHERE product_id = ? AND expires_at <= ?",
+        (product_id, now),
+    )
+    row = product_summaries(conn, [product_id]).get(product_id)
+    stock = row["quantity"] if row is not None else 0
+    others = conn.execute(
+        "SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations "
+        "WHERE product_id = ? AND holder != ?",
+        (product_id, holder),
+    ).fetchone()[0]
+    available = max(stock - others, 0)
+    if quantity > available:
+        return False, available
+    conn.execute(
+        """
+        INSERT INTO stock_reservations (product_id, holder, quantity, expires_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(product_id, holder) DO UPDATE
+            SET quantity = excluded.quantity, expires_at = excluded.expires_at
+        """,
+        (product_id, holder, quantity, now + RESERVATION_TTL_SECONDS),
+    )
+    return True, available
+
+
+def release_holds(
+    conn: sqlite3.Connection, holder: str, product_id: Optional[int] = None
+):
+    if product_id is None:
+        conn.execute("DELETE FROM stock_reservations WHERE holder = ?", (holder,))
+    else:
+        conn.execute(
+            "DELETE FROM stock_reservations WHERE holder = ? AND product_id = ?",
+            (holder, product_id),
+        )
+    conn.execute(
+        "DELETE FROM stock_reservations WHERE expires_at <= ?", (time.time(),)
+    )
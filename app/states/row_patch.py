@@ -0,0 +1,47 @@
+import bisect
+from typing import Any, Callable, Optional
+
+
+def remove_row(rows: list[dict], row_id: int) -> tuple[list[dict], bool]:
+    remaining = [row for row in rows if row["id"] != row_id]
+    return remaining, len(remaining) != len(rows)
+
+
+def insert_sorted(
+    rows: list[dict],
+    row: dict,
+    key: Callable[[dict], Any],
+    descending: bool = False,
+) -> list[dict]:
+    if descending:
+        keys = [_Reversed(key(existing)) for existing in rows]
+        position = bisect.bisect_right(keys, _Reversed(key(row)))
+    else:
+        keys = [key(existing) for existing in rows]
+        position = bisect.bisect_right(keys, key(row))
+    return [*rows[:position], row, *rows[position:]]
+
+
+def upsert_sorted(
+    rows: list[dict],
+    row: dict,
+    key: Callable[[dict], Any],
+    descending: bool = False,
+    limit: Optional[int] = None,
+) -> list[dict]:
+    remaining, _ = remove_row(rows, row["id"])
+    patched = insert_sorted(remaining, row, key, descending)
+    return patched[:limit] if limit is not None else patched
+
+
+class _Reversed:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __lt__(self, other: "_Reversed") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Reversed) and other.value == self.value
@@ -0,0 +1,185 @@
+import sqlite3
+import datetime
+from typing import Optional, TypedDict
+from .stock_ledger import record_movements
+from .inventory import BatchAllocation, allocate_fefo, product_summaries
+
+
+class SaleLine(TypedDict):
+    product_id: int
+    medicine_id: Optional[int]
+    quantity: int
+    price_per_unit: float
+
+
+class StockShortage(TypedDict):
+    product_id: int
+    medicine_id: Optional[int]
+    name: str
+    requested: int
+    available: int
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, shortages: list[StockShortage]):
+        self.shortages = shortages
+        super().__init__(
+            ", ".join(
+                f"{s['name']} (requested {s['requested']}, available {s['available']})"
+                for s in shortages
+            )
+        )
+
+
+def _find_shortages(
+    conn: sqlite3.Connection,
+    lines: list[SaleLine],
+    pinned: list[BatchAllocation],
+    fefo: list[BatchAllocation],
+) -> list[StockShortage]:
+    requested: dict[tuple[int, Optional[int]], int] = {}
+    for line in lines:
+        key = (line["product_id"], line["medicine_id"])
+        requested[key] = requested.get(key, 0) + line["quantity"]
+    allocated: dict[tuple[int, Optional[int]], int] = {}
+    for allocation in pinned:
+        key = (allocation["product_id"], allocation["medicine_id"])
+        allocated[key] = allocated.get(key, 0) + allocation["quantity"]
+    for allocation in fefo:
+        key = (allocation["product_id"], None)
+        allocated[key] = allocated.get(key, 0) + allocation["quantity"]
+    short = [key for key, quantity in requested.items() if allocated.get(key, 0) < quantity]
+    if not short:
+        return []
+    summaries = product_summaries(conn, list(dict.fromkeys(key[0] for key in short)))
+    batch_ids = [key[1] for key in short if key[1] is not None]
+    placeholders = ", ".join("?" for _ in batch_ids)
+    batch_nos = dict(
+        conn.execute(
+            f"SELECT id, batch_no FROM medicines WHERE id IN ({placeholders})", batch_ids
+        )
+    )
+    shortages: list[StockShortage] = []
+    for product_id, medicine_id in short:
+        row = summaries.get(product_id)
+        name = row["name"] if row is not None else f"#{product_id}"
+        if medicine_id is not None:
+            name = f"{name} batch {batch_nos.get(medicine_id, f'#{medicine_id}')}"
+        shortages.append(
+            {
+                "product_id": product_id,
+                "medicine_id": medicine_id,
+                "name": name,
+                "requested": requested[(product_id, medicine_id)],
+                "available": allocated.get((product_id, medicine_id), 0),
+            }
+        )
+    return shortages
+
+
+def _allocate_pinned(
+    conn: sqlite3.Connection, lines: list[SaleLine], on_day: str
+) -> list[BatchAllocation]:
+    wanted: dict[int, tuple[int, int]] = {}
+    for line in lines:
+        medicine_id = line["medicine_id"]
+        if medicine_id is None:
+            continue
+        _, quantity = wanted.get(medicine_id, (line["product_id"], 0))
+        wanted[medicine_id] = (line["product_id"], quantity + line["quantity"])
+    if not wanted:
+        return []
+    placeholders = ", ".join("?" for _ in wanted)
+    batches = {
+        row["id"]: row
+        for row in conn.execute(
+            f"SELECT id, product_id, quantity FROM medicines "
+            f"WHERE id IN ({placeholders}) AND expiry_date >= ?",
+            (*wanted, on_day),
+        )
+    }
+    allocations: list[BatchAllocation] = []
+    for medicine_id, (product_id, quantity) in wanted.items():
+        batch = batches.get(medicine_id)
+        if batch is None or batch["product_id"] != product_id:
+            continue
+        take = min(quantity, batch["quantity"])
+        if take > 0:
+            allocations.append(
+                {"product_id": product_id, "medicine_id": medicine_id, "quantity": take}
+            )
+    return allocations
+
+
+def _take_batches(conn: sqlite3.Connection, allocations: list[BatchAllocation]) -> bool:
+    cursor = conn.executemany(
+        "UPDATE medicines SET quantity = quantity - ? WHERE id = ? AND quantity >= ?",
+        [
+            (batch["quantity"], batch["medicine_id"], batch["quantity"])
+            for batch in allocations
+        ],
+    )
+    return cursor.rowcount == len(allocations)
+
+
+def commit_sale(
+    conn: sqlite3.Connection,
+    lines: list[SaleLine],
+    customer_id: Optional[int] = None,
+    doctor_name: str = "",
+) -> tuple[int, list[BatchAllocation]]:
+    today = datetime.date.today().isoformat()
+    pinned = _allocate_pinned(conn, lines, today)
+    taken = _take_batches(conn, pinned)
+    demands: dict[int, int] = {}
+    for line in lines:
+        if line["medicine_id"] is None:
+            demands[line["product_id"]] = (
+                demands.get(line["product_id"], 0) + line["quantity"]
+            )
+    fefo = allocate_fefo(conn, demands, today)
+    allocations = [*pinned, *fefo]
+    shortages = _find_shortages(conn, lines, pinned, fefo)
+    if shortages:
+        raise InsufficientStockError(shortages)
+    if not (taken and _take_batches(conn, fefo)):
+        raise InsufficientStockError(_find_shortages(conn, lines, [], []))
+    batch_prices = {
+        line["medicine_id"]: line["price_per_unit"]
+        for line in lines
+        if line["medicine_id"] is not None
+    }
+    product_prices = {
+        line["product_id"]: line["price_per_unit"]
+        for line in lines
+        if line["medicine_id"] is None
+    }
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO sales (total_amount, customer_id, doctor_name, sale_day) VALUES (?, ?, ?, ?)",
+        (
+            sum(line["quantity"] * line["price_per_unit"] for line in lines),
+            customer_id,
+            doctor_name,
+            today,
+        ),
+    )
+    sale_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO sale_items (sale_id, medicine_id, quantity, price_per_unit) VALUES (?, ?, ?, ?)",
+        [
+            (sale_id, batch["medicine_id"], batch["quantity"], batch_prices[batch["medicine_id"]])
+            for batch in pinned
+        ]
+        + [
+            (sale_id, batch["medicine_id"], batch["quantity"], product_prices[batch["product_id"]])
+            for batch in fefo
+        ],
+    )
+    record_movements(
+        conn,
+        "sale",
+        [(batch["medicine_id"], -batch["quantity"]) for batch in allocations],
+        sale_id,
+    )
+    return sale_id, allocations
@@ -1,20 +1,80 @@
 import reflex as rx
+import asyncio
+import contextlib
 import logging
-import shutil
-from .db_state import DATABASE_URL
+import sqlite3
+from .db_state import db_read
+from .migrations import apply_migrations, rebuild_metrics
+from .medicine_search import reset_name_index
+from .write_queue import write_queue, WriteQueueStats
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+def _rollback_journal_header(data: bytes) -> bytes:
+    if data[:16] != SQLITE_HEADER or data[18:20] != b"\x02\x02":
+        return data
+    return data[:18] + b"\x01\x01" + data[20:]
+
+
+def _backup_bytes(conn: sqlite3.Connection) -> bytes:
+    with contextlib.closing(sqlite3.connect(":memory:")) as copy:
+        conn.backup(copy)
+        return _rollback_journal_header(copy.serialize())
+
+
+def _open_backup(data: bytes) -> sqlite3.Connection:
+    source = sqlite3.connect(":memory:", check_same_thread=False)
+    try:
+        source.deserialize(_rollback_journal_header(data))
+        if source.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise ValueError("The backup file is corrupt.")
+        if not source.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'medicines'"
+        ).fetchone():
+            raise ValueError("The file is not a MediFlow backup.")
+    except BaseException:
+        source.close()
+        raise
+    return source
+
+
+def _restore_from(conn: sqlite3.Connection, source: sqlite3.Connection):
+    replaced = conn.execute("SELECT MAX(version) FROM data_versions").fetchone()[0]
+    source.backup(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    apply_migrations(conn)
+    conn.execute(
+        "UPDATE data_versions SET version = version + ?", ((replaced or 0) + 1,)
+    )
+    conn.commit()
 
 
 class SettingsState(rx.State):
+    write_stats: WriteQueueStats = write_queue.stats()
+
+    @rx.event
+    def load_write_stats(self):
+        self.write_stats = write_queue.stats()
+
     @rx.event
-    def backup_database(self):
+    async def backup_database(self):
         try:
-            with open(DATABASE_URL, "rb") as f:
-                db_data = f.read()
+            db_data = await db_read(_backup_bytes)
             return rx.download(data=db_data, filename="mediflow_backup.db")
         except Exception as e:
             logging.exception(f"Error creating database backup: {e}")
             return rx.toast.error("Failed to create backup.")
 
+    @rx.event
+    async def rebuild_dashboard_metrics(self):
+        try:
+            await write_queue.run(rebuild_metrics)
+            return rx.toast.success("Dashboard counters rebuilt.")
+        except Exception as e:
+            logging.exception(f"Error rebuilding dashboard counters: {e}")
+            return rx.toast.error("Failed to rebuild dashboard counters.")
+
     @rx.event
     async def restore_database(self, files: list[rx.UploadFile]):
         if not files:
@@ -23,8 +83,10 @@ class SettingsState(rx.State):
         file = files[0]
         try:
             upload_data = await file.read()
-            with open(DATABASE_URL, "wb") as f:
-                f.write(upload_data)
+            source = await asyncio.to_thread(_open_backup, upload_data)
+            with contextlib.closing(source):
+                await write_queue.run_exclusive(_restore_from, source)
+            reset_name_index()
             yield rx.toast.success(
                 "Database restored successfully! The app will now reload."
             )
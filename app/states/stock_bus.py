@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import threading
+import uuid
+from typing import Any, Awaitable, Callable, Iterator, Optional
+from reflex.utils.prerequisites import get_app
+
+STOCK_COALESCE_SECONDS = 0.05
+STOCK_WATCH_IDLE_SECONDS = 30.0
+
+StockLevels = dict[int, Optional[int]]
+
+
+class StockSubscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._lock = threading.Lock()
+        self._pending: StockLevels = {}
+
+    def push(self, levels: StockLevels):
+        with self._lock:
+            self._pending.update(levels)
+        self._loop.call_soon_threadsafe(self._event.set)
+
+    async def next(self, timeout: float = STOCK_WATCH_IDLE_SECONDS) -> StockLevels:
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        await asyncio.sleep(STOCK_COALESCE_SECONDS)
+        with self._lock:
+            self._event.clear()
+            levels, self._pending = self._pending, {}
+        return levels
+
+
+class StockBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions: set[StockSubscription] = set()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    @contextlib.contextmanager
+    def subscribe(self) -> Iterator[StockSubscription]:
+        subscription = StockSubscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions.discard(subscription)
+
+    def publish(self, levels: StockLevels):
+        if not levels:
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(levels)
+
+
+stock_bus = StockBus()
+
+
+def client_connected(client_token: str) -> bool:
+    namespace = get_app().app.event_namespace
+    return namespace is not None and client_token in namespace.token_to_sid
+
+
+async def watch_stock_levels(
+    state: Any, on_levels: Callable[[StockLevels], Awaitable[None]]
+):
+    watch_id = uuid.uuid4().hex
+    async with state:
+        state._stock_watch_id = watch_id
+        client_token = state.router.session.client_token
+    with stock_bus.subscribe() as subscription:
+        while client_connected(client_token):
+            levels = await subscription.next()
+            async with state:
+                if state._stock_watch_id != watch_id:
+                    return
+            if levels:
+                await on_levels(levels)
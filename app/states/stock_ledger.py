@@ -0,0 +1,126 @@
+import sqlite3
+import datetime
+from typing import Literal, Optional
+
+MovementKind = Literal["opening", "sale", "purchase", "adjustment", "return"]
+STOCK_SNAPSHOT_INTERVAL_DAYS = 7
+
+STOCK_AS_OF_QUERY = """
+    WITH run AS (
+        SELECT COALESCE(MAX(snapshot_day), '') AS day
+        FROM stock_snapshot_runs WHERE snapshot_day <= :as_of
+    ),
+    levels AS (
+        SELECT s.medicine_id, s.quantity
+        FROM stock_snapshots s, run WHERE s.snapshot_day = run.day
+        UNION ALL
+        SELECT sm.medicine_id, sm.quantity
+        FROM stock_movements sm, run
+        WHERE sm.movement_day > run.day AND sm.movement_day <= :as_of
+    )
+    SELECT m.name, m.batch_no, SUM(l.quantity) AS quantity
+    FROM levels l
+    JOIN medicines m ON m.id = l.medicine_id
+    GROUP BY l.medicine_id
+    HAVING SUM(l.quantity) != 0
+    ORDER BY m.name
+"""
+
+
+def _insert_movements(
+    conn: sqlite3.Connection,
+    kind: MovementKind,
+    rows: list[tuple[int, str, int, Optional[int]]],
+):
+    rows = [row for row in rows if row[2]]
+    conn.executemany(
+        "INSERT INTO stock_movements (medicine_id, movement_day, kind, quantity, reference_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(medicine_id, day, kind, quantity, ref) for medicine_id, day, quantity, ref in rows],
+    )
+    conn.executemany(
+        """
+        INSERT INTO stock_snapshots (snapshot_day, medicine_id, quantity)
+        SELECT snapshot_day, ?, ? FROM stock_snapshot_runs WHERE snapshot_day >= ?
+        ON CONFLICT(snapshot_day, medicine_id) DO UPDATE
+            SET quantity = quantity + excluded.quantity
+        """,
+        [(medicine_id, quantity, day) for medicine_id, day, quantity, _ in rows],
+    )
+
+
+def record_movements(
+    conn: sqlite3.Connection,
+    kind: MovementKind,
+    movements: list[tuple[int, int]],
+    reference_id: Optional[int] = None,
+    movement_day: Optional[str] = None,
+):
+    day = movement_day or datetime.date.today().isoformat()
+    _insert_movements(
+        conn,
+        kind,
+        [(medicine_id, day, quantity, reference_id) for medicine_id, quantity in movements],
+    )
+
+
+def record_receipt_movements(conn: sqlite3.Connection, receipt_id: int):
+    rows = conn.execute(
+        "SELECT medicine_id, purchase_date, quantity, id FROM purchases WHERE receipt_id = ?",
+        (receipt_id,),
+    ).fetchall()
+    _insert_movements(conn, "purchase", [tuple(row) for row in rows])
+
+
+def take_stock_snapshot(conn: sqlite3.Connection, snapshot_day: str):
+    previous = conn.execute(
+        "SELECT COALESCE(MAX(snapshot_day), '') FROM stock_snapshot_runs WHERE snapshot_day < ?",
+        (snapshot_day,),
+    ).fetchone()[0]
+    conn.execute(
+        "DELETE FROM stock_snapshots WHERE snapshot_day = ?", (snapshot_day,)
+    )
+    conn.execute(
+        """
+        INSERT INTO stock_snapshots (snapshot_day, medicine_id, quantity)
+        SELECT ?, medicine_id, SUM(quantity) FROM (
+            SELECT medicine_id, quantity FROM stock_snapshots WHERE snapshot_day = ?
+            UNION ALL
+            SELECT medicine_id, quantity FROM stock_movements
+            WHERE movement_day > ? AND movement_day <= ?
+        )
+        GROUP BY medicine_id
+        HAVING SUM(quantity) != 0
+        """,
+        (snapshot_day, previous, previous, snapshot_day),
+    )
+    conn.execute(
+        """
+        INSERT INTO stock_snapshot_runs (snapshot_day, last_movement_id)
+        VALUES (?, (SELECT MAX(id) FROM stock_movements WHERE movement_day <= ?))
+        ON CONFLICT(snapshot_day) DO UPDATE SET last_movement_id = excluded.last_movement_id,
+            created_at = CURRENT_TIMESTAMP
+        """,
+        (snapshot_day, snapshot_day),
+    )
+
+
+def ensure_stock_snapshot(conn: sqlite3.Connection) -> bool:
+    closed_day = datetime.date.today() - datetime.timedelta(days=1)
+    latest = conn.execute(
+        "SELECT MAX(snapshot_day) FROM stock_snapshot_runs"
+    ).fetchone()[0]
+    interval = datetime.timedelta(days=STOCK_SNAPSHOT_INTERVAL_DAYS)
+    if latest is not None:
+        day = datetime.date.fromisoformat(latest) + interval
+    else:
+        first = conn.execute("SELECT MIN(movement_day) FROM stock_movements").fetchone()[0]
+        if first is None:
+            return False
+        day = datetime.date.fromisoformat(first)
+    taken = False
+    while day <= closed_day:
+        take_stock_snapshot(conn, day.isoformat())
+        day += interval
+        taken = True
+    return taken
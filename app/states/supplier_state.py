@@ -1,6 +1,14 @@
 import reflex as rx
 from typing import TypedDict, Optional
-from .db_state import get_db_connection
+from .db_state import (
+    get_db_connection,
+    data_version,
+    is_next_version,
+    versioned_write,
+    VersionStep,
+)
+from .write_queue import write_queue
+from .row_patch import remove_row, upsert_sorted
 import logging
 
 
@@ -11,8 +19,22 @@ class Supplier(TypedDict):
     address: Optional[str]
 
 
+def _supplier_from_row(row) -> Supplier:
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "contact_no": row["contact_no"],
+        "address": row["address"],
+    }
+
+
+def _supplier_name(supplier: Supplier) -> str:
+    return supplier["name"]
+
+
 class SupplierState(rx.State):
     suppliers: list[Supplier] = []
+    _loaded_version: tuple = ()
     search_query: str = ""
     show_form: bool = False
     is_editing: bool = False
@@ -28,19 +50,23 @@ class SupplierState(rx.State):
 
     @rx.event
     def load_suppliers(self):
+        self._loaded_version = data_version("suppliers")
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM suppliers ORDER BY name")
-        self.suppliers = [
-            {
-                "id": row["id"],
-                "name": row["name"],
-                "contact_no": row["contact_no"],
-                "address": row["address"],
-            }
-            for row in cursor.fetchall()
-        ]
-        conn.close()
+        self.suppliers = [_supplier_from_row(row) for row in cursor.fetchall()]
+
+    def _patch_suppliers(
+        self, step: VersionStep, supplier=None, removed_id=None
+    ) -> bool:
+        if not is_next_version(self._loaded_version, step):
+            return False
+        if supplier is not None:
+            self.suppliers = upsert_sorted(self.suppliers, supplier, _supplier_name)
+        if removed_id is not None:
+            self.suppliers, _ = remove_row(self.suppliers, removed_id)
+        self._loaded_version = step[1]
+        return True
 
     @rx.event
     def toggle_form(self):
@@ -75,48 +101,55 @@ class SupplierState(rx.State):
         self.form_data[field] = value
 
     @rx.event
-    def save_supplier(self, form_data: dict):
+    async def save_supplier(self, form_data: dict):
         self.form_data = form_data
         data = self.form_data
         if not data.get("name"):
-            return rx.toast.error("Supplier name is required.")
-        try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            if self.is_editing:
-                cursor.execute(
+            yield rx.toast.error("Supplier name is required.")
+            return
+        is_editing, edit_id = self.is_editing, self.edit_id
+
+        def write(conn) -> Supplier:
+            supplier_id = edit_id
+            if is_editing:
+                conn.execute(
                     "UPDATE suppliers SET name=?, contact_no=?, address=? WHERE id=?",
-                    (
-                        data["name"],
-                        data.get("contact_no"),
-                        data.get("address"),
-                        self.edit_id,
-                    ),
+                    (data["name"], data.get("contact_no"), data.get("address"), edit_id),
                 )
-                yield rx.toast.success("Supplier updated successfully!")
             else:
-                cursor.execute(
+                supplier_id = conn.execute(
                     "INSERT INTO suppliers (name, contact_no, address) VALUES (?, ?, ?)",
                     (data["name"], data.get("contact_no"), data.get("address")),
-                )
+                ).lastrowid
+            return _supplier_from_row(
+                conn.execute(
+                    "SELECT * FROM suppliers WHERE id = ?", (supplier_id,)
+                ).fetchone()
+            )
+
+        try:
+            supplier, step = await write_queue.run(versioned_write(write, "suppliers"))
+            if self.is_editing:
+                yield rx.toast.success("Supplier updated successfully!")
+            else:
                 yield rx.toast.success("Supplier added successfully!")
-            conn.commit()
-            conn.close()
             self.toggle_form()
-            return SupplierState.load_suppliers
+            if not self._patch_suppliers(step, supplier=supplier):
+                yield SupplierState.load_suppliers
         except Exception as e:
             logging.exception(e)
             yield rx.toast.error(f"Failed to save supplier: {e}")
 
     @rx.event
-    def delete_supplier(self, supplier_id: int):
-        try:
-            conn = get_db_connection()
+    async def delete_supplier(self, supplier_id: int):
+        def write(conn):
             conn.execute("DELETE FROM suppliers WHERE id = ?", (supplier_id,))
-            conn.commit()
-            conn.close()
+
+        try:
+            _, step = await write_queue.run(versioned_write(write, "suppliers"))
             yield rx.toast.info("Supplier deleted.")
-            return SupplierState.load_suppliers
+            if not self._patch_suppliers(step, removed_id=supplier_id):
+                yield SupplierState.load_suppliers
         except Exception as e:
             logging.exception(e)
             yield rx.toast.error(f"Failed to delete supplier: {e}")
\ No newline at end of file
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, TypedDict
+from .db_state import pool
+
+GROUP_COMMIT_WINDOW_SECONDS = 0.002
+MAX_GROUP_SIZE = 64
+
+
+class WriteQueueStats(TypedDict):
+    queue_depth: int
+    jobs: int
+    failed_jobs: int
+    commits: int
+    avg_group_size: float
+    last_commit_ms: float
+    avg_commit_ms: float
+    max_commit_ms: float
+
+
+class WriteQueue:
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._thread_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._held: tuple | None = None
+        self._stats_lock = threading.Lock()
+        self._jobs = 0
+        self._failed_jobs = 0
+        self._commits = 0
+        self._last_commit_ms = 0.0
+        self._total_commit_ms = 0.0
+        self._max_commit_ms = 0.0
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="db-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(
+        self, fn: Callable[..., Any], *args: Any, exclusive: bool = False
+    ) -> Future:
+        future: Future = Future()
+        self._queue.put((fn, args, future, exclusive))
+        self._ensure_thread()
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    async def run_exclusive(self, fn: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, exclusive=True))
+
+    def _next_group(self) -> list[tuple]:
+        first = self._held if self._held is not None else self._queue.get()
+        self._held = None
+        group = [first]
+        deadline = time.monotonic() + GROUP_COMMIT_WINDOW_SECONDS
+        while not first[3] and len(group) < MAX_GROUP_SIZE:
+            remaining = deadline - time.monotonic()
+            try:
+                job = (
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if job[3]:
+                self._held = job
+                break
+            group.append(job)
+        return [job for job in group if job[2].set_running_or_notify_cancel()]
+
+    def _run_exclusive(self, fn: Callable[..., Any], args: tuple) -> list[tuple]:
+        conn = pool.connection()
+        try:
+            return [(True, fn(conn, *args))]
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            return [(False, e)]
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if not group:
+                continue
+            started = time.perf_counter()
+            outcomes = []
+            if group[0][3]:
+                fn, args, _, _ = group[0]
+                outcomes = self._run_exclusive(fn, args)
+                self._finish(group, outcomes, started)
+                continue
+            try:
+                conn = pool.connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for fn, args, _, _ in group:
+                        conn.execute("SAVEPOINT job")
+                        try:
+                            outcomes.append((True, fn(conn, *args)))
+                        except Exception as e:
+                            conn.execute("ROLLBACK TO job")
+                            outcomes.append((False, e))
+                        conn.execute("RELEASE job")
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            except Exception as e:
+                logging.exception(f"Group commit failed: {e}")
+                outcomes = [(False, e)] * len(group)
+            self._finish(group, outcomes, started)
+
+    def _finish(self, group: list[tuple], outcomes: list[tuple], started: float):
+        self._record(len(group), outcomes, (time.perf_counter() - started) * 1000)
+        for (fn, _, future, _), (ok, value) in zip(group, outcomes):
+            try:
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            except InvalidStateError:
+                logging.warning(f"Dropped the result of {fn.__name__}: caller is gone")
+
+    def _record(self, size: int, outcomes: list[tuple], elapsed_ms: float):
+        with self._stats_lock:
+            self._jobs += size
+            self._failed_jobs += sum(1 for ok, _ in outcomes if not ok)
+            self._commits += 1
+            self._last_commit_ms = elapsed_ms
+            self._total_commit_ms += elapsed_ms
+            self._max_commit_ms = max(self._max_commit_ms, elapsed_ms)
+
+    def stats(self) -> WriteQueueStats:
+        with self._stats_lock:
+            commits = self._commits
+            return {
+                "queue_depth": self._queue.qsize(),
+                "jobs": self._jobs,
+                "failed_jobs": self._failed_jobs,
+                "commits": commits,
+                "avg_group_size": round(self._jobs / commits, 2) if commits else 0.0,
+                "last_commit_ms": round(self._last_commit_ms, 2),
+                "avg_commit_ms": round(self._total_commit_ms / commits, 2)
+                if commits
+                else 0.0,
+                "max_commit_ms": round(self._max_commit_ms, 2),
+            }
+
+
+write_queue = WriteQueue()
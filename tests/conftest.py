@@ -0,0 +1,14 @@
+import pytest
+from app.states.db_state import pool
+from app.states.migrations import run_migrations
+
+
+@pytest.fixture
+def database(tmp_path):
+    original = pool.database
+    pool.database = str(tmp_path / "medical_store.db")
+    pool.close_all()
+    run_migrations()
+    yield pool.connection()
+    pool.close_all()
+    pool.database = original
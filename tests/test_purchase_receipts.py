@@ -0,0 +1,52 @@
+import pytest
+from app.states.inventory import ensure_product
+from app.states.purchase_state import _record_receipt
+from app.states.write_queue import write_queue
+
+
+def _seed(conn) -> tuple[int, int]:
+    conn.execute("INSERT INTO suppliers (name) VALUES ('Acme Pharma')")
+    product_id = ensure_product(conn, "Amoxicillin 250", "strip", "capsule")
+    medicine_id = conn.execute(
+        """
+        INSERT INTO medicines (name, batch_no, expiry_date, quantity, purchase_price,
+            sale_price, supplier_id, unit, drug_type, product_id)
+        VALUES ('Amoxicillin 250', 'A-1', '2027-01-31', 10, 3.0, 4.5, 1, 'strip',
+            'capsule', ?)
+        """,
+        (product_id,),
+    ).lastrowid
+    conn.commit()
+    return product_id, medicine_id
+
+
+def test_new_lot_gets_its_own_batch(database):
+    product_id, old_batch = _seed(database)
+    _, medicine_ids, created = write_queue.submit(
+        _record_receipt,
+        1,
+        "2026-10-01",
+        [(product_id, "A-1", "2027-01-31", 5), (product_id, "A-2", "2028-06-30", 20)],
+    ).result()
+    assert medicine_ids[0] == old_batch
+    assert list(created) == [medicine_ids[1]]
+    batches = {
+        row["batch_no"]: tuple(row)[1:]
+        for row in database.execute(
+            "SELECT batch_no, expiry_date, quantity, sale_price, product_id "
+            "FROM medicines ORDER BY id"
+        )
+    }
+    assert batches == {
+        "A-1": ("2027-01-31", 15, 4.5, product_id),
+        "A-2": ("2028-06-30", 20, 4.5, product_id),
+    }
+
+
+def test_known_batch_with_other_expiry_is_rejected(database):
+    product_id, _ = _seed(database)
+    with pytest.raises(ValueError, match="on file with expiry 2027-01-31"):
+        write_queue.submit(
+            _record_receipt, 1, "2026-10-01", [(product_id, "A-1", "2029-01-31", 5)]
+        ).result()
+    assert database.execute("SELECT SUM(quantity) FROM medicines").fetchone()[0] == 10
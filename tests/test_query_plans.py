@@ -0,0 +1,157 @@
+import ast
+import datetime
+import pathlib
+import re
+import pytest
+from app.states.inventory import allocate_fefo, product_summaries, ensure_product
+from app.states.medicine_search import find_medicines
+from app.states.medicine_state import SORTABLE_COLUMNS, _query_alerts, _query_page
+from app.states.prescription_state import _query_prescriptions
+from app.states.report_queries import REPORT_QUERIES, query_report_page, report_params
+from app.states.sales import commit_sale
+
+STATES_DIR = pathlib.Path(__file__).resolve().parent.parent / "app" / "states"
+SQL_STATEMENT = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT)\b", re.IGNORECASE)
+TABLE_REFERENCE = re.compile(
+    r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE
+)
+SQL_KEYWORDS = {"where", "on", "join", "left", "inner", "group", "order", "set", "limit"}
+
+
+def _literal_statements() -> list[tuple[str, str]]:
+    statements = []
+    for path in sorted(STATES_DIR.glob("*.py")):
+        if path.name == "migrations.py":
+            continue
+        tree = ast.parse(path.read_text())
+        formatted = {
+            id(part)
+            for node in ast.walk(tree)
+            if isinstance(node, ast.JoinedStr)
+            for part in node.values
+        }
+        statements.extend(
+            (f"{path.name}:{node.lineno}", node.value)
+            for node in ast.walk(tree)
+            if isinstance(node, ast.Constant)
+            and isinstance(node.value, str)
+            and id(node) not in formatted
+            and SQL_STATEMENT.match(node.value)
+        )
+    return statements
+
+
+def _table_scans(conn, sql: str, params=()) -> list[str]:
+    tables = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    aliases = {}
+    for table, alias in TABLE_REFERENCE.findall(sql):
+        if table in tables:
+            aliases[table] = table
+            if alias and alias.lower() not in SQL_KEYWORDS:
+                aliases[alias] = table
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [
+        row[3]
+        for row in plan
+        if row[3].startswith("SCAN ")
+        and "VIRTUAL TABLE INDEX" not in row[3]
+        and aliases.get(row[3].split()[1]) not in (None, "sqlite_master")
+    ]
+
+
+def _is_full_listing(sql: str) -> bool:
+    return re.search(r"\bWHERE\b", sql, re.IGNORECASE) is None
+
+
+def _seed(conn):
+    today = datetime.date.today()
+    conn.execute("INSERT INTO suppliers (name) VALUES ('Acme Pharma')")
+    conn.execute("INSERT INTO customers (name, phone) VALUES ('Asha', '555')")
+    product_id = ensure_product(conn, "Paracetamol 500", "strip", "tablet")
+    for offset, batch in ((30, "P-1"), (90, "P-2")):
+        conn.execute(
+            """
+            INSERT INTO medicines (name, batch_no, expiry_date, quantity, purchase_price,
+                sale_price, supplier_id, unit, drug_type, product_id)
+            VALUES ('Paracetamol 500', ?, ?, 50, 1.0, 2.0, 1, 'strip', 'tablet', ?)
+            """,
+            (batch, (today + datetime.timedelta(days=offset)).isoformat(), product_id),
+        )
+    conn.execute(
+        "INSERT INTO prescriptions (customer_id, doctor_name, prescription_date) "
+        "VALUES (1, 'Dr. Rao', ?)",
+        (today.isoformat(),),
+    )
+    conn.commit()
+    return product_id
+
+
+def _traced_statements(conn, product_id: int) -> list[str]:
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        for column in SORTABLE_COLUMNS:
+            for ascending in (True, False):
+                for search in ("", "para"):
+                    _query_page(conn, column, ascending, search, None, 25)
+                    _query_page(
+                        conn, column, ascending, search, {"value": "P", "id": 1}, 25
+                    )
+        _query_alerts(conn)
+        _query_prescriptions(conn, None)
+        _query_prescriptions(conn, "1")
+        product_summaries(conn, [product_id])
+        allocate_fefo(conn, {product_id: 60})
+        find_medicines(conn, "para", 10, in_stock_only=True)
+        params = report_params("2000-01-01", datetime.date.today().isoformat())
+        for report_type in REPORT_QUERIES:
+            query_report_page(conn, report_type, params, "", False, 0)
+        conn.execute("SAVEPOINT trace")
+        commit_sale(
+            conn,
+            [
+                {
+                    "product_id": product_id,
+                    "medicine_id": None,
+                    "quantity": 60,
+                    "price_per_unit": 2.0,
+                },
+                {
+                    "product_id": product_id,
+                    "medicine_id": 2,
+                    "quantity": 5,
+                    "price_per_unit": 2.5,
+                },
+            ],
+            1,
+            "Dr. Rao",
+        )
+        conn.execute("ROLLBACK TO trace")
+        conn.execute("RELEASE trace")
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in dict.fromkeys(statements) if SQL_STATEMENT.match(sql)]
+
+
+@pytest.mark.parametrize(
+    "location, sql", _literal_statements(), ids=lambda value: value[:40]
+)
+def test_literal_queries_use_indexes(database, location, sql):
+    params = {name: None for name in re.findall(r":(\w+)", sql)} or [None] * sql.count(
+        "?"
+    )
+    scans = _table_scans(database, sql, params)
+    assert not scans or _is_full_listing(sql), f"{location} scans: {scans}"
+
+
+def test_composed_queries_use_indexes(database):
+    product_id = _seed(database)
+    regressions = [
+        (sql, scans)
+        for sql in _traced_statements(database, product_id)
+        if (scans := _table_scans(database, sql)) and not _is_full_listing(sql)
+    ]
+    assert not regressions, "\n".join(f"{scans}: {sql}" for sql, scans in regressions)
@@ -0,0 +1,172 @@
+import datetime
+import random
+import threading
+import pytest
+from app.states.inventory import ensure_product, product_summaries
+from app.states.sales import InsufficientStockError, commit_sale
+from app.states.write_queue import write_queue
+
+CASHIERS = 12
+BILLS_PER_CASHIER = 40
+BATCHES = [(40, 20), (25, 120), (-1, 15)]
+
+
+def _seed(conn) -> tuple[list[int], dict[int, int], set[int]]:
+    today = datetime.date.today()
+    product_ids, opening, expired = [], {}, set()
+    for index in range(4):
+        name = f"Medicine {index}"
+        product_id = ensure_product(conn, name, "strip", None)
+        product_ids.append(product_id)
+        for days, quantity in BATCHES:
+            medicine_id = conn.execute(
+                """
+                INSERT INTO medicines (name, batch_no, expiry_date, quantity,
+                    purchase_price, sale_price, unit, product_id)
+                VALUES (?, ?, ?, ?, 1.0, 2.0, 'strip', ?)
+                """,
+                (
+                    name,
+                    f"B{index}{days}",
+                    (today + datetime.timedelta(days=days)).isoformat(),
+                    quantity,
+                    product_id,
+                ),
+            ).lastrowid
+            opening[medicine_id] = quantity
+            if days < 0:
+                expired.add(medicine_id)
+    conn.commit()
+    return product_ids, opening, expired
+
+
+def _checked_sale(conn, lines):
+    product_ids = [line["product_id"] for line in lines]
+    before = {
+        product_id: row["quantity"]
+        for product_id, row in product_summaries(conn, product_ids).items()
+    }
+    try:
+        _, allocations = commit_sale(conn, lines)
+    except InsufficientStockError as e:
+        e.stock_before = before
+        raise
+    return before, allocations
+
+
+def _cashier(seed: int, product_ids: list[int], outcomes: list):
+    rng = random.Random(seed)
+    for _ in range(BILLS_PER_CASHIER):
+        lines = [
+            {
+                "product_id": product_id,
+                "medicine_id": None,
+                "quantity": rng.randint(1, 8),
+                "price_per_unit": 2.0,
+            }
+            for product_id in rng.sample(product_ids, rng.randint(1, 3))
+        ]
+        try:
+            outcomes.append((lines, write_queue.submit(_checked_sale, lines).result()))
+        except InsufficientStockError as e:
+            outcomes.append((lines, e))
+
+
+def test_concurrent_cashiers_never_oversell(database):
+    product_ids, opening, expired = _seed(database)
+    outcomes: list = []
+    cashiers = [
+        threading.Thread(target=_cashier, args=(seed, product_ids, outcomes))
+        for seed in range(CASHIERS)
+    ]
+    for cashier in cashiers:
+        cashier.start()
+    for cashier in cashiers:
+        cashier.join()
+
+    assert len(outcomes) == CASHIERS * BILLS_PER_CASHIER
+    sold_per_product = dict.fromkeys(product_ids, 0)
+    failures = 0
+    for lines, outcome in outcomes:
+        if isinstance(outcome, InsufficientStockError):
+            failures += 1
+            before = outcome.stock_before
+            short = {
+                line["product_id"]: line["quantity"]
+                for line in lines
+                if line["quantity"] > before[line["product_id"]]
+            }
+            assert {s["product_id"] for s in outcome.shortages} == set(short)
+            for shortage in outcome.shortages:
+                assert shortage["requested"] == short[shortage["product_id"]]
+                assert shortage["available"] == before[shortage["product_id"]]
+            continue
+        before, allocations = outcome
+        for line in lines:
+            assert line["quantity"] <= before[line["product_id"]]
+            taken = sum(
+                a["quantity"] for a in allocations if a["product_id"] == line["product_id"]
+            )
+            assert taken == line["quantity"]
+            sold_per_product[line["product_id"]] += line["quantity"]
+        assert not expired & {a["medicine_id"] for a in allocations}
+    assert failures > 0
+
+    remaining = dict(database.execute("SELECT id, quantity FROM medicines"))
+    sold = dict.fromkeys(opening, 0)
+    sold.update(
+        database.execute(
+            "SELECT medicine_id, SUM(quantity) FROM sale_items GROUP BY medicine_id"
+        )
+    )
+    assert min(remaining.values()) >= 0
+    for medicine_id, quantity in opening.items():
+        assert sold[medicine_id] + remaining[medicine_id] == quantity
+    for medicine_id in expired:
+        assert remaining[medicine_id] == opening[medicine_id]
+    sold_rows = database.execute(
+        """
+        SELECT m.product_id, SUM(si.quantity) FROM sale_items si
+        JOIN medicines m ON m.id = si.medicine_id GROUP BY m.product_id
+        """
+    )
+    assert dict(sold_rows) == {p: q for p, q in sold_per_product.items() if q}
+
+
+def test_pinned_batches_sell_before_fefo(database):
+    product_ids, opening, _ = _seed(database)
+    product_id = product_ids[0]
+    batches = dict(database.execute("SELECT batch_no, id FROM medicines"))
+    pinned, fefo_first = batches["B040"], batches["B025"]
+
+    def line(medicine_id, quantity, price=2.0):
+        return {
+            "product_id": product_id,
+            "medicine_id": medicine_id,
+            "quantity": quantity,
+            "price_per_unit": price,
+        }
+
+    _, allocations = write_queue.submit(
+        commit_sale, [line(pinned, 5, 2.5), line(None, 3)]
+    ).result()
+    assert sorted((a["medicine_id"], a["quantity"]) for a in allocations) == sorted(
+        [(pinned, 5), (fefo_first, 3)]
+    )
+    prices = dict(database.execute("SELECT medicine_id, price_per_unit FROM sale_items"))
+    assert prices == {pinned: 2.5, fefo_first: 2.0}
+
+    for lines, short_batch, requested, available in (
+        ([line(pinned, 16), line(None, 1)], pinned, 16, 15),
+        ([line(pinned, 1), line(None, 200)], None, 200, 131),
+        ([line(batches["B0-1"], 1)], batches["B0-1"], 1, 0),
+        ([line(batches["B140"], 1)], batches["B140"], 1, 0),
+    ):
+        with pytest.raises(InsufficientStockError) as raised:
+            write_queue.submit(commit_sale, lines).result()
+        (shortage,) = raised.value.shortages
+        assert shortage["medicine_id"] == short_batch
+        assert (shortage["requested"], shortage["available"]) == (requested, available)
+    remaining = dict(database.execute("SELECT id, quantity FROM medicines"))
+    assert remaining[pinned] == opening[pinned] - 5
+    assert remaining[fefo_first] == opening[fefo_first] - 3
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from app.states.write_queue import write_queue
+
+
+def _insert_supplier(conn, name):
+    return conn.execute("INSERT INTO suppliers (name) VALUES (?)", (name,)).lastrowid
+
+
+def test_cancelled_caller_does_not_stop_the_writer(database):
+    started, release = threading.Event(), threading.Event()
+
+    def blocker(conn):
+        started.set()
+        return release.wait(5)
+
+    blocked = write_queue.submit(blocker)
+    assert started.wait(5)
+
+    async def callers():
+        cancelled = asyncio.ensure_future(write_queue.run(_insert_supplier, "Gone"))
+        kept = asyncio.ensure_future(write_queue.run(_insert_supplier, "Kept"))
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        await asyncio.wait({cancelled})
+        release.set()
+        return await asyncio.wait_for(kept, timeout=5)
+
+    assert asyncio.run(callers())
+    assert blocked.result(timeout=5)
+    assert write_queue._thread.is_alive()
+    names = [row[0] for row in database.execute("SELECT name FROM suppliers")]
+    assert names == ["Kept"]
+    assert write_queue.submit(_insert_supplier, "After").result(timeout=5)
+
+
+def test_cancel_after_start_still_delivers_later_results(database):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(conn):
+        started.set()
+        release.wait(5)
+        return _insert_supplier(conn, "Slow")
+
+    async def callers():
+        running = asyncio.ensure_future(write_queue.run(slow))
+        await asyncio.to_thread(started.wait, 5)
+        running.cancel()
+        queued = asyncio.ensure_future(write_queue.run(_insert_supplier, "Next"))
+        release.set()
+        return await asyncio.wait_for(queued, timeout=5)
+
+    assert asyncio.run(callers())
+    assert write_queue._thread.is_alive()